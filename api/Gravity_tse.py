@@ -24,28 +24,9 @@ def Store_All_Data_To_DB():
             try:
                 df_sh = Get_ShareHoldersInfo(ticker)
                 if df_sh is not None and not df_sh.empty:
-                    from database.sqlite_db import get_sqlite_session
-                    from database.postgres_db import get_postgres_session
                     from database.models import Shareholder
-                    shareholder_records = []
-                    for idx, row in df_sh.reset_index().iterrows():
-                        record = Shareholder(
-                            ticker=row['Ticker'],
-                            market=row['Market'],
-                            name=row['Name'],
-                            share_no=row['ShareNo'],
-                            share_pct=row['SharePct'],
-                            changes=row['Changes']
-                        )
-                        shareholder_records.append(record)
-                    sqlite_session = get_sqlite_session()
-                    sqlite_session.bulk_save_objects(shareholder_records)
-                    sqlite_session.commit()
-                    sqlite_session.close()
-                    postgres_session = get_postgres_session()
-                    postgres_session.bulk_save_objects(shareholder_records)
-                    postgres_session.commit()
-                    postgres_session.close()
+                    columns = {'Ticker':'ticker', 'Market':'market', 'Name':'name', 'ShareNo':'share_no', 'SharePct':'share_pct', 'Changes':'changes'}
+                    __Store_Records__(Shareholder, df_sh.reset_index()[list(columns)].rename(columns=columns).to_dict('records'))
             except Exception as e:
                 print(f"خطا در ذخیره سهامداران {ticker}: {e}")
 
@@ -75,6 +56,9 @@ import re
 from persiantools import characters
 from IPython.display import clear_output
 
+import logging
+logger = logging.getLogger(__name__)
+
 headers = {'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_10_1) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/39.0.2171.95 Safari/537.36'}
 ################################################################################################################################################################################
 ################################################################################################################################################################################
@@ -1767,205 +1751,210 @@ def Get_ACT50_History(start_date='1395-01-01', end_date='1400-12-29', ignore_dat
 
 ################################################################################################################################################################################
 ################################################################################################################################################################################
+__MarketWatch_RI_URL__ = 'http://old.tsetmc.com/tsev2/data/ClientTypeAll.aspx'
+__MarketWatch_Plus_URL__ = 'http://old.tsetmc.com/tsev2/data/MarketWatchPlus.aspx'
+__MarketWatch_Static_URL__ = 'https://cdn.tsetmc.com/api/StaticData/GetStaticData'
+
 def Get_MarketWatch(save_excel = True, save_path = 'D:/FinPy-TSE Data/MarketWatch'):
     try:
-        #--------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
-        # GET MARKET RETAIL AND INSTITUTIONAL DATA
-        #--------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
-        r = requests.get('http://old.tsetmc.com/tsev2/data/ClientTypeAll.aspx', headers=headers)
-        Mkt_RI_df = pd.DataFrame(r.text.split(';'))
-        Mkt_RI_df = Mkt_RI_df[0].str.split(",",expand=True)
-        # assign names to columns:
-        Mkt_RI_df.columns = ['WEB-ID','No_Buy_R','No_Buy_I','Vol_Buy_R','Vol_Buy_I','No_Sell_R','No_Sell_I','Vol_Sell_R','Vol_Sell_I']
-        # convert columns to numeric type:
-        cols = ['No_Buy_R','No_Buy_I','Vol_Buy_R','Vol_Buy_I','No_Sell_R','No_Sell_I','Vol_Sell_R','Vol_Sell_I']
-        Mkt_RI_df[cols] = Mkt_RI_df[cols].apply(pd.to_numeric, axis=1)
-        Mkt_RI_df['WEB-ID'] = Mkt_RI_df['WEB-ID'].apply(lambda x: x.strip())
-        Mkt_RI_df = Mkt_RI_df.set_index('WEB-ID')
-        # re-arrange the order of columns:
-        Mkt_RI_df = Mkt_RI_df[['No_Buy_R','No_Buy_I','No_Sell_R','No_Sell_I','Vol_Buy_R','Vol_Buy_I','Vol_Sell_R','Vol_Sell_I']]
-        #--------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
-        # GET MARKET WATCH PRICE AND OB DATA
-        #--------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
-        r = requests.get('http://old.tsetmc.com/tsev2/data/MarketWatchPlus.aspx', headers=headers)
-        main_text = r.text
-        Mkt_df = pd.DataFrame((main_text.split('@')[2]).split(';'))
-        Mkt_df = Mkt_df[0].str.split(",",expand=True)
-        Mkt_df = Mkt_df.iloc[:,:23]
-        Mkt_df.columns = ['WEB-ID','Ticker-Code','Ticker','Name','Time','Open','Final','Close','No','Volume','Value',
-                          'Low','High','Y-Final','EPS','Base-Vol','Unknown1','Unknown2','Sector','Day_UL','Day_LL','Share-No','Mkt-ID']
-        # re-arrange columns and drop some columns:
-        Mkt_df = Mkt_df[['WEB-ID','Ticker','Name','Time','Open','Final','Close','No','Volume','Value',
-                          'Low','High','Y-Final','EPS','Base-Vol','Sector','Day_UL','Day_LL','Share-No','Mkt-ID']]
-        # Just keep: 300 Bourse, 303 Fara-Bourse, 305 Sandoogh, 309 Payeh, 400 H-Bourse, 403 H-FaraBourse, 404 H-Payeh
-        Mkt_ID_list = ['300','303','305','309','400','403','404']
-        Mkt_df = Mkt_df[Mkt_df['Mkt-ID'].isin(Mkt_ID_list)]
-        Mkt_df['Market'] = Mkt_df['Mkt-ID'].map({'300':'بورس','303':'فرابورس','305':'صندوق قابل معامله','309':'پایه','400':'حق تقدم بورس','403':'حق تقدم فرابورس','404':'حق تقدم پایه'})
-        Mkt_df.drop(columns=['Mkt-ID'],inplace=True)   # we do not need Mkt-ID column anymore
-        # assign sector names:
-        r = requests.get('https://cdn.tsetmc.com/api/StaticData/GetStaticData', headers=headers)
-        sec_df = pd.DataFrame(r.json()['staticData'])
-        sec_df['code'] = (sec_df['code'].astype(str).apply(lambda x: '0' + x if len(x) == 1 else x))
-        sec_df['name'] = (sec_df['name'].apply(lambda x: re.sub(r'\u200c', '', x)).str.strip().apply(characters.ar_to_fa))
-        sec_df = sec_df[sec_df['type'] == 'IndustrialGroup'][['code', 'name']]
-        Mkt_df['Sector'] = Mkt_df['Sector'].map(dict(sec_df[['code', 'name']].values))
-        # r = requests.get('http://old.tsetmc.com/Loader.aspx?ParTree=111C1213', headers=headers)
-        # sectro_lookup = (pd.read_html(r.text)[0]).iloc[1:,:]
-        # # convert from Arabic to Farsi and remove half-space
-        # sectro_lookup[1] = sectro_lookup[1].apply(lambda x: (str(x).replace('ي','ی')).replace('ك','ک'))
-        # sectro_lookup[1] = sectro_lookup[1].apply(lambda x: x.replace('\u200c',' '))
-        # sectro_lookup[1] = sectro_lookup[1].apply(lambda x: x.strip())
-        # Mkt_df['Sector'] = Mkt_df['Sector'].map(dict(sectro_lookup[[0, 1]].values))
-        # modify format of columns:
-        cols = ['Open','Final','Close','No','Volume','Value','Low','High','Y-Final','EPS','Base-Vol','Day_UL','Day_LL','Share-No']
-        Mkt_df[cols] = Mkt_df[cols].apply(pd.to_numeric, axis=1)
-        Mkt_df['Time'] = Mkt_df['Time'].apply(lambda x: x[:-4]+':'+x[-4:-2]+':'+x[-2:])
-        Mkt_df['Ticker'] = Mkt_df['Ticker'].apply(lambda x: (str(x).replace('ي','ی')).replace('ك','ک'))
-        Mkt_df['Name'] = Mkt_df['Name'].apply(lambda x: (str(x).replace('ي','ی')).replace('ك','ک'))
-        Mkt_df['Name'] = Mkt_df['Name'].apply(lambda x: x.replace('\u200c',' '))
-        #calculate some new columns
-        Mkt_df['Close(%)'] = round((Mkt_df['Close']-Mkt_df['Y-Final'])/Mkt_df['Y-Final']*100,2)
-        Mkt_df['Final(%)'] = round((Mkt_df['Final']-Mkt_df['Y-Final'])/Mkt_df['Y-Final']*100,2)
-        Mkt_df['Market Cap'] = round(Mkt_df['Share-No']*Mkt_df['Final'],2)
-        # set index
-        Mkt_df['WEB-ID'] = Mkt_df['WEB-ID'].apply(lambda x: x.strip())
-        Mkt_df = Mkt_df.set_index('WEB-ID')
-        #------------------------------------------------------------------------------------------------------------------------------------------
-        # reading OB (order book) and cleaning the data
-        OB_df = pd.DataFrame((main_text.split('@')[3]).split(';'))
-        OB_df = OB_df[0].str.split(",",expand=True)
-        OB_df.columns = ['WEB-ID','OB-Depth','Sell-No','Buy-No','Buy-Price','Sell-Price','Buy-Vol','Sell-Vol']
-        OB_df = OB_df[['WEB-ID','OB-Depth','Sell-No','Sell-Vol','Sell-Price','Buy-Price','Buy-Vol','Buy-No']]
-        # extract top row of order book = OB1
-        OB1_df = (OB_df[OB_df['OB-Depth']=='1']).copy()         # just keep top row of OB
-        OB1_df.drop(columns=['OB-Depth'],inplace=True)          # we do not need this column anymore
-        # set WEB-ID as index for future joining operations:
-        OB1_df['WEB-ID'] = OB1_df['WEB-ID'].apply(lambda x: x.strip())
-        OB1_df = OB1_df.set_index('WEB-ID')
-        # convert columns to numeric format:
-        cols = ['Sell-No','Sell-Vol','Sell-Price','Buy-Price','Buy-Vol','Buy-No']
-        OB1_df[cols] = OB1_df[cols].apply(pd.to_numeric, axis=1)
-        # join OB1_df to Mkt_df
-        Mkt_df = Mkt_df.join(OB1_df)
-        # calculate buy/sell queue value
-        bq_value = Mkt_df.apply(lambda x: int(x['Buy-Vol']*x['Buy-Price']) if(x['Buy-Price']==x['Day_UL']) else 0 ,axis = 1)
-        sq_value = Mkt_df.apply(lambda x: int(x['Sell-Vol']*x['Sell-Price']) if(x['Sell-Price']==x['Day_LL']) else 0 ,axis = 1)
-        Mkt_df = pd.concat([Mkt_df,pd.DataFrame(bq_value,columns=['BQ-Value']),pd.DataFrame(sq_value,columns=['SQ-Value'])],axis=1)
-        # calculate buy/sell queue average per-capita:
-        bq_pc_avg = Mkt_df.apply(lambda x: int(round(x['BQ-Value']/x['Buy-No'],0)) if((x['BQ-Value']!=0) and (x['Buy-No']!=0)) else 0 ,axis = 1)
-        sq_pc_avg = Mkt_df.apply(lambda x: int(round(x['SQ-Value']/x['Sell-No'],0)) if((x['SQ-Value']!=0) and (x['Sell-No']!=0)) else 0 ,axis = 1)
-        Mkt_df = pd.concat([Mkt_df,pd.DataFrame(bq_pc_avg,columns=['BQPC']),pd.DataFrame(sq_pc_avg,columns=['SQPC'])],axis=1)
-        # just keep tickers with Value grater than zero! = traded stocks:
-        #Mkt_df = Mkt_df[Mkt_df['Value']!=0]
-        #--------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
-        # JOIN DATA
-        #--------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
-        final_df = Mkt_df.join(Mkt_RI_df)
-        # add trade types:
-        final_df['Trade Type'] = final_df['Ticker'].apply(lambda x: 'تابلو' if((not x[-1].isdigit())or(x in ['انرژی1','انرژی2','انرژی3'])) 
-                                                                       else ('بلوکی' if(x[-1]=='2') else ('عمده' if(x[-1]=='4') else ('جبرانی' if(x[-1]=='3') else 'تابلو'))))
-        # add update Jalali date and time:
-        jdatetime_download = jdatetime.datetime.today().strftime("%Y-%m-%d %H:%M:%S")
-        final_df['Download'] = jdatetime_download
-        # just keep necessary columns and re-arrange theor order:
-        final_df = final_df[['Ticker','Trade Type','Time','Open','High','Low','Close','Final','Close(%)','Final(%)',
-                             'Day_UL', 'Day_LL','Value','BQ-Value', 'SQ-Value', 'BQPC', 'SQPC',
-                             'Volume','Vol_Buy_R', 'Vol_Buy_I', 'Vol_Sell_R', 'Vol_Sell_I','No','No_Buy_R', 'No_Buy_I', 'No_Sell_R', 'No_Sell_I',
-                             'Name','Market','Sector','Share-No','Base-Vol','Market Cap','EPS','Download']]
-        final_df = final_df.set_index('Ticker')
-        # convert columns to int64 data type:
-        """cols = ['Open','High','Low','Close','Final','Day_UL', 'Day_LL','Value', 'BQ-Value', 'SQ-Value', 'BQPC', 'SQPC',
-                'Volume','Vol_Buy_R', 'Vol_Buy_I', 'Vol_Sell_R', 'Vol_Sell_I','No','No_Buy_R', 'No_Buy_I', 'No_Sell_R', 'No_Sell_I',
-                'Share-No','Base-Vol','Market Cap']
-        final_df[cols] = final_df[cols].astype('int64')"""
-        #--------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
-        # DATABASE STORAGE: Store MarketWatch data in SQLite and PostgreSQL
-        try:
-            from database.sqlite_db import get_sqlite_session
-            from database.postgres_db import get_postgres_session
-            from database.models import MarketWatch
-            # Convert DataFrame to list of MarketWatch ORM objects
-            marketwatch_records = []
-            for idx, row in final_df.reset_index().iterrows():
-                record = MarketWatch(
-                    ticker=row['Ticker'],
-                    trade_type=row['Trade Type'],
-                    time=row['Time'],
-                    open=row['Open'],
-                    high=row['High'],
-                    low=row['Low'],
-                    close=row['Close'],
-                    final=row['Final'],
-                    close_pct=row['Close(%)'],
-                    final_pct=row['Final(%)'],
-                    day_ul=row['Day_UL'],
-                    day_ll=row['Day_LL'],
-                    value=row['Value'],
-                    bq_value=row['BQ-Value'],
-                    sq_value=row['SQ-Value'],
-                    bqpc=row['BQPC'],
-                    sqpc=row['SQPC'],
-                    volume=row['Volume'],
-                    vol_buy_r=row['Vol_Buy_R'],
-                    vol_buy_i=row['Vol_Buy_I'],
-                    vol_sell_r=row['Vol_Sell_R'],
-                    vol_sell_i=row['Vol_Sell_I'],
-                    no=row['No'],
-                    no_buy_r=row['No_Buy_R'],
-                    no_buy_i=row['No_Buy_I'],
-                    no_sell_r=row['No_Sell_R'],
-                    no_sell_i=row['No_Sell_I'],
-                    name=row['Name'],
-                    market=row['Market'],
-                    sector=row['Sector'],
-                    share_no=row['Share-No'],
-                    base_vol=row['Base-Vol'],
-                    market_cap=row['Market Cap'],
-                    eps=row['EPS'],
-                    download=row['Download']
-                )
-                marketwatch_records.append(record)
-            # Store in SQLite
-            sqlite_session = get_sqlite_session()
-            sqlite_session.bulk_save_objects(marketwatch_records)
-            sqlite_session.commit()
-            sqlite_session.close()
-            # Store in PostgreSQL
-            postgres_session = get_postgres_session()
-            postgres_session.bulk_save_objects(marketwatch_records)
-            postgres_session.commit()
-            postgres_session.close()
-        except Exception as e:
-            print(f"Database storage error: {e}")
-        #--------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
-        # PROCESS ORDER BOOK DATA IF REQUESTED
-        #--------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
-        final_OB_df = ((Mkt_df[['Ticker','Day_LL','Day_UL']]).join(OB_df.set_index('WEB-ID')))
-        # convert columns to numeric int64
-        cols = ['Day_LL','Day_UL','OB-Depth','Sell-No','Sell-Vol','Sell-Price','Buy-Price','Buy-Vol','Buy-No']
-        final_OB_df[cols] = final_OB_df[cols].astype('int64')
-        # sort using tickers and order book depth:
-        final_OB_df = final_OB_df.sort_values(['Ticker','OB-Depth'], ascending = (True, True))
-        final_OB_df = final_OB_df.set_index(['Ticker','Day_LL','Day_UL','OB-Depth'])
-        # add Jalali date and time:
-        final_OB_df['Download'] =jdatetime_download
-        #--------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
-        # SAVE OPTIONS AND RETURNS
-        #--------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
-        if(save_excel):
-            try:
-                if(save_path[-1] != '/'):
-                    save_path = save_path+'/'
-                mkt_watch_file_name = 'MarketWatch '+jdatetime.datetime.today().strftime("%Y-%m-%d %H-%M-%S")
-                OB_file_name = 'OrderBook '+jdatetime.datetime.today().strftime("%Y-%m-%d %H-%M-%S")
-                final_OB_df.to_excel(save_path+OB_file_name+'.xlsx')
-                final_df.to_excel(save_path+mkt_watch_file_name+'.xlsx')
-            except:
-                print('Save path does not exist, you can handle saving this data by returned dataframe as Excel using ".to_excel()", if you will!')
-        return final_df, final_OB_df
+        ri_text = requests.get(__MarketWatch_RI_URL__, headers=headers).text
+        main_text = requests.get(__MarketWatch_Plus_URL__, headers=headers).text
+        static_data = requests.get(__MarketWatch_Static_URL__, headers=headers).json()
+        return __Build_MarketWatch__(ri_text, main_text, static_data, save_excel, save_path)
     except Exception as e:
         print(f"Error in Get_MarketWatch: {e}")
         return None, None
+
+async def Get_MarketWatch_async(save_excel = True, save_path = 'D:/FinPy-TSE Data/MarketWatch'):
+    # same output as Get_MarketWatch, but the three independent requests are sent concurrently:
+    try:
+        async def get_text(session, url):
+            async with session.get(url, headers=headers) as response:
+                return await response.text()
+        async def get_json(session, url):
+            async with session.get(url, headers=headers) as response:
+                return await response.json(content_type=None)
+        async with aiohttp.ClientSession() as session:
+            ri_text, main_text, static_data = await asyncio.gather(get_text(session, __MarketWatch_RI_URL__),
+                                                                   get_text(session, __MarketWatch_Plus_URL__),
+                                                                   get_json(session, __MarketWatch_Static_URL__))
+        return __Build_MarketWatch__(ri_text, main_text, static_data, save_excel, save_path)
+    except Exception as e:
+        print(f"Error in Get_MarketWatch_async: {e}")
+        return None, None
+
+__MarketWatch_DB_Columns__ = {'Ticker':'ticker', 'Trade Type':'trade_type', 'Time':'time', 'Open':'open', 'High':'high',
+                              'Low':'low', 'Close':'close', 'Final':'final', 'Close(%)':'close_pct', 'Final(%)':'final_pct',
+                              'Day_UL':'day_ul', 'Day_LL':'day_ll', 'Value':'value', 'BQ-Value':'bq_value', 'SQ-Value':'sq_value',
+                              'BQPC':'bqpc', 'SQPC':'sqpc', 'Volume':'volume', 'Vol_Buy_R':'vol_buy_r', 'Vol_Buy_I':'vol_buy_i',
+                              'Vol_Sell_R':'vol_sell_r', 'Vol_Sell_I':'vol_sell_i', 'No':'no', 'No_Buy_R':'no_buy_r', 'No_Buy_I':'no_buy_i',
+                              'No_Sell_R':'no_sell_r', 'No_Sell_I':'no_sell_i', 'Name':'name', 'Market':'market', 'Sector':'sector',
+                              'Share-No':'share_no', 'Base-Vol':'base_vol', 'Market Cap':'market_cap', 'EPS':'eps', 'Download':'download'}
+
+def __Store_Records__(model, records):
+    """
+    ذخیره یک لیست از dict ستون‌ها در SQLite و PostgreSQL با یک درج دسته‌ای برای هر دیتابیس.
+    دو نوشتن اتمیک نیستند: هر دیتابیس تراکنش جداگانه دارد و اگر PostgreSQL شکست بخورد، داده commit‌شده در SQLite باقی می‌ماند.
+    خروجی: dict نام دیتابیس -> موفقیت؛ خطای هر دیتابیس rollback و لاگ می‌شود و دیتابیس بعدی همچنان نوشته می‌شود.
+    """
+    from database.sqlite_db import get_sqlite_session
+    from database.postgres_db import get_postgres_session
+    results = {}
+    for name, get_session in (('sqlite', get_sqlite_session), ('postgresql', get_postgres_session)):
+        session = get_session()
+        try:
+            session.bulk_insert_mappings(model, records)
+            session.commit()
+            results[name] = True
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Error storing {len(records)} {model.__tablename__} records in {name}: {e}")
+            results[name] = False
+        finally:
+            session.close()
+    return results
+
+def __Build_MarketWatch__(ri_text, main_text, static_data, save_excel, save_path):
+    #--------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # GET MARKET RETAIL AND INSTITUTIONAL DATA
+    #--------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+    Mkt_RI_df = pd.DataFrame(ri_text.split(';'))
+    Mkt_RI_df = Mkt_RI_df[0].str.split(",",expand=True)
+    # assign names to columns:
+    Mkt_RI_df.columns = ['WEB-ID','No_Buy_R','No_Buy_I','Vol_Buy_R','Vol_Buy_I','No_Sell_R','No_Sell_I','Vol_Sell_R','Vol_Sell_I']
+    # convert columns to numeric type:
+    cols = ['No_Buy_R','No_Buy_I','Vol_Buy_R','Vol_Buy_I','No_Sell_R','No_Sell_I','Vol_Sell_R','Vol_Sell_I']
+    Mkt_RI_df[cols] = Mkt_RI_df[cols].apply(pd.to_numeric)
+    Mkt_RI_df['WEB-ID'] = Mkt_RI_df['WEB-ID'].apply(lambda x: x.strip())
+    Mkt_RI_df = Mkt_RI_df.set_index('WEB-ID')
+    # re-arrange the order of columns:
+    Mkt_RI_df = Mkt_RI_df[['No_Buy_R','No_Buy_I','No_Sell_R','No_Sell_I','Vol_Buy_R','Vol_Buy_I','Vol_Sell_R','Vol_Sell_I']]
+    #--------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # GET MARKET WATCH PRICE AND OB DATA
+    #--------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+    Mkt_df = pd.DataFrame((main_text.split('@')[2]).split(';'))
+    Mkt_df = Mkt_df[0].str.split(",",expand=True)
+    Mkt_df = Mkt_df.iloc[:,:23]
+    Mkt_df.columns = ['WEB-ID','Ticker-Code','Ticker','Name','Time','Open','Final','Close','No','Volume','Value',
+                      'Low','High','Y-Final','EPS','Base-Vol','Unknown1','Unknown2','Sector','Day_UL','Day_LL','Share-No','Mkt-ID']
+    # re-arrange columns and drop some columns:
+    Mkt_df = Mkt_df[['WEB-ID','Ticker','Name','Time','Open','Final','Close','No','Volume','Value',
+                      'Low','High','Y-Final','EPS','Base-Vol','Sector','Day_UL','Day_LL','Share-No','Mkt-ID']]
+    # Just keep: 300 Bourse, 303 Fara-Bourse, 305 Sandoogh, 309 Payeh, 400 H-Bourse, 403 H-FaraBourse, 404 H-Payeh
+    Mkt_ID_list = ['300','303','305','309','400','403','404']
+    Mkt_df = Mkt_df[Mkt_df['Mkt-ID'].isin(Mkt_ID_list)]
+    Mkt_df['Market'] = Mkt_df['Mkt-ID'].map({'300':'بورس','303':'فرابورس','305':'صندوق قابل معامله','309':'پایه','400':'حق تقدم بورس','403':'حق تقدم فرابورس','404':'حق تقدم پایه'})
+    Mkt_df.drop(columns=['Mkt-ID'],inplace=True)   # we do not need Mkt-ID column anymore
+    # assign sector names:
+    sec_df = pd.DataFrame(static_data['staticData'])
+    sec_df['code'] = (sec_df['code'].astype(str).apply(lambda x: '0' + x if len(x) == 1 else x))
+    sec_df['name'] = (sec_df['name'].apply(lambda x: re.sub(r'\u200c', '', x)).str.strip().apply(characters.ar_to_fa))
+    sec_df = sec_df[sec_df['type'] == 'IndustrialGroup'][['code', 'name']]
+    Mkt_df['Sector'] = Mkt_df['Sector'].map(dict(sec_df[['code', 'name']].values))
+    # r = requests.get('http://old.tsetmc.com/Loader.aspx?ParTree=111C1213', headers=headers)
+    # sectro_lookup = (pd.read_html(r.text)[0]).iloc[1:,:]
+    # # convert from Arabic to Farsi and remove half-space
+    # sectro_lookup[1] = sectro_lookup[1].apply(lambda x: (str(x).replace('ي','ی')).replace('ك','ک'))
+    # sectro_lookup[1] = sectro_lookup[1].apply(lambda x: x.replace('\u200c',' '))
+    # sectro_lookup[1] = sectro_lookup[1].apply(lambda x: x.strip())
+    # Mkt_df['Sector'] = Mkt_df['Sector'].map(dict(sectro_lookup[[0, 1]].values))
+    # modify format of columns:
+    cols = ['Open','Final','Close','No','Volume','Value','Low','High','Y-Final','EPS','Base-Vol','Day_UL','Day_LL','Share-No']
+    Mkt_df[cols] = Mkt_df[cols].apply(pd.to_numeric)
+    Mkt_df['Time'] = Mkt_df['Time'].apply(lambda x: x[:-4]+':'+x[-4:-2]+':'+x[-2:])
+    Mkt_df['Ticker'] = Mkt_df['Ticker'].apply(lambda x: (str(x).replace('ي','ی')).replace('ك','ک'))
+    Mkt_df['Name'] = Mkt_df['Name'].apply(lambda x: (str(x).replace('ي','ی')).replace('ك','ک'))
+    Mkt_df['Name'] = Mkt_df['Name'].apply(lambda x: x.replace('\u200c',' '))
+    #calculate some new columns
+    Mkt_df['Close(%)'] = round((Mkt_df['Close']-Mkt_df['Y-Final'])/Mkt_df['Y-Final']*100,2)
+    Mkt_df['Final(%)'] = round((Mkt_df['Final']-Mkt_df['Y-Final'])/Mkt_df['Y-Final']*100,2)
+    Mkt_df['Market Cap'] = round(Mkt_df['Share-No']*Mkt_df['Final'],2)
+    # set index
+    Mkt_df['WEB-ID'] = Mkt_df['WEB-ID'].apply(lambda x: x.strip())
+    Mkt_df = Mkt_df.set_index('WEB-ID')
+    #------------------------------------------------------------------------------------------------------------------------------------------
+    # reading OB (order book) and cleaning the data
+    OB_df = pd.DataFrame((main_text.split('@')[3]).split(';'))
+    OB_df = OB_df[0].str.split(",",expand=True)
+    OB_df.columns = ['WEB-ID','OB-Depth','Sell-No','Buy-No','Buy-Price','Sell-Price','Buy-Vol','Sell-Vol']
+    OB_df = OB_df[['WEB-ID','OB-Depth','Sell-No','Sell-Vol','Sell-Price','Buy-Price','Buy-Vol','Buy-No']]
+    # extract top row of order book = OB1
+    OB1_df = (OB_df[OB_df['OB-Depth']=='1']).copy()         # just keep top row of OB
+    OB1_df.drop(columns=['OB-Depth'],inplace=True)          # we do not need this column anymore
+    # set WEB-ID as index for future joining operations:
+    OB1_df['WEB-ID'] = OB1_df['WEB-ID'].apply(lambda x: x.strip())
+    OB1_df = OB1_df.set_index('WEB-ID')
+    # convert columns to numeric format:
+    cols = ['Sell-No','Sell-Vol','Sell-Price','Buy-Price','Buy-Vol','Buy-No']
+    OB1_df[cols] = OB1_df[cols].apply(pd.to_numeric)
+    # join OB1_df to Mkt_df
+    Mkt_df = Mkt_df.join(OB1_df)
+    # calculate buy/sell queue value
+    bq_value = Mkt_df.apply(lambda x: int(x['Buy-Vol']*x['Buy-Price']) if(x['Buy-Price']==x['Day_UL']) else 0 ,axis = 1)
+    sq_value = Mkt_df.apply(lambda x: int(x['Sell-Vol']*x['Sell-Price']) if(x['Sell-Price']==x['Day_LL']) else 0 ,axis = 1)
+    Mkt_df = pd.concat([Mkt_df,pd.DataFrame(bq_value,columns=['BQ-Value']),pd.DataFrame(sq_value,columns=['SQ-Value'])],axis=1)
+    # calculate buy/sell queue average per-capita:
+    bq_pc_avg = Mkt_df.apply(lambda x: int(round(x['BQ-Value']/x['Buy-No'],0)) if((x['BQ-Value']!=0) and (x['Buy-No']!=0)) else 0 ,axis = 1)
+    sq_pc_avg = Mkt_df.apply(lambda x: int(round(x['SQ-Value']/x['Sell-No'],0)) if((x['SQ-Value']!=0) and (x['Sell-No']!=0)) else 0 ,axis = 1)
+    Mkt_df = pd.concat([Mkt_df,pd.DataFrame(bq_pc_avg,columns=['BQPC']),pd.DataFrame(sq_pc_avg,columns=['SQPC'])],axis=1)
+    # just keep tickers with Value grater than zero! = traded stocks:
+    #Mkt_df = Mkt_df[Mkt_df['Value']!=0]
+    #--------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # JOIN DATA
+    #--------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+    final_df = Mkt_df.join(Mkt_RI_df)
+    # add trade types:
+    final_df['Trade Type'] = final_df['Ticker'].apply(lambda x: 'تابلو' if((not x[-1].isdigit())or(x in ['انرژی1','انرژی2','انرژی3'])) 
+                                                                   else ('بلوکی' if(x[-1]=='2') else ('عمده' if(x[-1]=='4') else ('جبرانی' if(x[-1]=='3') else 'تابلو'))))
+    # add update Jalali date and time:
+    jdatetime_download = jdatetime.datetime.today().strftime("%Y-%m-%d %H:%M:%S")
+    final_df['Download'] = jdatetime_download
+    # just keep necessary columns and re-arrange theor order:
+    final_df = final_df[['Ticker','Trade Type','Time','Open','High','Low','Close','Final','Close(%)','Final(%)',
+                         'Day_UL', 'Day_LL','Value','BQ-Value', 'SQ-Value', 'BQPC', 'SQPC',
+                         'Volume','Vol_Buy_R', 'Vol_Buy_I', 'Vol_Sell_R', 'Vol_Sell_I','No','No_Buy_R', 'No_Buy_I', 'No_Sell_R', 'No_Sell_I',
+                         'Name','Market','Sector','Share-No','Base-Vol','Market Cap','EPS','Download']]
+    final_df = final_df.set_index('Ticker')
+    # convert columns to int64 data type:
+    """cols = ['Open','High','Low','Close','Final','Day_UL', 'Day_LL','Value', 'BQ-Value', 'SQ-Value', 'BQPC', 'SQPC',
+            'Volume','Vol_Buy_R', 'Vol_Buy_I', 'Vol_Sell_R', 'Vol_Sell_I','No','No_Buy_R', 'No_Buy_I', 'No_Sell_R', 'No_Sell_I',
+            'Share-No','Base-Vol','Market Cap']
+    final_df[cols] = final_df[cols].astype('int64')"""
+    #--------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # DATABASE STORAGE: Store MarketWatch data in SQLite and PostgreSQL
+    try:
+        from database.models import MarketWatch
+        # one column-dict payload for a single bulk INSERT per database (no ORM object per row):
+        __Store_Records__(MarketWatch, final_df.reset_index()[list(__MarketWatch_DB_Columns__)]
+                                       .rename(columns=__MarketWatch_DB_Columns__).to_dict('records'))
+    except Exception as e:
+        print(f"Database storage error: {e}")
+    #--------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # PROCESS ORDER BOOK DATA IF REQUESTED
+    #--------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+    final_OB_df = ((Mkt_df[['Ticker','Day_LL','Day_UL']]).join(OB_df.set_index('WEB-ID')))
+    # convert columns to numeric int64
+    cols = ['Day_LL','Day_UL','OB-Depth','Sell-No','Sell-Vol','Sell-Price','Buy-Price','Buy-Vol','Buy-No']
+    final_OB_df[cols] = final_OB_df[cols].astype('int64')
+    # sort using tickers and order book depth:
+    final_OB_df = final_OB_df.sort_values(['Ticker','OB-Depth'], ascending = (True, True))
+    final_OB_df = final_OB_df.set_index(['Ticker','Day_LL','Day_UL','OB-Depth'])
+    # add Jalali date and time:
+    final_OB_df['Download'] =jdatetime_download
+    #--------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # SAVE OPTIONS AND RETURNS
+    #--------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+    if(save_excel):
+        try:
+            if(save_path[-1] != '/'):
+                save_path = save_path+'/'
+            mkt_watch_file_name = 'MarketWatch '+jdatetime.datetime.today().strftime("%Y-%m-%d %H-%M-%S")
+            OB_file_name = 'OrderBook '+jdatetime.datetime.today().strftime("%Y-%m-%d %H-%M-%S")
+            final_OB_df.to_excel(save_path+OB_file_name+'.xlsx')
+            final_df.to_excel(save_path+mkt_watch_file_name+'.xlsx')
+        except:
+            print('Save path does not exist, you can handle saving this data by returned dataframe as Excel using ".to_excel()", if you will!')
+    return final_df, final_OB_df
 ################################################################################################################################################################################
 ################################################################################################################################################################################
 def __Save_List__(df_data, bourse, farabourse, payeh, detailed_list, save_excel, save_csv, save_path = 'D:/FinPy-TSE Data/'):
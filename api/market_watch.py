@@ -1,49 +1,77 @@
 class MarketWatch:
-    def __init__(self):
-        pass
+    def __init__(self, cache_ttl=1.0):
+        # Parsed responses are reused for cache_ttl seconds (0 disables caching)
+        self.cache_ttl = cache_ttl
+        self._cached_df = None
+        self._cached_at = 0.0
+        # Keep-alive connection pool; requests already negotiates gzip/deflate (and br when brotli is installed)
+        self.session = requests.Session()
+        self.session.headers.update({'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64)'})
+        self.session.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=8))
 
     def make_request(self):
-        headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64)'}
-        return requests.get('http://old.tsetmc.com/tsev2/data/MarketWatchPlus.aspx', headers=headers)
+        return self.session.get('http://old.tsetmc.com/tsev2/data/MarketWatchPlus.aspx', stream=True)
+
+    def _fetch_market_watch(self):
+        now = time.monotonic()
+        if self._cached_df is not None and now - self._cached_at < self.cache_ttl:
+            return self._cached_df
+        response = self.make_request()
+        if response is None:
+            return None
+        # Only the price segment is read (as bytes, without decoding .text); the order-book tail is never downloaded
+        try:
+            body = read_stream_segment(response.iter_content(chunk_size=STREAM_CHUNK_SIZE), 2)
+        finally:
+            response.close()
+        # Columns are built directly by the C tokenizer instead of from a list of split rows; only the
+        # columns used below are materialized and last_price comes back downcast to the smallest int dtype
+        df = _read_scraped_rows(body, MARKET_WATCH_CLASS_COLUMNS, MARKET_WATCH_PRICE_COLUMNS, MARKET_WATCH_CLASS_USED)
+        # Filter out empty rows
+        df = df[df['symbol'].str.strip() != '']
+        self._cached_df, self._cached_at = df, now
+        return df
+
+    @staticmethod
+    def _select_market(df, market):
+        if market is not None and 'Mkt-ID' in df.columns:
+            df = df[df['Mkt-ID'] == str(market)]
+        # Only return symbol and last_price columns if they exist
+        cols_to_return = [col for col in ('symbol','last_price') if col in df.columns]
+        return df[cols_to_return]
 
     def get_market_watch(self, market=None):
         try:
-            response = self.make_request()
-            if response is None:
+            df = self._fetch_market_watch()
+            if df is None:
                 return None
-            main_text = response.text
-            rows = (main_text.split('@')[2]).split(';')
-            # Filter out empty rows
-            valid_rows = [row for row in rows if row.strip()]
-            df = pd.DataFrame([row.split(',') for row in valid_rows])
-            # Adjust columns to match mock/test data
-            expected_cols = ['symbol','Ticker-Code','Name','Sector','Open','High','Low','Final','last_price','No','Volume','Value',
-                            'Y-Final','EPS','Base-Vol','Unknown1','Unknown2','Day_UL','Day_LL','Share-No','Mkt-ID','Extra']
-            df = df.iloc[:,:len(expected_cols)]
-            df.columns = expected_cols[:df.shape[1]]
-            if market is not None and 'Mkt-ID' in df.columns:
-                df = df[df['Mkt-ID'] == str(market)]
-            # Convert numeric columns
-            for col in ['last_price','Open','High','Low','Final','Volume','Value']:
-                if col in df.columns:
-                    df[col] = pd.to_numeric(df[col], errors='coerce')
-            # Only return symbol and last_price columns if they exist
-            cols_to_return = [col for col in ['symbol','last_price'] if col in df.columns]
-            return df[cols_to_return]
+            return self._select_market(df, market)
         except Exception:
             return None
 
-    def get_top_gainers(self, count=1):
-        df = self.get_market_watch()
+    def get_multi(self, markets=(1, 2, None)):
+        # All markets come from the same MarketWatchPlus payload, so one fetch serves every filter
+        try:
+            df = self._fetch_market_watch()
+        except Exception:
+            df = None
+        return {market: None if df is None else self._select_market(df, market) for market in markets}
+
+    def _get_top(self, count, largest):
+        # Select on the cached frame and project only the k chosen rows, instead of copying every row first
+        try:
+            df = self._fetch_market_watch()
+        except Exception:
+            return None
         if df is None or df.empty:
             return None
-        return df.sort_values('last_price', ascending=False).head(count)
+        return self._select_market(_select_top(df, count, largest=largest), None)
+
+    def get_top_gainers(self, count=1):
+        return self._get_top(count, largest=True)
 
     def get_top_losers(self, count=1):
-        df = self.get_market_watch()
-        if df is None or df.empty:
-            return None
-        return df.sort_values('last_price', ascending=True).head(count)
+        return self._get_top(count, largest=False)
 
 """
 Market Watch Scraper for Tehran Stock Exchange
@@ -51,12 +79,41 @@ Based on Gravity_tse.py logic, only uses web scraping (no API dependency)
 """
 
 import requests
+from requests.adapters import HTTPAdapter
+import numpy as np
 import pandas as pd
 import re
 import jdatetime
 import calendar
 import os
+import time
 from config import MARKETWATCH_PATH, DEFAULT_HEADERS, MARKET_ID_LIST
+from api.parsers import _read_scraped_rows, _segment, read_stream_segment
+
+# Adjust columns to match mock/test data
+MARKET_WATCH_CLASS_COLUMNS = ('symbol','Ticker-Code','Name','Sector','Open','High','Low','Final','last_price','No','Volume','Value',
+                              'Y-Final','EPS','Base-Vol','Unknown1','Unknown2','Day_UL','Day_LL','Share-No','Mkt-ID','Extra')
+MARKET_WATCH_PRICE_COLUMNS = ('last_price','Open','High','Low','Final','Volume','Value')
+MARKET_WATCH_CLASS_USED = ('symbol','last_price','Mkt-ID')
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def _select_top(df, count, largest=True):
+    """
+    Return the `count` rows with the largest (or smallest) last_price, ordered by price.
+    np.argpartition selects the k rows in O(n); only those k are then sorted.
+    """
+    if count <= 0:
+        return df.iloc[:0]
+    prices = df['last_price'].to_numpy(dtype=np.float64, na_value=np.nan)
+    if largest:
+        prices = -prices
+    if count < len(prices):
+        idx = np.argpartition(prices, count - 1)[:count]
+    else:
+        idx = np.arange(len(prices))
+    # NaN prices sort last, as with sort_values
+    return df.iloc[idx[np.argsort(prices[idx], kind='stable')]]
 
 def get_market_watch(save_excel=True, save_path='D:/FinPy-TSE Data/MarketWatch'):
     """
@@ -81,7 +138,7 @@ def get_market_watch(save_excel=True, save_path='D:/FinPy-TSE Data/MarketWatch')
         # Get market watch price and order book data
         r = requests.get('http://old.tsetmc.com/tsev2/data/MarketWatchPlus.aspx', headers=headers)
         main_text = r.text
-        Mkt_df = pd.DataFrame((main_text.split('@')[2]).split(';'))
+        Mkt_df = pd.DataFrame(_segment(main_text, 2).split(';'))
         Mkt_df = Mkt_df[0].str.split(",", expand=True)
         Mkt_df = Mkt_df.iloc[:,:23]
         Mkt_df.columns = ['WEB-ID','Ticker-Code','Ticker','Name','Time','Open','Final','Close','No','Volume','Value',
@@ -111,7 +168,7 @@ def get_market_watch(save_excel=True, save_path='D:/FinPy-TSE Data/MarketWatch')
         Mkt_df = Mkt_df.set_index('WEB-ID')
 
         # Order book data
-        OB_df = pd.DataFrame((main_text.split('@')[3]).split(';'))
+        OB_df = pd.DataFrame(_segment(main_text, 3).split(';'))
         OB_df = OB_df[0].str.split(",", expand=True)
         OB_df.columns = ['WEB-ID','OB-Depth','Sell-No','Buy-No','Buy-Price','Sell-Price','Buy-Vol','Sell-Vol']
         OB_df = OB_df[['WEB-ID','OB-Depth','Sell-No','Sell-Vol','Sell-Price','Buy-Price','Buy-Vol','Buy-No']]
@@ -4,59 +4,147 @@ Data Parser module for Tehran Stock Exchange (Scraping Only)
 Handles parsing of various TSE data formats from web scraping.
 """
 
-from typing import List, Dict, Any, Optional
+import csv
+import io
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, Optional, Tuple, Union
 import pandas as pd
 
-def parse_market_watch_scraped(main_text: str) -> pd.DataFrame:
+try:
+    import pyarrow  # noqa: F401
+    # ستون‌های متنی در بافر پیوسته Arrow نگه داشته می‌شوند، نه آرایه اشیای str پایتون
+    STRING_DTYPE = pd.StringDtype('pyarrow')
+except ImportError:  # وابستگی اختیاری
+    STRING_DTYPE = str
+
+MARKET_WATCH_COLUMNS = ('WEB-ID','Ticker-Code','Ticker','Name','Time','Open','Final','Close','No','Volume','Value',
+                        'Low','High','Y-Final','EPS','Base-Vol','Unknown1','Unknown2','Sector','Day_UL','Day_LL','Share-No','Mkt-ID')
+CLIENT_TYPE_COLUMNS = ('WEB-ID','No_Buy_R','No_Buy_I','Vol_Buy_R','Vol_Buy_I','No_Sell_R','No_Sell_I','Vol_Sell_R','Vol_Sell_I')
+ORDER_BOOK_COLUMNS = ('WEB-ID','OB-Depth','Sell-No','Buy-No','Buy-Price','Sell-Price','Buy-Vol','Sell-Vol')
+PRICE_HISTORY_COLUMNS = ('n','Final','Close','No','Volume','Value','Low','High','Y-Final','Open')
+# ستون‌های Unknown1/Unknown2 در هیچ جا استفاده نمی‌شوند و به طور پیش‌فرض خوانده نمی‌شوند
+MARKET_WATCH_USED_COLUMNS = tuple(col for col in MARKET_WATCH_COLUMNS if col not in ('Unknown1', 'Unknown2'))
+MARKET_WATCH_NUMERIC_COLUMNS = ('Open','High','Low','Final','Close','No','Volume','Value','Y-Final','EPS','Base-Vol',
+                                'Day_UL','Day_LL','Share-No')
+
+# اولین نویسه غیرفاصله؛ جستجو همان‌جا متوقف می‌شود و برخلاف strip() کل متن کپی نمی‌شود
+_NON_BLANK_RE = re.compile(r'\S')
+_NON_BLANK_BYTES_RE = re.compile(rb'\S')
+
+# تنظیمات ثابت tokenizer؛ جداکننده تک‌نویسه‌ای و engine='c' یعنی بدون تشخیص خودکار dialect یا مسیر regex
+# index_col=False: سطرهای دارای فیلد اضافه، ستون‌های usecols را جابه‌جا نمی‌کنند
+_READ_CSV_OPTIONS = dict(sep=',', lineterminator=';', header=None, index_col=False, na_filter=False, quoting=csv.QUOTE_NONE,
+                         engine='c', low_memory=False, cache_dates=False, encoding='utf-8')
+
+def _segment(text: Union[str, bytes], index: int) -> Union[str, bytes]:
     """
-    پارس داده‌های MarketWatch اسکرپ شده
+    برگرداندن بخش index-ام متن جداشده با '@' بدون شکستن بخش‌های بعدی
     """
-    Mkt_df = pd.DataFrame((main_text.split('@')[2]).split(';'))
-    if Mkt_df.empty or Mkt_df.iloc[0, 0] == '':
-        # Return empty DataFrame with correct columns
-        return pd.DataFrame(columns=['WEB-ID','Ticker-Code','Ticker','Name','Time','Open','Final','Close','No','Volume','Value',
-                                     'Low','High','Y-Final','EPS','Base-Vol','Unknown1','Unknown2','Sector','Day_UL','Day_LL','Share-No','Mkt-ID'])
-    Mkt_df = Mkt_df[0].str.split(",", expand=True)
-    # ستون‌ها را طبق Gravity_tse.py تنظیم کنید
-    Mkt_df = Mkt_df.iloc[:,:23]
-    Mkt_df.columns = ['WEB-ID','Ticker-Code','Ticker','Name','Time','Open','Final','Close','No','Volume','Value',
-                      'Low','High','Y-Final','EPS','Base-Vol','Unknown1','Unknown2','Sector','Day_UL','Day_LL','Share-No','Mkt-ID']
-    return Mkt_df
+    sep = b'@' if isinstance(text, bytes) else '@'
+    # فقط مرزهای بخش با find پیدا می‌شوند؛ برخلاف split، بخش‌های قبلی و دنباله پاسخ کپی نمی‌شوند
+    start = 0
+    for _ in range(index):
+        start = text.find(sep, start) + 1
+        if start == 0:
+            raise IndexError(f"response has fewer than {index + 1} '@' segments")
+    end = text.find(sep, start)
+    return text[start:] if end < 0 else text[start:end]
 
-def parse_client_type_scraped(text: str) -> pd.DataFrame:
+@lru_cache(maxsize=None)
+def _column_dtypes(columns: Tuple[str, ...], numeric_columns: Tuple[str, ...]) -> Dict[int, type]:
     """
-    پارس داده‌های ClientTypeAll اسکرپ شده
+    نگاشت شماره ستون به نوع رشته‌ای برای ستون‌های غیرعددی؛ برای هر ترکیب ستون‌ها یک بار ساخته می‌شود
     """
-    if not text.strip():
-        return pd.DataFrame(columns=['WEB-ID','No_Buy_R','No_Buy_I','Vol_Buy_R','Vol_Buy_I','No_Sell_R','No_Sell_I','Vol_Sell_R','Vol_Sell_I'])
-    
-    df = pd.DataFrame(text.split(';'))
-    df = df[0].str.split(',', expand=True)
-    df.columns = ['WEB-ID','No_Buy_R','No_Buy_I','Vol_Buy_R','Vol_Buy_I','No_Sell_R','No_Sell_I','Vol_Sell_R','Vol_Sell_I']
-    return df
+    return {i: STRING_DTYPE for i, col in enumerate(columns) if col not in numeric_columns}
 
-def parse_order_book_scraped(text: str) -> pd.DataFrame:
+def _to_numeric_columns(df: pd.DataFrame, numeric_columns: Tuple[str, ...]) -> pd.DataFrame:
     """
-    پارس داده‌های OrderBook اسکرپ شده
+    تبدیل ستون‌ها به عدد؛ مقادیر غیرعددی (که ستون را رشته‌ای نگه داشته‌اند) NaN می‌شوند
     """
-    if not text.strip():
-        return pd.DataFrame(columns=['WEB-ID','OB-Depth','Sell-No','Buy-No','Buy-Price','Sell-Price','Buy-Vol','Sell-Vol'])
-    
-    df = pd.DataFrame(text.split(';'))
-    df = df[0].str.split(',', expand=True)
-    df.columns = ['WEB-ID','OB-Depth','Sell-No','Buy-No','Buy-Price','Sell-Price','Buy-Vol','Sell-Vol']
+    for col in numeric_columns:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce', downcast='integer')
     return df
 
-def parse_price_history_scraped(text: str) -> pd.DataFrame:
+def read_stream_segment(chunks: Iterable[bytes], index: int) -> bytes:
+    """
+    خواندن بخش index-ام یک پاسخ جداشده با '@' از تکه‌های بایتی؛ پس از پایان همان بخش، خواندن متوقف می‌شود
+    """
+    buf = bytearray()
+    seen = 0
+    for chunk in chunks:
+        start = 0
+        while True:
+            pos = chunk.find(b'@', start)
+            if pos < 0:
+                if seen == index:
+                    # برش memoryview بدون ساخت شیء bytes میانی مستقیم به بافر افزوده می‌شود
+                    buf += memoryview(chunk)[start:]
+                break
+            if seen == index:
+                buf += memoryview(chunk)[start:pos]
+                return bytes(buf)
+            seen += 1
+            start = pos + 1
+    if seen < index:
+        raise IndexError(f"response has only {seen + 1} '@' segments")
+    return bytes(buf)
+
+@lru_cache(maxsize=None)
+def _column_positions(columns: Tuple[str, ...], usecols: Optional[Tuple[str, ...]]) -> Tuple[int, ...]:
+    """
+    شماره ستون‌هایی که باید خوانده شوند (همه ستون‌ها اگر usecols داده نشده باشد)
+    """
+    return tuple(i for i, col in enumerate(columns) if usecols is None or col in usecols)
+
+def _read_scraped_rows(text: Union[str, bytes], columns: Tuple[str, ...],
+                       numeric_columns: Tuple[str, ...] = (),
+                       usecols: Optional[Tuple[str, ...]] = None) -> pd.DataFrame:
+    """
+    تبدیل متن «سطر;سطر» با مقادیر جداشده با ',' به DataFrame با tokenizer زبان C در pandas؛
+    فقط ستون‌های usecols ساخته می‌شوند و ستون‌های numeric_columns به کوچک‌ترین نوع صحیح ممکن تبدیل می‌شوند
+    """
+    positions = _column_positions(columns, usecols)
+    names = tuple(columns[i] for i in positions)
+    non_blank = _NON_BLANK_BYTES_RE if isinstance(text, bytes) else _NON_BLANK_RE
+    if non_blank.search(text) is None:
+        return _to_numeric_columns(pd.DataFrame(columns=names), numeric_columns)
+    n = len(columns)
+    # ستون‌های عددی در همان گذر tokenizer به int64/float64 تبدیل می‌شوند و رشته پایتونی برایشان ساخته نمی‌شود
+    dtype = _column_dtypes(columns, numeric_columns)
+    # بایت‌ها (مثلاً response.content) مستقیم به tokenizer داده می‌شوند و رمزگشایی UTF-8 در C انجام می‌شود
+    source = io.BytesIO(text) if isinstance(text, bytes) else io.StringIO(text)
+    # ستون‌های اضافه هر سطر نادیده گرفته می‌شوند و خانه‌های خالی رشته '' باقی می‌مانند
+    df = pd.read_csv(source, names=range(n), usecols=positions, dtype=dtype, **_READ_CSV_OPTIONS)
+    df.columns = names
+    return _to_numeric_columns(df, numeric_columns)
+
+def parse_market_watch_scraped(main_text: Union[str, bytes], numeric: bool = False,
+                               keep_unused: bool = False) -> pd.DataFrame:
+    """
+    پارس داده‌های MarketWatch اسکرپ شده؛ با numeric=True ستون‌های عددی یکجا به کوچک‌ترین نوع عددی تبدیل می‌شوند
+    و با keep_unused=True ستون‌های Unknown1/Unknown2 هم برگردانده می‌شوند
+    """
+    # ستون‌ها را طبق Gravity_tse.py تنظیم کنید
+    numeric_columns = MARKET_WATCH_NUMERIC_COLUMNS if numeric else ()
+    usecols = None if keep_unused else MARKET_WATCH_USED_COLUMNS
+    return _read_scraped_rows(_segment(main_text, 2), MARKET_WATCH_COLUMNS, numeric_columns, usecols)
+
+def parse_client_type_scraped(text: Union[str, bytes], numeric: bool = False) -> pd.DataFrame:
+    """
+    پارس داده‌های ClientTypeAll اسکرپ شده؛ با numeric=True همه ستون‌ها جز WEB-ID عددی می‌شوند
+    """
+    return _read_scraped_rows(text, CLIENT_TYPE_COLUMNS, CLIENT_TYPE_COLUMNS[1:] if numeric else ())
+
+def parse_order_book_scraped(text: Union[str, bytes], numeric: bool = False) -> pd.DataFrame:
+    """
+    پارس داده‌های OrderBook اسکرپ شده؛ با numeric=True همه ستون‌ها جز WEB-ID عددی می‌شوند
+    """
+    return _read_scraped_rows(text, ORDER_BOOK_COLUMNS, ORDER_BOOK_COLUMNS[1:] if numeric else ())
+
+def parse_price_history_scraped(text: Union[str, bytes], numeric: bool = False) -> pd.DataFrame:
     """
-    پارس داده‌های ClosingPriceAll اسکرپ شده
+    پارس داده‌های ClosingPriceAll اسکرپ شده؛ با numeric=True کل جدول عددی است
     """
-    if not text.strip():
-        return pd.DataFrame(columns=['n','Final','Close','No','Volume','Value','Low','High','Y-Final','Open'])
-    
-    df = pd.DataFrame(text.split(';'))
-    df.columns = ['Data']
-    temp_data_df = df['Data'].str.split(',', expand=True)
-    cols = ['n','Final','Close','No','Volume','Value','Low','High','Y-Final','Open']
-    temp_data_df.columns = cols
-    return temp_data_df
+    return _read_scraped_rows(text, PRICE_HISTORY_COLUMNS, PRICE_HISTORY_COLUMNS if numeric else ())
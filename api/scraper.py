@@ -8,6 +8,11 @@ import requests
 import pandas as pd
 import jdatetime
 import calendar
+from api.parsers import _read_scraped_rows, _segment
+
+SCRAPER_MARKET_WATCH_COLUMNS = ('WEB-ID','Ticker-Code','symbol','Name','Sector','Open','High','Low','Final','last_price','No','Volume','Value',
+                                'Y-Final','EPS','Base-Vol','Unknown1','Unknown2','Day_UL','Day_LL','Share-No','Mkt-ID','Extra')
+SCRAPER_PRICE_COLUMNS = ('last_price','Open','High','Low','Final','Volume','Value')
 
 def build_market_stock_list(bourse=True, farabourse=True, payeh=True, detailed_list=True, show_progress=True, save_excel=True, save_csv=True, save_path='D:/FinPy-TSE Data/'):
     """
@@ -44,14 +49,10 @@ def get_market_watch(save_excel=True, save_path='D:/FinPy-TSE Data/MarketWatch')
     headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64)'}
     r = requests.get('http://old.tsetmc.com/tsev2/data/MarketWatchPlus.aspx', headers=headers)
     main_text = r.text
-    rows = (main_text.split('@')[2]).split(';')
-    df = pd.DataFrame([row.split(',') for row in rows if row])
-    expected_cols = ['WEB-ID','Ticker-Code','symbol','Name','Sector','Open','High','Low','Final','last_price','No','Volume','Value',
-                    'Y-Final','EPS','Base-Vol','Unknown1','Unknown2','Day_UL','Day_LL','Share-No','Mkt-ID','Extra']
-    df = df.iloc[:,:len(expected_cols)]
-    df.columns = expected_cols[:df.shape[1]]
+    # ساخت ستونی DataFrame با tokenizer زبان C به جای لیست سطرهای شکسته‌شده
+    df = _read_scraped_rows(_segment(main_text, 2), SCRAPER_MARKET_WATCH_COLUMNS)
     # تبدیل مقادیر عددی
-    for col in ['last_price','Open','High','Low','Final','Volume','Value']:
+    for col in SCRAPER_PRICE_COLUMNS:
         if col in df.columns:
             df[col] = pd.to_numeric(df[col], errors='coerce')
     if save_excel:
@@ -25,7 +25,10 @@ BASE_DIR = Path(__file__).parent
 DATABASE_TYPE = os.getenv("DATABASE_TYPE", "sqlite")  # sqlite یا postgresql
 
 if DATABASE_TYPE == "sqlite":
-    DATABASE_URL = f"sqlite:///{BASE_DIR}/tse_data.db"
+    # DATABASE_URL محیطی فقط اگر آدرس SQLite باشد استفاده می‌شود (مثلاً دیتابیس حافظه‌ای مشترک در تست‌ها)
+    DATABASE_URL = os.getenv("DATABASE_URL", "")
+    if not DATABASE_URL.startswith("sqlite"):
+        DATABASE_URL = f"sqlite:///{BASE_DIR}/tse_data.db"
 elif DATABASE_TYPE == "postgresql":
     DATABASE_URL = os.getenv(
         "DATABASE_URL", 
@@ -55,4 +58,31 @@ POSTGRES_CONFIG = {
     "max_overflow": 20,
     "pool_pre_ping": True,
     "pool_recycle": 3600,
+    # تعداد سطر در هر INSERT چندسطری که SQLAlchemy از executemany می‌سازد
+    "insertmanyvalues_page_size": 1000,
+    # کش دستورهای کامپایل‌شده؛ دستورهای جستجو و درج پس از اولین اجرا دوباره کامپایل نمی‌شوند
+    "query_cache_size": 1200,
+}
+
+# تنظیمات pool برای SQLite (یک اتصال کش‌شده و چند اتصال اضافه)
+SQLITE_CONFIG = {
+    "pool_size": 1,
+    "max_overflow": 4,
+    "pool_pre_ping": False,
+    "connect_args": {"check_same_thread": False},
+}
+
+# PRAGMAهایی که روی هر اتصال جدید SQLite اعمال می‌شوند
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "temp_store": "MEMORY",
+    "mmap_size": 268435456,
+}
+
+# PRAGMAهای حالت بارگذاری انبوه؛ بدون fsync و با ژورنال در حافظه (خرابی برق/سیستم عامل می‌تواند فایل را خراب کند)
+SQLITE_BULK_LOAD_PRAGMAS = {
+    "synchronous": "OFF",
+    "journal_mode": "MEMORY",
+    "temp_store": "MEMORY",
 }
@@ -0,0 +1,102 @@
+from typing import List, Dict, Any
+
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+
+from config import DATABASE_URL
+from .base import _is_memory_url, _set_sqlite_pragmas, _uniform_keys
+from .sqlite_db import SQLiteDatabase, MULTI_VALUES_MAX_ROWS, _chunked
+from .models import (
+    PriceHistory, RIHistory, IndexHistory, SectorIndexHistory,
+    MajorShareholderHistory, IntradayTrade, USDHistory
+)
+import logging
+
+try:
+    import aiosqlite  # noqa: F401
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+except ImportError:  # وابستگی اختیاری
+    aiosqlite = None
+
+logger = logging.getLogger(__name__)
+
+
+def _async_url(url: str) -> str:
+    """تبدیل آدرس sqlite:// به sqlite+aiosqlite://"""
+    return url.replace("sqlite://", "sqlite+aiosqlite://", 1)
+
+
+class AsyncSQLiteDatabase(SQLiteDatabase):
+    """SQLiteDatabase با نسخه async درج‌های تاریخچه روی aiosqlite
+
+    متدهای همگام (افزودن سهام، جستجوها و ...) بدون تغییر از SQLiteDatabase به ارث می‌رسند؛
+    متدهای *_async اجازه می‌دهند درخواست HTTP بعدی هم‌زمان با commit قبلی در asyncio.gather اجرا شود.
+    """
+
+    def __init__(self, *args, **kwargs):
+        if aiosqlite is None:
+            raise ImportError("AsyncSQLiteDatabase requires aiosqlite (pip install aiosqlite)")
+        if _is_memory_url(DATABASE_URL):
+            # موتور async اتصال جداگانه دارد و دیتابیس حافظه‌ای موتور همگام را نمی‌بیند
+            raise ValueError("AsyncSQLiteDatabase requires a file-based SQLite DATABASE_URL")
+        super().__init__(*args, **kwargs)
+        # SQLite فقط یک نویسنده دارد؛ یک اتصال، درج‌های هم‌زمان را به جای خطای قفل، پشت سر هم اجرا می‌کند
+        self.async_engine = create_async_engine(_async_url(DATABASE_URL), pool_size=1, max_overflow=0)
+        event.listen(self.async_engine.sync_engine, "connect", _set_sqlite_pragmas)
+        self.AsyncSessionLocal = async_sessionmaker(self.async_engine, autoflush=False, expire_on_commit=False)
+
+    async def batch_insert_async(self, model_class, data_list: List[Dict[str, Any]]) -> int:
+        """نسخه async درج دسته‌ای با INSERT OR IGNORE؛ تعداد سطرهای درج‌شده را برمی‌گرداند"""
+        if not data_list:
+            return 0
+
+        inserted_count = 0
+        async with self.AsyncSessionLocal() as session:
+            try:
+                conn = await session.connection()
+                stmt = self._insert_stmt(model_class)
+                # VALUES چندسطری ستون‌ها را از سطر اول می‌گیرد؛ سطرهای با کلیدهای متفاوت از مسیر executemany می‌روند
+                if len(data_list) <= MULTI_VALUES_MAX_ROWS and _uniform_keys(data_list):
+                    inserted_count = (await conn.execute(stmt.values(data_list))).rowcount
+                else:
+                    for chunk in _chunked(data_list, self.batch_size):
+                        inserted_count += (await conn.execute(stmt, chunk)).rowcount
+                await session.commit()
+                logger.debug(f"Inserted {inserted_count} records into {model_class.__tablename__}")
+
+            except IntegrityError as e:
+                await session.rollback()
+                inserted_count = 0
+                logger.error(f"Integrity error during async batch insert: {e}")
+            except Exception as e:
+                await session.rollback()
+                inserted_count = 0
+                logger.error(f"Error during async batch insert: {e}")
+
+        return inserted_count
+
+    async def add_price_history_async(self, history_data: List[Dict[str, Any]]) -> int:
+        return await self.batch_insert_async(PriceHistory, history_data)
+
+    async def add_ri_history_async(self, history_data: List[Dict[str, Any]]) -> int:
+        return await self.batch_insert_async(RIHistory, history_data)
+
+    async def add_index_history_async(self, history_data: List[Dict[str, Any]]) -> int:
+        return await self.batch_insert_async(IndexHistory, history_data)
+
+    async def add_sector_index_history_async(self, history_data: List[Dict[str, Any]]) -> int:
+        return await self.batch_insert_async(SectorIndexHistory, history_data)
+
+    async def add_major_shareholder_history_async(self, history_data: List[Dict[str, Any]]) -> int:
+        return await self.batch_insert_async(MajorShareholderHistory, history_data)
+
+    async def add_intraday_trades_async(self, trades_data: List[Dict[str, Any]]) -> int:
+        return await self.batch_insert_async(IntradayTrade, trades_data)
+
+    async def add_usd_history_async(self, history_data: List[Dict[str, Any]]) -> int:
+        return await self.batch_insert_async(USDHistory, history_data)
+
+    async def close_async(self):
+        """بستن موتور async و سپس اتصال‌های همگام"""
+        await self.async_engine.dispose()
+        self.close()
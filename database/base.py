@@ -1,28 +1,127 @@
 from abc import ABC, abstractmethod
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, Session
+from functools import partial, wraps
+from itertools import islice
+from sqlalchemy import bindparam, create_engine, event, func, insert, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import sessionmaker, scoped_session, Session
+from sqlalchemy.pool import QueuePool, StaticPool
 from sqlalchemy.exc import IntegrityError
 from typing import List, Dict, Any, Optional
 import logging
 import json
 
+import sqlalchemy
+
 from .models import (
     Base, Stock, PriceHistory, RIHistory, Index, IndexHistory, Sector, 
     SectorIndexHistory, Shareholder, MajorShareholderHistory, IntradayTrade, USDHistory
 )
-from config import DATABASE_URL, BATCH_SIZE, SECTORS_DATA_FILE, POSTGRES_CONFIG
+from config import (
+    DATABASE_URL, SECTORS_DATA_FILE, POSTGRES_CONFIG, SQLITE_CONFIG, SQLITE_PRAGMAS
+)
 
 logger = logging.getLogger(__name__)
 
+# تعداد سطر در هر executemany درج دسته‌ای؛ درایور هر زیر-دسته را در صفحه‌های insertmanyvalues_page_size می‌فرستد
+INSERT_CHUNK_SIZE = 10000
+
+# دستورهای پارامتری MAX(j_date) که یک بار ساخته و در همه فراخوانی‌ها بازاستفاده می‌شوند
+_LAST_DATE_STMTS = {
+    PriceHistory: select(func.max(PriceHistory.j_date)).where(PriceHistory.stock_id == bindparam('key')),
+    RIHistory: select(func.max(RIHistory.j_date)).where(RIHistory.stock_id == bindparam('key')),
+    IndexHistory: select(func.max(IndexHistory.j_date)).where(IndexHistory.index_id == bindparam('key')),
+    SectorIndexHistory: select(func.max(SectorIndexHistory.j_date)).where(
+        SectorIndexHistory.sector_id == bindparam('key')
+    ),
+    MajorShareholderHistory: select(func.max(MajorShareholderHistory.j_date)).where(
+        MajorShareholderHistory.stock_id == bindparam('key')
+    ),
+    USDHistory: select(func.max(USDHistory.j_date)),
+}
+
+
+def _postgres_engine_options(options: Dict[str, Any], url: str) -> Dict[str, Any]:
+    """تنظیمات create_engine برای PostgreSQL؛ در SQLAlchemy 1.4 اندازه صفحه به execute_values درایور psycopg2 داده می‌شود"""
+    if int(sqlalchemy.__version__.split('.')[0]) >= 2 or 'insertmanyvalues_page_size' not in options:
+        return options
+    # SQLAlchemy 1.4 پارامتر insertmanyvalues_page_size ندارد؛ executemany_values_page_size فقط در psycopg2 هست
+    # و درایورهای دیگر (asyncpg، pg8000) با آن TypeError می‌دهند، پس برای آن‌ها کلید حذف می‌شود
+    options = dict(options)
+    page_size = options.pop('insertmanyvalues_page_size')
+    if make_url(url).get_driver_name() == 'psycopg2':
+        options['executemany_values_page_size'] = page_size
+    return options
+
+
+def _is_memory_url(url: str) -> bool:
+    """آیا آدرس SQLite به دیتابیس حافظه‌ای اشاره می‌کند (:memory: یا URI نام‌دار با mode=memory)"""
+    return url in ("sqlite://", "sqlite:///") or ":memory:" in url or "mode=memory" in url
+
+
+def _uniform_keys(data_list: List[Dict[str, Any]]) -> bool:
+    """آیا همه سطرها کلیدهای یکسان دارند؛ مسیرهایی که ستون‌ها را از سطر اول می‌گیرند (VALUES چندسطری، COPY) فقط در این حالت امن‌اند"""
+    keys = data_list[0].keys()
+    return all(row.keys() == keys for row in data_list)
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record, pragmas: Dict[str, Any] = SQLITE_PRAGMAS):
+    """اعمال PRAGMAهای SQLite روی هر اتصال جدید موتور SQLite (sqlite3 یا aiosqlite) که به آن گوش می‌دهد"""
+    cursor = dbapi_connection.cursor()
+    for name, value in pragmas.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+
+def with_session(fn):
+    """مدیریت سشن متدهای نوشتن تک‌سطری در همه پیاده‌سازی‌ها: سشن به متد داده می‌شود،
+    commit فقط اگر شیئی برگردد و سپس self._after_commit(result)، rollback و None در خطا، بستن سشن در پایان
+
+    متد شیء برگشتی را پیش از بازگشت expunge می‌کند تا پس از commit منقضی نشود.
+    """
+    @wraps(fn)
+    def wrapper(self, *args, **kwargs):
+        session = self.get_session()
+        try:
+            result = fn(self, session, *args, **kwargs)
+            if result is not None:
+                session.commit()
+                self._after_commit(result)
+            return result
+        except Exception as e:
+            session.rollback()
+            call_args = ', '.join([repr(a) for a in args] + [f"{k}={v!r}" for k, v in kwargs.items()])
+            logger.error(f"Error in {fn.__name__}({call_args}): {e}")
+            return None
+        finally:
+            session.close()
+    return wrapper
+
+
 class DatabaseBase(ABC):
     def __init__(self):
         if DATABASE_URL.startswith("postgresql"):
             # استفاده از تنظیمات pool برای PostgreSQL
-            self.engine = create_engine(DATABASE_URL, **POSTGRES_CONFIG)
+            self.engine = create_engine(DATABASE_URL, **_postgres_engine_options(POSTGRES_CONFIG, DATABASE_URL))
+            self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
         else:
-            self.engine = create_engine(DATABASE_URL)
-        
-        self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+            in_memory = _is_memory_url(DATABASE_URL)
+            if in_memory:
+                # دیتابیس حافظه‌ای فقط روی یک اتصال مشترک معتبر است
+                self.engine = create_engine(
+                    DATABASE_URL, poolclass=StaticPool, connect_args=SQLITE_CONFIG["connect_args"]
+                )
+            else:
+                self.engine = create_engine(DATABASE_URL, poolclass=QueuePool, **SQLITE_CONFIG)
+            # PRAGMAها فقط روی موتور همین نمونه؛ WAL قالب فایل را تغییر می‌دهد و برای دیتابیس حافظه‌ای بی‌معناست
+            pragmas = {
+                name: value for name, value in SQLITE_PRAGMAS.items()
+                if not (in_memory and name == "journal_mode")
+            }
+            event.listen(self.engine, "connect", partial(_set_sqlite_pragmas, pragmas=pragmas))
+            # سشن thread-local تا فراخوانی‌های پیاپی از اتصال کش‌شده استفاده کنند
+            self.SessionLocal = scoped_session(
+                sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+            )
         self.create_tables()
     
     def create_tables(self):
@@ -34,8 +133,16 @@ class DatabaseBase(ABC):
         """دریافت سشن دیتابیس"""
         return self.SessionLocal()
 
+    def _after_commit(self, obj):
+        """پس از commit موفق یک متد with_session با شیء برگشتی آن فراخوانی می‌شود (مثلاً برای پر کردن کش جستجو)"""
+
+    def clear_lookup_cache(self):
+        """خالی کردن کش جستجوی پیاده‌سازی‌هایی که کش دارند؛ پس از حذف دسته‌ای سطرها فراخوانی شود"""
+
     def close(self):
         """بستن اتصال دیتابیس"""
+        if isinstance(getattr(self, 'SessionLocal', None), scoped_session):
+            self.SessionLocal.remove()
         if hasattr(self, 'engine') and self.engine:
             self.engine.dispose()
             logger.info("Database connection closed")
@@ -174,8 +281,19 @@ class DatabaseBase(ABC):
         """دریافت آخرین تاریخ قیمت دلار"""
         pass
     
+    def _get_last_date(self, model, key: Optional[int] = None) -> Optional[str]:
+        """آخرین j_date ذخیره‌شده یک جدول تاریخچه با دستور از پیش ساخته‌شده؛ key شناسه سهام/شاخص/صنعت است"""
+        session = self.get_session()
+        try:
+            stmt = _LAST_DATE_STMTS[model]
+            if key is None:
+                return session.execute(stmt).scalar()
+            return session.execute(stmt, {'key': key}).scalar()
+        finally:
+            session.close()
+
     def batch_insert(self, model_class, data_list: List[Dict[str, Any]]) -> int:
-        """درج دسته‌ای داده‌ها"""
+        """درج دسته‌ای داده‌ها با INSERT هسته SQLAlchemy (executemany) و یک commit"""
         if not data_list:
             return 0
             
@@ -183,19 +301,23 @@ class DatabaseBase(ABC):
         session = self.get_session()
         
         try:
-            for i in range(0, len(data_list), BATCH_SIZE):
-                batch = data_list[i:i+BATCH_SIZE]
-                objects = [model_class(**item) for item in batch]
-                session.bulk_save_objects(objects)
-                session.commit()
-                inserted_count += len(batch)
-                logger.debug(f"Inserted {inserted_count} records into {model_class.__tablename__}")
+            # بدون ساخت شیء ORM؛ سطرها مستقیم با insertmanyvalues در INSERTهای چندسطری فرستاده می‌شوند
+            conn = session.connection()
+            stmt = insert(model_class.__table__)
+            it = iter(data_list)
+            for chunk in iter(lambda: list(islice(it, INSERT_CHUNK_SIZE)), []):
+                conn.execute(stmt, chunk)
+                inserted_count += len(chunk)
+            session.commit()
+            logger.debug(f"Inserted {inserted_count} records into {model_class.__tablename__}")
                 
         except IntegrityError as e:
             session.rollback()
+            inserted_count = 0
             logger.error(f"Integrity error during batch insert: {e}")
         except Exception as e:
             session.rollback()
+            inserted_count = 0
             logger.error(f"Error during batch insert: {e}")
         finally:
             session.close()
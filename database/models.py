@@ -1,4 +1,5 @@
 from sqlalchemy import Column, Integer, String, Date, Numeric, BigInteger, Boolean, ForeignKey, UniqueConstraint, Float
+from sqlalchemy import Index as TableIndex
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 
@@ -195,6 +196,8 @@ class MajorShareholderHistory(Base):
     
     __table_args__ = (
         UniqueConstraint('stock_id', 'shareholder_id', 'j_date', name='uq_major_shareholder'),
+        # ایندکس پوششی برای MAX(j_date) به ازای هر سهم
+        TableIndex('ix_major_shareholder_stock_jdate', 'stock_id', 'j_date'),
     )
 
 class IntradayTrade(Base):
@@ -1,16 +1,18 @@
-def get_postgres_session():
-    """تابع کمکی برای بازگرداندن یک session دیتابیس PostgreSQL"""
-    db = PostgreSQLDatabase()
-    return db.get_session()
 """
 PostgreSQL database implementation for TSE data collector
 """
 
-from typing import List, Dict, Any, Optional
-from sqlalchemy import and_
-from sqlalchemy.orm import Session
+import io
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Iterable, List, Dict, Any, Optional
+from sqlalchemy import and_, select
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session, make_transient_to_detached
 
-from .base import DatabaseBase
+from .base import DatabaseBase, _uniform_keys, with_session
 from .models import (
     Stock, PriceHistory, RIHistory, Index, IndexHistory, Sector, 
     SectorIndexHistory, Shareholder, MajorShareholderHistory, IntradayTrade, USDHistory
@@ -19,6 +21,38 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# حداکثر تعداد مقادیر هر IN (...)؛ لیست‌های بزرگ‌تر در چند پرس‌وجو خوانده می‌شوند
+IN_CLAUSE_MAX_ITEMS = 1000
+
+# حداکثر تعداد سطرهای نگه‌داشته‌شده در کش جستجو؛ قدیمی‌ترین استفاده بیرون می‌رود
+LOOKUP_CACHE_MAXSIZE = 4096
+
+# ستون‌های یکتایی که سطر تازه نوشته‌شده با آن‌ها در کش جستجو ثبت می‌شود
+_LOOKUP_CACHE_COLUMNS = {
+    Stock: (Stock.ticker, Stock.web_id),
+    Sector: (Sector.sector_code,),
+    Shareholder: (Shareholder.shareholder_id,),
+}
+
+# از این تعداد سطر به بالا، درج دسته‌ای با COPY FROM STDIN انجام می‌شود
+COPY_MIN_ROWS = 5000
+
+# نقل‌قول نام جدول و ستون‌ها در دستور COPY
+_PG_PREPARER = postgresql.dialect().identifier_preparer
+
+# نویسه‌هایی که در قالب متنی COPY باید escape شوند
+_COPY_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+
+def _copy_text(value) -> str:
+    """مقدار یک خانه در قالب متنی COPY؛ None به \\N تبدیل می‌شود"""
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    return str(value).translate(_COPY_ESCAPES)
+
+
 class PostgreSQLDatabase(DatabaseBase):
     """PostgreSQL implementation of DatabaseBase"""
 
@@ -35,54 +69,125 @@ class PostgreSQLDatabase(DatabaseBase):
     IntradayTrade = IntradayTrade
     USDHistory = USDHistory
 
-    def add_stock(self, stock_data: Dict[str, Any]) -> Optional[Stock]:
+    def __init__(self):
+        # کش LRU (جدول، ستون، مقدار) -> تاپل مقادیر ستون‌های سطر؛ فقط نتایج یافت‌شده نگه داشته می‌شوند
+        self._lookup_cache: "OrderedDict[tuple, tuple]" = OrderedDict()
+        super().__init__()
+
+    @contextmanager
+    def session_scope(self):
+        """سشن یک عملیات روی اتصال pool؛ rollback در خطا و بازگرداندن اتصال به pool در پایان (commit با خود متد است)"""
         session = self.get_session()
         try:
-            # بررسی وجود سهام
-            existing = session.query(Stock).filter(
-                Stock.ticker == stock_data['ticker']
-            ).first()
+            yield session
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
 
-            if existing:
-                logger.debug(f"Stock {stock_data['ticker']} already exists")
-                return None
+    def _remember(self, column, obj):
+        """ثبت مقادیر ستون‌های سطر (نه خود شیء ORM) در کش جستجو با مقدار ستون یکتای آن"""
+        cache_key = (column.class_.__tablename__, column.key, getattr(obj, column.key))
+        self._lookup_cache[cache_key] = tuple(getattr(obj, c.key) for c in column.class_.__table__.columns)
+        self._lookup_cache.move_to_end(cache_key)
+        if len(self._lookup_cache) > LOOKUP_CACHE_MAXSIZE:
+            self._lookup_cache.popitem(last=False)
 
-            stock = Stock(**stock_data)
-            session.add(stock)
-            session.commit()
-            # Ensure all attributes are loaded before expunging
-            session.refresh(stock)
-            session.expunge(stock)
-            logger.info(f"Added new stock: {stock_data['ticker']}")
-            return stock
+    def _cached(self, model, column, value):
+        """شیء جداشده تازه از مقادیر کش‌شده، یا None؛ هر فراخواننده نمونه خودش را می‌گیرد"""
+        cache_key = (model.__tablename__, column.key, value)
+        values = self._lookup_cache.get(cache_key)
+        if values is None:
+            return None
+        self._lookup_cache.move_to_end(cache_key)
+        obj = model(**{c.key: v for c, v in zip(model.__table__.columns, values)})
+        make_transient_to_detached(obj)
+        return obj
 
-        except Exception as e:
-            session.rollback()
-            logger.error(f"Error adding stock {stock_data['ticker']}: {e}")
+    def _after_commit(self, obj):
+        """ثبت سطر تازه نوشته‌شده در کش جستجو با ستون‌های یکتای آن"""
+        for model, columns in _LOOKUP_CACHE_COLUMNS.items():
+            if isinstance(obj, model):
+                for column in columns:
+                    self._remember(column, obj)
+
+    def invalidate(self, model, column, value):
+        """حذف یک سطر از کش جستجو؛ پس از تغییر یا حذف سطر در دیتابیس فراخوانی شود"""
+        self._lookup_cache.pop((model.__tablename__, column.key, value), None)
+
+    def clear_lookup_cache(self):
+        """خالی کردن کامل کش جستجو"""
+        self._lookup_cache.clear()
+
+    def _get_by_unique(self, model, column, value):
+        """دریافت سطر با کلید یکتا؛ پس از اولین یافتن، بدون رفت‌وبرگشت به دیتابیس از کش ساخته می‌شود"""
+        obj = self._cached(model, column, value)
+        if obj is not None:
+            return obj
+
+        with self.session_scope() as session:
+            obj = session.execute(select(model).where(column == value)).scalar_one_or_none()
+            if obj is not None:
+                self._remember(column, obj)
+        return obj
+
+    @staticmethod
+    def _insert_returning(session: Session, model_class, data: Dict[str, Any], conflict_column: str):
+        """INSERT ... ON CONFLICT DO NOTHING RETURNING در یک رفت‌وبرگشت؛ شیء درج‌شده یا None اگر سطر موجود باشد"""
+        stmt = (
+            pg_insert(model_class)
+            .values(**data)
+            .on_conflict_do_nothing(index_elements=[conflict_column])
+            .returning(model_class)
+        )
+        return session.execute(stmt).scalar_one_or_none()
+
+    @with_session
+    def add_stock(self, session: Session, stock_data: Dict[str, Any]) -> Optional[Stock]:
+        # درج با ON CONFLICT DO NOTHING؛ اگر سهام موجود باشد RETURNING سطری برنمی‌گرداند
+        stock = self._insert_returning(session, Stock, stock_data, 'ticker')
+
+        if stock is None:
+            # سطر موجود ممکن است جای دیگری تغییر کرده باشد؛ نسخه کش‌شده کنار گذاشته می‌شود
+            self.invalidate(Stock, Stock.ticker, stock_data['ticker'])
+            logger.debug(f"Stock {stock_data['ticker']} already exists")
             return None
-        finally:
-            session.close()
-    
+
+        # Detach before commit so the RETURNING values are not expired
+        session.expunge(stock)
+        logger.info(f"Added new stock: {stock_data['ticker']}")
+        return stock
+
     def get_stock_by_ticker(self, ticker: str) -> Optional[Stock]:
-        session = self.get_session()
-        try:
-            return session.query(Stock).filter(Stock.ticker == ticker).first()
-        finally:
-            session.close()
+        return self._get_by_unique(Stock, Stock.ticker, ticker)
     
+    def get_stocks_by_tickers(self, tickers: Iterable[str]) -> Dict[str, Stock]:
+        """سهام چند تیکر با یک WHERE ticker IN (...) به ازای هر IN_CLAUSE_MAX_ITEMS تیکر؛ تیکرهای ناموجود در خروجی نیستند"""
+        result: Dict[str, Stock] = {}
+        missing = []
+        for ticker in dict.fromkeys(tickers):
+            stock = self._cached(Stock, Stock.ticker, ticker)
+            if stock is not None:
+                result[ticker] = stock
+            else:
+                missing.append(ticker)
+
+        if missing:
+            with self.session_scope() as session:
+                for i in range(0, len(missing), IN_CLAUSE_MAX_ITEMS):
+                    chunk = missing[i:i + IN_CLAUSE_MAX_ITEMS]
+                    for stock in session.execute(select(Stock).where(Stock.ticker.in_(chunk))).scalars():
+                        result[stock.ticker] = stock
+                        self._remember(Stock.ticker, stock)
+                        self._remember(Stock.web_id, stock)
+        return result
+
     def get_stock_by_web_id(self, web_id: str) -> Optional[Stock]:
-        session = self.get_session()
-        try:
-            return session.query(Stock).filter(Stock.web_id == web_id).first()
-        finally:
-            session.close()
+        return self._get_by_unique(Stock, Stock.web_id, web_id)
     
     def get_sector_by_code(self, sector_code: float) -> Optional[Sector]:
-        session = self.get_session()
-        try:
-            return session.query(Sector).filter(Sector.sector_code == sector_code).first()
-        finally:
-            session.close()
+        return self._get_by_unique(Sector, Sector.sector_code, sector_code)
     
     def add_price_history(self, history_data: List[Dict[str, Any]]) -> int:
         return self.batch_insert(PriceHistory, history_data)
@@ -90,80 +195,54 @@ class PostgreSQLDatabase(DatabaseBase):
     def add_ri_history(self, history_data: List[Dict[str, Any]]) -> int:
         return self.batch_insert(RIHistory, history_data)
     
-    def add_index(self, index_data: Dict[str, Any]) -> Optional[Index]:
-        session = self.get_session()
-        try:
-            # بررسی وجود شاخص
-            existing = session.query(Index).filter(
-                Index.name == index_data['name']
-            ).first()
-
-            if existing:
-                logger.debug(f"Index {index_data['name']} already exists")
-                # Ensure all attributes are loaded before expunging
-                session.refresh(existing)
+    @with_session
+    def add_index(self, session: Session, index_data: Dict[str, Any]) -> Optional[Index]:
+        # درج با ON CONFLICT DO NOTHING؛ فقط اگر شاخص موجود باشد یک SELECT دیگر لازم است
+        index = self._insert_returning(session, Index, index_data, 'name')
+
+        if index is None:
+            logger.debug(f"Index {index_data['name']} already exists")
+            existing = session.execute(
+                select(Index).where(Index.name == index_data['name'])
+            ).scalar_one_or_none()
+            if existing is not None:
                 session.expunge(existing)
-                return existing
+            return existing
 
-            index = Index(**index_data)
-            session.add(index)
-            session.commit()
-            # Ensure all attributes are loaded before expunging
-            session.refresh(index)
-            session.expunge(index)
-            logger.info(f"Added new index: {index_data['name']}")
-            return index
+        # Detach before commit so the RETURNING values are not expired
+        session.expunge(index)
+        logger.info(f"Added new index: {index_data['name']}")
+        return index
 
-        except Exception as e:
-            session.rollback()
-            logger.error(f"Error adding index {index_data['name']}: {e}")
-            return None
-        finally:
-            session.close()
-    
     def add_index_history(self, history_data: List[Dict[str, Any]]) -> int:
         return self.batch_insert(IndexHistory, history_data)
     
     def add_sector_index_history(self, history_data: List[Dict[str, Any]]) -> int:
         return self.batch_insert(SectorIndexHistory, history_data)
     
-    def add_shareholder(self, shareholder_data: Dict[str, Any]) -> Optional[Shareholder]:
-        session = self.get_session()
-        try:
-            # بررسی وجود سهامدار
-            existing = session.query(Shareholder).filter(
-                Shareholder.shareholder_id == shareholder_data['shareholder_id']
-            ).first()
-
-            if existing:
-                logger.debug(f"Shareholder {shareholder_data['shareholder_id']} already exists")
-                # Ensure all attributes are loaded before expunging
-                session.refresh(existing)
+    @with_session
+    def add_shareholder(self, session: Session, shareholder_data: Dict[str, Any]) -> Optional[Shareholder]:
+        # درج با ON CONFLICT DO NOTHING؛ فقط اگر سهامدار موجود باشد یک SELECT دیگر لازم است
+        shareholder = self._insert_returning(session, Shareholder, shareholder_data, 'shareholder_id')
+
+        if shareholder is None:
+            logger.debug(f"Shareholder {shareholder_data['shareholder_id']} already exists")
+            existing = session.execute(
+                select(Shareholder).where(
+                    Shareholder.shareholder_id == shareholder_data['shareholder_id']
+                )
+            ).scalar_one_or_none()
+            if existing is not None:
                 session.expunge(existing)
-                return existing
+            return existing
 
-            shareholder = Shareholder(**shareholder_data)
-            session.add(shareholder)
-            session.commit()
-            # Ensure all attributes are loaded before expunging
-            session.refresh(shareholder)
-            session.expunge(shareholder)
-            logger.info(f"Added new shareholder: {shareholder_data['name']}")
-            return shareholder
+        # Detach before commit so the RETURNING values are not expired
+        session.expunge(shareholder)
+        logger.info(f"Added new shareholder: {shareholder_data['name']}")
+        return shareholder
 
-        except Exception as e:
-            session.rollback()
-            logger.error(f"Error adding shareholder {shareholder_data['name']}: {e}")
-            return None
-        finally:
-            session.close()
-    
     def get_shareholder_by_id(self, shareholder_id: str) -> Optional[Shareholder]:
-        session = self.get_session()
-        try:
-            return session.query(Shareholder).filter(Shareholder.shareholder_id == shareholder_id).first()
-        finally:
-            session.close()
+        return self._get_by_unique(Shareholder, Shareholder.shareholder_id, shareholder_id)
     
     def add_major_shareholder_history(self, history_data: List[Dict[str, Any]]) -> int:
         return self.batch_insert(MajorShareholderHistory, history_data)
@@ -173,66 +252,80 @@ class PostgreSQLDatabase(DatabaseBase):
     
     def add_usd_history(self, history_data: List[Dict[str, Any]]) -> int:
         return self.batch_insert(USDHistory, history_data)
-    
-    def get_last_price_date(self, stock_id: int) -> Optional[str]:
+
+    def batch_insert(self, model_class, data_list: List[Dict[str, Any]]) -> int:
+        """درج دسته‌ای؛ دسته‌های بزرگ روی psycopg2 با COPY FROM STDIN و بقیه با INSERT هسته SQLAlchemy"""
+        if model_class in (Stock, Sector, Shareholder):
+            # جداول کش‌شده از مسیر دسته‌ای نوشته شده‌اند؛ نسخه‌های کش‌شده دیگر قابل اعتماد نیستند
+            self.clear_lookup_cache()
+        if (
+            len(data_list) >= COPY_MIN_ROWS
+            and self.engine.dialect.driver == 'psycopg2'
+            and _uniform_keys(data_list)
+        ):
+            return self._copy_insert(model_class, data_list)
+        return super().batch_insert(model_class, data_list)
+
+    def _copy_insert(self, model_class, data_list: List[Dict[str, Any]]) -> int:
+        """درج سطرها با یک COPY ... FROM STDIN در قالب متنی؛ بدون مرحله parse/bind هر سطر"""
+        table = model_class.__table__
+        columns = list(data_list[0])
+        buf = io.StringIO()
+        for row in data_list:
+            buf.write('\t'.join([_copy_text(row.get(col)) for col in columns]))
+            buf.write('\n')
+        buf.seek(0)
+        sql = 'COPY {} ({}) FROM STDIN'.format(
+            _PG_PREPARER.format_table(table),
+            ', '.join(_PG_PREPARER.quote(table.c[col].name) for col in columns),
+        )
+
+        inserted_count = 0
         session = self.get_session()
         try:
-            result = session.query(PriceHistory.j_date).filter(
-                PriceHistory.stock_id == stock_id
-            ).order_by(PriceHistory.date.desc()).first()
-            
-            return result[0] if result else None
+            cursor = session.connection().connection.cursor()
+            try:
+                cursor.copy_expert(sql, buf)
+            finally:
+                cursor.close()
+            session.commit()
+            inserted_count = len(data_list)
+            logger.debug(f"Copied {inserted_count} records into {table.name}")
+
+        except Exception as e:
+            # خطای درایور (مثلاً نقض یکتایی) کل COPY را لغو می‌کند
+            session.rollback()
+            logger.error(f"Error during COPY insert: {e}")
         finally:
             session.close()
+
+        return inserted_count
+    
+    def get_last_price_date(self, stock_id: int) -> Optional[str]:
+        return self._get_last_date(PriceHistory, stock_id)
     
     def get_last_ri_date(self, stock_id: int) -> Optional[str]:
-        session = self.get_session()
-        try:
-            result = session.query(RIHistory.j_date).filter(
-                RIHistory.stock_id == stock_id
-            ).order_by(RIHistory.date.desc()).first()
-            
-            return result[0] if result else None
-        finally:
-            session.close()
+        return self._get_last_date(RIHistory, stock_id)
     
     def get_last_index_date(self, index_id: int) -> Optional[str]:
-        session = self.get_session()
-        try:
-            result = session.query(IndexHistory.j_date).filter(
-                IndexHistory.index_id == index_id
-            ).order_by(IndexHistory.date.desc()).first()
-            
-            return result[0] if result else None
-        finally:
-            session.close()
+        return self._get_last_date(IndexHistory, index_id)
     
     def get_last_sector_index_date(self, sector_id: int) -> Optional[str]:
-        session = self.get_session()
-        try:
-            result = session.query(SectorIndexHistory.j_date).filter(
-                SectorIndexHistory.sector_id == sector_id
-            ).order_by(SectorIndexHistory.date.desc()).first()
-            
-            return result[0] if result else None
-        finally:
-            session.close()
+        return self._get_last_date(SectorIndexHistory, sector_id)
     
     def get_last_shareholder_date(self, stock_id: int) -> Optional[str]:
-        session = self.get_session()
-        try:
-            result = session.query(MajorShareholderHistory.j_date).filter(
-                MajorShareholderHistory.stock_id == stock_id
-            ).order_by(MajorShareholderHistory.date.desc()).first()
-            
-            return result[0] if result else None
-        finally:
-            session.close()
+        return self._get_last_date(MajorShareholderHistory, stock_id)
     
     def get_last_usd_date(self) -> Optional[str]:
-        session = self.get_session()
-        try:
-            result = session.query(USDHistory.j_date).order_by(USDHistory.date.desc()).first()
-            return result[0] if result else None
-        finally:
-            session.close()
\ No newline at end of file
+        return self._get_last_date(USDHistory)
+
+
+@lru_cache(maxsize=None)
+def _shared_postgres_db():
+    """یک نمونه PostgreSQLDatabase (و یک engine و pool اتصال) برای همه فراخوانی‌های get_postgres_session"""
+    return PostgreSQLDatabase()
+
+
+def get_postgres_session():
+    """تابع کمکی برای بازگرداندن یک session دیتابیس PostgreSQL"""
+    return _shared_postgres_db().get_session()
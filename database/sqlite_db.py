@@ -2,11 +2,16 @@ def get_sqlite_session():
     """تابع کمکی برای بازگرداندن یک session دیتابیس SQLite"""
     db = SQLiteDatabase()
     return db.get_session()
-from typing import List, Dict, Any, Optional
-from sqlalchemy import and_
+from contextlib import contextmanager
+from itertools import islice
+from typing import List, Dict, Any, Optional, Sequence, Union
+from sqlalchemy import and_, insert, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
-from .base import DatabaseBase
+from config import SQLITE_BULK_LOAD_PRAGMAS
+from .base import DatabaseBase, _uniform_keys, with_session
 from .models import (
     Stock, PriceHistory, RIHistory, Index, IndexHistory, Sector, 
     SectorIndexHistory, Shareholder, MajorShareholderHistory, IntradayTrade, USDHistory
@@ -15,6 +20,49 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# اندازه پیش‌فرض هر زیر-دسته در executemany جداول تاریخچه
+CORE_INSERT_CHUNK_SIZE = 500
+
+# تا این تعداد سطر، همه سطرها در یک INSERT چندمقداری (multi-row VALUES) ارسال می‌شوند
+MULTI_VALUES_MAX_ROWS = 50
+
+# دستورهای INSERT OR IGNORE جداول تاریخچه یک بار هنگام import ساخته می‌شوند؛
+# سطرهای تکراری (بازه‌های هم‌پوشان در دریافت مجدد) بدون خطا نادیده گرفته می‌شوند
+_INSERT_STMTS = {
+    model: insert(model.__table__).prefix_with('OR IGNORE')
+    for model in (
+        PriceHistory, RIHistory, IndexHistory, SectorIndexHistory,
+        MajorShareholderHistory, IntradayTrade, USDHistory,
+    )
+}
+
+
+# ستون‌های یکتایی که id سطر تازه درج‌شده با آن‌ها در کش جستجو ثبت می‌شود
+_ID_CACHE_COLUMNS = {
+    Stock: (Stock.ticker, Stock.web_id),
+    Sector: (Sector.sector_code,),
+    Shareholder: (Shareholder.shareholder_id,),
+}
+
+
+def _chunked(seq, n: int):
+    """تقسیم یک دنباله به لیست‌هایی با حداکثر n عضو"""
+    it = iter(seq)
+    return iter(lambda: list(islice(it, n)), [])
+
+
+def _column_values(values) -> list:
+    """تبدیل یک ستون (آرایه NumPy یا هر دنباله) به لیست مقادیر پایتونی قابل bind"""
+    dtype = getattr(values, 'dtype', None)
+    if dtype is not None and dtype.kind == 'M':
+        import numpy as np
+
+        # ستون datetime64 یک بار برای کل دسته در C به رشته YYYY-MM-DD (قالب ستون Date در SQLite) تبدیل می‌شود
+        return np.asarray(values, dtype='datetime64[D]').astype(str).tolist()
+    # tolist آرایه NumPy را در سطح C به int/float پایتونی تبدیل می‌کند
+    return values.tolist() if hasattr(values, 'tolist') else list(values)
+
+
 class SQLiteDatabase(DatabaseBase):
     # Expose models as attributes for testing
     Stock = Stock
@@ -29,94 +77,285 @@ class SQLiteDatabase(DatabaseBase):
     IntradayTrade = IntradayTrade
     USDHistory = USDHistory
 
-    def add_stock(self, stock_data: Dict[str, Any]) -> Optional[Stock]:
-        session = self.get_session()
+    def __init__(self, batch_size: int = CORE_INSERT_CHUNK_SIZE):
+        # تعداد سطر در هر executemany؛ برای جداول با ستون‌های زیاد می‌توان کمترش کرد
+        self.batch_size = batch_size
+        # کش (جدول، ستون، مقدار) -> id برای جستجوهای پرتکرار؛ فقط کلید اصلی نگه داشته می‌شود
+        self._id_cache: Dict[tuple, int] = {}
+        # کش دستورهای کامپایل‌شده که با execution_options به اتصال داده می‌شود
+        self._compiled_cache: Dict[Any, Any] = {}
+        # اتصال نگه‌داشته‌شده در bulk_load_mode؛ درج‌های دسته‌ای در این حالت روی همین اتصال اجرا می‌شوند
+        self._bulk_conn = None
+        # سشن باز transaction()؛ درج‌های دسته‌ای داخل آن commit جداگانه ندارند
+        self._tx_session: Optional[Session] = None
+        super().__init__()
+
+    @contextmanager
+    def bulk_load_mode(self):
+        """حالت بارگذاری انبوه: synchronous=OFF و journal_mode=MEMORY روی یک اتصال ثابت و بازگرداندن مقادیر قبلی در پایان
+
+        در این حالت fsync انجام نمی‌شود؛ قطع برق یا کرش سیستم عامل وسط بارگذاری می‌تواند فایل دیتابیس را خراب کند.
+        فقط برای بارگذاری‌های تک‌نخی قابل تکرار (مثل دریافت اولیه تاریخچه) استفاده شود.
+        """
+        conn = self.engine.connect()
+        previous = {}
         try:
-            # بررسی وجود سهام
-            existing = session.query(Stock).filter(
-                Stock.ticker == stock_data['ticker']
-            ).first()
-
-            if existing:
-                logger.debug(f"Stock {stock_data['ticker']} already exists")
-                # Ensure all attributes are loaded before expunging
-                session.refresh(existing)
-                session.expunge(existing)
-                return None
-
-            stock = Stock(**stock_data)
-            session.add(stock)
+            for name, value in SQLITE_BULK_LOAD_PRAGMAS.items():
+                previous[name] = conn.exec_driver_sql(f"PRAGMA {name}").scalar()
+                conn.exec_driver_sql(f"PRAGMA {name}={value}")
+            conn.commit()
+            self._bulk_conn = conn
+            yield self
+        finally:
+            self._bulk_conn = None
+            try:
+                if conn.in_transaction():
+                    conn.rollback()
+                for name, value in reversed(list(previous.items())):
+                    conn.exec_driver_sql(f"PRAGMA {name}={value}")
+                conn.commit()
+            except Exception as e:
+                logger.error(f"Error restoring SQLite pragmas after bulk load: {e}")
+            finally:
+                conn.close()
+
+    def _write_session(self) -> Session:
+        """سشن درج دسته‌ای؛ در bulk_load_mode به اتصال نگه‌داشته‌شده متصل است"""
+        if self._bulk_conn is not None:
+            return Session(bind=self._bulk_conn, autoflush=False)
+        return self.get_session()
+
+    @contextmanager
+    def transaction(self):
+        """یک تراکنش برای چند فراخوانی add_*_history؛ به جای یک commit (و fsync) در هر فراخوانی، یک commit در پایان
+
+        خطای یک فراخوانی فقط savepoint همان فراخوانی را برمی‌گرداند؛ خطای بیرون از درج‌ها کل تراکنش را rollback می‌کند.
+        تا پایان بلوک، نوشتن‌های دیگر (مثل add_stock) روی اتصال‌های دیگر منتظر قفل نوشتن SQLite می‌مانند.
+        """
+        if self._tx_session is not None:
+            # تراکنش تودرتو به تراکنش بیرونی می‌پیوندد
+            yield self._tx_session
+            return
+
+        if self._bulk_conn is not None:
+            session = self._write_session()
+        else:
+            # سشن مستقل از scoped_session تا commit/close متدهای دیگر روی این تراکنش اثر نگذارد
+            factory = getattr(self.SessionLocal, 'session_factory', self.SessionLocal)
+            session = factory()
+        self._tx_session = session
+        try:
+            # pysqlite پیش از SAVEPOINT خودش BEGIN نمی‌فرستد و RELEASE آن را commit می‌کند؛ BEGIN صریح تراکنش را نگه می‌دارد
+            conn = session.connection()
+            if not conn.connection.driver_connection.in_transaction:
+                conn.exec_driver_sql("BEGIN")
+            yield session
             session.commit()
-            # Ensure all attributes are loaded before expunging
-            session.refresh(stock)
-            session.expunge(stock)
-            logger.info(f"Added new stock: {stock_data['ticker']}")
-            return stock
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            self._tx_session = None
+            session.close()
 
-        except Exception as e:
+    @contextmanager
+    def _batch_write(self):
+        """سشن یک درج دسته‌ای: داخل transaction() یک savepoint، در غیر این صورت سشن جدید با commit و close"""
+        if self._tx_session is not None:
+            with self._tx_session.begin_nested():
+                yield self._tx_session
+            return
+
+        session = self._write_session()
+        try:
+            yield session
+            session.commit()
+        except Exception:
             session.rollback()
-            logger.error(f"Error adding stock {stock_data['ticker']}: {e}")
-            return None
+            raise
         finally:
             session.close()
-    
-    def get_stock_by_ticker(self, ticker: str) -> Optional[Stock]:
+
+    def _after_commit(self, obj):
+        """ثبت id سطر تازه نوشته‌شده در کش جستجو با ستون‌های یکتای آن"""
+        for model, columns in _ID_CACHE_COLUMNS.items():
+            if isinstance(obj, model):
+                for column in columns:
+                    self._remember_id(column, getattr(obj, column.key), obj.id)
+
+    def _remember_id(self, column, value, obj_id: int):
+        """ثبت id یک سطر در کش جستجو"""
+        self._id_cache[(column.class_.__tablename__, column.key, value)] = obj_id
+
+    def invalidate(self, model, column, value):
+        """حذف یک سطر از کش جستجو؛ پس از تغییر یا حذف سطر در دیتابیس فراخوانی شود"""
+        self._id_cache.pop((model.__tablename__, column.key, value), None)
+
+    def clear_lookup_cache(self):
+        """خالی کردن کامل کش جستجو؛ پس از حذف دسته‌ای سطرها (idها در SQLite دوباره استفاده می‌شوند)"""
+        self._id_cache.clear()
+
+    def _get_by_unique(self, model, column, value):
+        """دریافت سطر با کلید یکتا؛ در صورت وجود id در کش، جستجو با کلید اصلی و بررسی دوباره ستون یکتا انجام می‌شود"""
+        cache_key = (model.__tablename__, column.key, value)
         session = self.get_session()
         try:
-            return session.query(Stock).filter(Stock.ticker == ticker).first()
+            obj_id = self._id_cache.get(cache_key)
+            if obj_id is not None:
+                obj = session.get(model, obj_id)
+                # id حذف‌شده ممکن است به سطر دیگری رسیده باشد؛ فقط اگر ستون یکتا هنوز همان مقدار است معتبر است
+                if obj is not None and getattr(obj, column.key) == value:
+                    return obj
+                self._id_cache.pop(cache_key, None)
+
+            obj = session.query(model).filter(column == value).first()
+            if obj is not None:
+                self._id_cache[cache_key] = obj.id
+            return obj
         finally:
             session.close()
+
+    def batch_insert(
+        self, model_class, data_list: Union[List[Dict[str, Any]], Dict[str, Sequence]]
+    ) -> int:
+        """درج دسته‌ای با INSERT OR IGNORE هسته SQLAlchemy و یک commit؛ تعداد سطرهای درج‌شده را برمی‌گرداند"""
+        if isinstance(data_list, dict):
+            return self._insert_columns(model_class, data_list)
+        if not data_list:
+            return 0
+
+        inserted_count = 0
+        try:
+            with self._batch_write() as session:
+                # اجرای مستقیم روی Connection سشن؛ بدون ساخت شیء ORM و بدون مسیر ORM در Session.execute
+                conn = session.connection()
+                options = {'compiled_cache': self._compiled_cache}
+                stmt = self._insert_stmt(model_class)
+                # VALUES چندسطری ستون‌ها را از سطر اول می‌گیرد؛ سطرهای با کلیدهای متفاوت از مسیر executemany می‌روند
+                if len(data_list) <= MULTI_VALUES_MAX_ROWS and _uniform_keys(data_list):
+                    inserted_count = conn.execute(stmt.values(data_list), execution_options=options).rowcount
+                else:
+                    for chunk in _chunked(data_list, self.batch_size):
+                        inserted_count += conn.execute(stmt, chunk, execution_options=options).rowcount
+            logger.debug(f"Inserted {inserted_count} records into {model_class.__tablename__}")
+
+        except IntegrityError as e:
+            inserted_count = 0
+            logger.error(f"Integrity error during batch insert: {e}")
+        except Exception as e:
+            inserted_count = 0
+            logger.error(f"Error during batch insert: {e}")
+
+        return inserted_count
+
+    @staticmethod
+    def _insert_stmt(model_class):
+        """دستور INSERT OR IGNORE از پیش ساخته‌شده یک مدل (یا ساخت آن برای مدل‌های دیگر)"""
+        stmt = _INSERT_STMTS.get(model_class)
+        if stmt is None:
+            stmt = insert(model_class.__table__).prefix_with('OR IGNORE')
+        return stmt
+
+    def _insert_columns(self, model_class, columns: Dict[str, Sequence]) -> int:
+        """درج ستونی (dict از ستون‌ها)؛ تاپل پارامترها با یک zip روی ستون‌ها ساخته می‌شود و dict هر سطر ساخته نمی‌شود"""
+        values = {key: _column_values(col) for key, col in columns.items()}
+        if not values or not any(values.values()):
+            return 0
+
+        inserted_count = 0
+        try:
+            with self._batch_write() as session:
+                conn = session.connection()
+                compiled = self._insert_stmt(model_class).compile(dialect=conn.dialect, column_keys=list(values))
+                # ترتیب ستون‌ها مطابق جایگاه ? در SQL کامپایل‌شده
+                rows = zip(*(values[name] for name in compiled.positiontup))
+                for chunk in _chunked(rows, self.batch_size):
+                    inserted_count += conn.exec_driver_sql(str(compiled), chunk).rowcount
+            logger.debug(f"Inserted {inserted_count} records into {model_class.__tablename__}")
+
+        except IntegrityError as e:
+            inserted_count = 0
+            logger.error(f"Integrity error during batch insert: {e}")
+        except Exception as e:
+            inserted_count = 0
+            logger.error(f"Error during batch insert: {e}")
+
+        return inserted_count
+
+    @with_session
+    def add_stock(self, session: Session, stock_data: Dict[str, Any]) -> Optional[Stock]:
+        # درج با ON CONFLICT DO NOTHING؛ اگر سهام موجود باشد RETURNING سطری برنمی‌گرداند
+        stmt = (
+            sqlite_insert(Stock)
+            .values(**stock_data)
+            .on_conflict_do_nothing(index_elements=['ticker'])
+            .returning(Stock)
+        )
+        stock = session.execute(stmt).scalar_one_or_none()
+
+        if stock is None:
+            logger.debug(f"Stock {stock_data['ticker']} already exists")
+            return None
+
+        # Detach before commit so the RETURNING values are not expired
+        session.expunge(stock)
+        logger.info(f"Added new stock: {stock_data['ticker']}")
+        return stock
+    
+    def get_stock_by_ticker(self, ticker: str) -> Optional[Stock]:
+        return self._get_by_unique(Stock, Stock.ticker, ticker)
     
     def get_stock_by_web_id(self, web_id: str) -> Optional[Stock]:
+        return self._get_by_unique(Stock, Stock.web_id, web_id)
+
+    def get_stock_id_by_ticker(self, ticker: str) -> Optional[int]:
+        """فقط id سهام با SELECT id؛ بدون ساخت شیء ORM و بدون کش، تا id حذف‌شده هرگز برگردانده نشود"""
         session = self.get_session()
         try:
-            return session.query(Stock).filter(Stock.web_id == web_id).first()
+            return session.execute(select(Stock.id).where(Stock.ticker == ticker)).scalar()
         finally:
             session.close()
-    
-    def get_sector_by_code(self, sector_code: float) -> Optional[Sector]:
+
+    def get_stock_row_by_ticker(self, ticker: str):
+        """ستون‌های اصلی سهام به صورت Row سبک (id, ticker, name, web_id, market, sector_id) یا None"""
         session = self.get_session()
         try:
-            return session.query(Sector).filter(Sector.sector_code == sector_code).first()
+            stmt = select(
+                Stock.id, Stock.ticker, Stock.name, Stock.web_id, Stock.market, Stock.sector_id
+            ).where(Stock.ticker == ticker)
+            return session.execute(stmt).one_or_none()
         finally:
             session.close()
     
-    def add_price_history(self, history_data: List[Dict[str, Any]]) -> int:
+    def get_sector_by_code(self, sector_code: float) -> Optional[Sector]:
+        return self._get_by_unique(Sector, Sector.sector_code, sector_code)
+    
+    def add_price_history(self, history_data: Union[List[Dict[str, Any]], Dict[str, Sequence]]) -> int:
+        """درج تاریخچه قیمت؛ هم لیست dict سطرها و هم dict ستون‌ها (مثلاً آرایه‌های NumPy) پذیرفته می‌شود"""
         return self.batch_insert(PriceHistory, history_data)
     
     def add_ri_history(self, history_data: List[Dict[str, Any]]) -> int:
         return self.batch_insert(RIHistory, history_data)
     
-    def add_index(self, index_data: Dict[str, Any]) -> Optional[Index]:
-        session = self.get_session()
-        try:
-            # بررسی وجود شاخص
-            existing = session.query(Index).filter(
-                Index.name == index_data['name']
-            ).first()
-
-            if existing:
-                logger.debug(f"Index {index_data['name']} already exists")
-                # Ensure all attributes are loaded before expunging
-                session.refresh(existing)
-                session.expunge(existing)
-                return None
-
-            index = Index(**index_data)
-            session.add(index)
-            session.commit()
-            # Ensure all attributes are loaded before expunging
-            session.refresh(index)
-            session.expunge(index)
-            logger.info(f"Added new index: {index_data['name']}")
-            return index
+    @with_session
+    def add_index(self, session: Session, index_data: Dict[str, Any]) -> Optional[Index]:
+        # درج با ON CONFLICT DO NOTHING؛ اگر شاخص موجود باشد RETURNING سطری برنمی‌گرداند
+        stmt = (
+            sqlite_insert(Index)
+            .values(**index_data)
+            .on_conflict_do_nothing(index_elements=['name'])
+            .returning(Index)
+        )
+        index = session.execute(stmt).scalar_one_or_none()
 
-        except Exception as e:
-            session.rollback()
-            logger.error(f"Error adding index {index_data['name']}: {e}")
+        if index is None:
+            logger.debug(f"Index {index_data['name']} already exists")
             return None
-        finally:
-            session.close()
+
+        # Detach before commit so the RETURNING values are not expired
+        session.expunge(index)
+        logger.info(f"Added new index: {index_data['name']}")
+        return index
     
     def add_index_history(self, history_data: List[Dict[str, Any]]) -> int:
         return self.batch_insert(IndexHistory, history_data)
@@ -124,43 +363,27 @@ class SQLiteDatabase(DatabaseBase):
     def add_sector_index_history(self, history_data: List[Dict[str, Any]]) -> int:
         return self.batch_insert(SectorIndexHistory, history_data)
     
-    def add_shareholder(self, shareholder_data: Dict[str, Any]) -> Optional[Shareholder]:
-        session = self.get_session()
-        try:
-            # بررسی وجود سهامدار
-            existing = session.query(Shareholder).filter(
-                Shareholder.shareholder_id == shareholder_data['shareholder_id']
-            ).first()
-
-            if existing:
-                logger.debug(f"Shareholder {shareholder_data['shareholder_id']} already exists")
-                # Ensure all attributes are loaded before expunging
-                session.refresh(existing)
-                session.expunge(existing)
-                return existing
-
-            shareholder = Shareholder(**shareholder_data)
-            session.add(shareholder)
-            session.commit()
-            # Ensure all attributes are loaded before expunging
-            session.refresh(shareholder)
-            session.expunge(shareholder)
-            logger.info(f"Added new shareholder: {shareholder_data['name']}")
-            return shareholder
+    @with_session
+    def add_shareholder(self, session: Session, shareholder_data: Dict[str, Any]) -> Optional[Shareholder]:
+        # UPSERT با RETURNING؛ در صورت وجود، همان سطر موجود برگردانده می‌شود
+        stmt = (
+            sqlite_insert(Shareholder)
+            .values(**shareholder_data)
+            .on_conflict_do_update(
+                index_elements=['shareholder_id'],
+                set_={'shareholder_id': shareholder_data['shareholder_id']}
+            )
+            .returning(Shareholder)
+        )
+        shareholder = session.execute(stmt).scalar_one()
 
-        except Exception as e:
-            session.rollback()
-            logger.error(f"Error adding shareholder {shareholder_data['name']}: {e}")
-            return None
-        finally:
-            session.close()
+        # Detach before commit so the RETURNING values are not expired
+        session.expunge(shareholder)
+        logger.info(f"Upserted shareholder: {shareholder_data['shareholder_id']}")
+        return shareholder
     
     def get_shareholder_by_id(self, shareholder_id: str) -> Optional[Shareholder]:
-        session = self.get_session()
-        try:
-            return session.query(Shareholder).filter(Shareholder.shareholder_id == shareholder_id).first()
-        finally:
-            session.close()
+        return self._get_by_unique(Shareholder, Shareholder.shareholder_id, shareholder_id)
     
     def add_major_shareholder_history(self, history_data: List[Dict[str, Any]]) -> int:
         return self.batch_insert(MajorShareholderHistory, history_data)
@@ -172,99 +395,42 @@ class SQLiteDatabase(DatabaseBase):
         return self.batch_insert(USDHistory, history_data)
     
     def get_last_price_date(self, stock_id: int) -> Optional[str]:
-        session = self.get_session()
-        try:
-            result = session.query(PriceHistory.j_date).filter(
-                PriceHistory.stock_id == stock_id
-            ).order_by(PriceHistory.date.desc()).first()
-            
-            return result[0] if result else None
-        finally:
-            session.close()
+        return self._get_last_date(PriceHistory, stock_id)
     
     def get_last_ri_date(self, stock_id: int) -> Optional[str]:
-        session = self.get_session()
-        try:
-            result = session.query(RIHistory.j_date).filter(
-                RIHistory.stock_id == stock_id
-            ).order_by(RIHistory.date.desc()).first()
-            
-            return result[0] if result else None
-        finally:
-            session.close()
+        return self._get_last_date(RIHistory, stock_id)
     
     def get_last_index_date(self, index_id: int) -> Optional[str]:
-        session = self.get_session()
-        try:
-            result = session.query(IndexHistory.j_date).filter(
-                IndexHistory.index_id == index_id
-            ).order_by(IndexHistory.date.desc()).first()
-            
-            return result[0] if result else None
-        finally:
-            session.close()
+        return self._get_last_date(IndexHistory, index_id)
     
     def get_last_sector_index_date(self, sector_id: int) -> Optional[str]:
-        session = self.get_session()
-        try:
-            result = session.query(SectorIndexHistory.j_date).filter(
-                SectorIndexHistory.sector_id == sector_id
-            ).order_by(SectorIndexHistory.date.desc()).first()
-            
-            return result[0] if result else None
-        finally:
-            session.close()
+        return self._get_last_date(SectorIndexHistory, sector_id)
     
     def get_last_shareholder_date(self, stock_id: int) -> Optional[str]:
-        session = self.get_session()
-        try:
-            result = session.query(MajorShareholderHistory.j_date).filter(
-                MajorShareholderHistory.stock_id == stock_id
-            ).order_by(MajorShareholderHistory.date.desc()).first()
-            
-            return result[0] if result else None
-        finally:
-            session.close()
+        return self._get_last_date(MajorShareholderHistory, stock_id)
     
     def get_last_usd_date(self) -> Optional[str]:
-        session = self.get_session()
-        try:
-            result = session.query(USDHistory.j_date).order_by(USDHistory.date.desc()).first()
-            return result[0] if result else None
-        finally:
-            session.close()
+        return self._get_last_date(USDHistory)
     
-    def add_sector(self, sector_data: Dict[str, Any]) -> Optional[Sector]:
+    @with_session
+    def add_sector(self, session: Session, sector_data: Dict[str, Any]) -> Optional[Sector]:
         """افزودن یا به‌روزرسانی صنعت"""
-        session = self.get_session()
-        try:
-            # بررسی وجود صنعت
-            existing = session.query(Sector).filter(
-                Sector.sector_code == sector_data['sector_code']
-            ).first()
-
-            if existing:
-                logger.debug(f"Sector {sector_data['sector_code']} already exists")
-                # Ensure all attributes are loaded before expunging
-                session.refresh(existing)
-                session.expunge(existing)
-                return None
-
-            sector = Sector(**sector_data)
-            session.add(sector)
-            session.commit()
-            # Ensure all attributes are loaded before expunging
-            session.refresh(sector)
-            session.expunge(sector)
-            logger.info(f"Added new sector: {sector_data['sector_name']}")
-            return sector
+        # بررسی وجود صنعت
+        existing = session.query(Sector).filter(
+            Sector.sector_code == sector_data['sector_code']
+        ).first()
 
-        except Exception as e:
-            session.rollback()
-            logger.error(f"Error adding sector {sector_data.get('sector_name')}: {e}")
+        if existing:
+            logger.debug(f"Sector {sector_data['sector_code']} already exists")
             return None
-        finally:
-            session.close()
+
+        sector = Sector(**sector_data)
+        session.add(sector)
+        # flush برای گرفتن id پیش از expunge؛ commit در with_session انجام می‌شود
+        session.flush()
+        session.expunge(sector)
+        logger.info(f"Added new sector: {sector_data['sector_name']}")
+        return sector
     
     def get_all_stocks(self) -> List[Stock]:
         """دریافت لیست تمام سهام"""
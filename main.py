@@ -69,6 +69,8 @@ class TSEDataCollector:
             # حذف داده‌های جدول
             session.query(table_class).delete()
             session.commit()
+            # idهای حذف‌شده ممکن است دوباره استفاده شوند؛ کش جستجو دیگر معتبر نیست
+            self.db.clear_lookup_cache()
             logger.info(f"Table {table_name} cleared")
             
             # جمع‌آوری مجدد داده‌ها
@@ -25,6 +25,7 @@ def run_real_tests():
         [
             "python", "-m", "pytest",
             "tests/test_real_data.py",
+            "--runslow",
             "-v",
             "--tb=short",
             "--durations=10",
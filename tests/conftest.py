@@ -0,0 +1,106 @@
+import importlib
+import itertools
+import os
+import sys
+from functools import lru_cache
+
+import pytest
+from unittest.mock import create_autospec, patch
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+# Suffix for named in-memory SQLite databases; each URL is a database of its own
+_memory_db_ids = itertools.count()
+
+
+def private_memory_url():
+    """A new named in-memory SQLite URL, shared by every engine opened with it and by nothing else"""
+    return f'sqlite:///file:tse_test_{next(_memory_db_ids)}?mode=memory&cache=shared&uri=true'
+
+
+def make_mock_session():
+    """Return a fresh autospec'd SQLAlchemy Session mock"""
+    return create_autospec(Session, instance=True)
+
+
+@pytest.fixture
+def mock_session():
+    """Autospec'd Session so typos in session calls fail loudly"""
+    return make_mock_session()
+
+
+@pytest.fixture(autouse=True)
+def isolated_database_url(monkeypatch):
+    """Give every test its own in-memory SQLite database so no rows leak between tests or reach tse_data.db"""
+    if os.environ.get('DATABASE_TYPE', 'sqlite') != 'sqlite':
+        return
+    url = private_memory_url()
+    monkeypatch.setenv('DATABASE_URL', url)
+    # Modules that already read the URL at import time get the per-test value too
+    for name in ('config', 'database.base', 'database.async_sqlite_db'):
+        module = sys.modules.get(name)
+        if module is not None:
+            monkeypatch.setattr(module, 'DATABASE_URL', url)
+
+
+@pytest.fixture
+def fake_time(monkeypatch):
+    """Install a deterministic time.time that advances by `step` seconds on every call"""
+    def install(step=0.5):
+        clock = itertools.count(0.0, step)
+        monkeypatch.setattr('time.time', lambda: next(clock))
+    return install
+
+
+@pytest.fixture(scope="session")
+def main_mod():
+    """Import main once, on first use, instead of at collection time; skip if it cannot be imported"""
+    return pytest.importorskip("main")
+
+
+@pytest.fixture(scope="session")
+def collector_cls(main_mod):
+    """main.TSEDataCollector, resolved through the lazily imported main module"""
+    return main_mod.TSEDataCollector
+
+
+@pytest.fixture(scope="session")
+def sqlite_memory_db():
+    """One shared in-memory SQLiteDatabase with tables created once per session"""
+    from database.sqlite_db import SQLiteDatabase
+
+    # Outlives every per-test URL, so it gets a database of its own
+    with patch('database.base.DATABASE_URL', private_memory_url()):
+        db = SQLiteDatabase()
+    # Let SQLAlchemy own BEGIN so SAVEPOINTs nest inside the per-test transaction
+    db.engine.raw_connection().driver_connection.isolation_level = None
+    event.listen(db.engine, "begin", lambda conn: conn.exec_driver_sql("BEGIN"))
+    yield db
+    db.close()
+
+
+@lru_cache(maxsize=None)
+def module_available(name):
+    """Import a module once per session and remember whether it worked"""
+    try:
+        importlib.import_module(name)
+    except ImportError:
+        return False
+    return True
+
+
+def pytest_addoption(parser):
+    """Register --runslow; slow-marked tests are skipped without it"""
+    parser.addoption("--runslow", action="store_true", default=False, help="run tests marked slow")
+
+
+def pytest_collection_modifyitems(config, items):
+    """Turn requires_modules markers into skips and skip slow tests unless --runslow is given"""
+    skip_slow = None if config.getoption("--runslow") else pytest.mark.skip(reason="slow test; use --runslow to run")
+    for item in items:
+        if skip_slow is not None and "slow" in item.keywords:
+            item.add_marker(skip_slow)
+        for marker in item.iter_markers(name="requires_modules"):
+            missing = [name for name in marker.args if not module_available(name)]
+            if missing:
+                item.add_marker(pytest.mark.skip(reason=f"Modules not available: {', '.join(missing)}"))
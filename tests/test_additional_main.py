@@ -1,15 +1,14 @@
 import pytest
 from unittest.mock import patch, MagicMock
-from main import TSEDataCollector
 
 
 class TestTSEDataCollectorAdditional:
     @pytest.fixture
-    def collector(self):
-        with patch('main.SQLiteDatabase'):
-            collector = TSEDataCollector()
-            collector.api = MagicMock()  # Ensure api is a MagicMock for compatibility
-            yield collector
+    def collector(self, monkeypatch, collector_cls):
+        # Plain attribute swaps undone at teardown; no shared patch context across tests
+        monkeypatch.setattr('main.SQLiteDatabase', MagicMock)
+        monkeypatch.setattr('api.tse_api.TSEAPIClient', MagicMock)
+        return collector_cls()
 
     @patch('main.logger')
     def test_create_database_success(self, mock_logger, collector):
@@ -57,6 +56,7 @@ class TestTSEDataCollectorAdditional:
             session_mock.query.assert_called_once()
             session_mock.query().delete.assert_called_once()
             session_mock.commit.assert_called_once()
+            collector.db.clear_lookup_cache.assert_called_once()
             mock_collect_stocks.assert_called_once()
             mock_logger.info.assert_any_call("Rebuilding table: stocks")
             mock_logger.info.assert_any_call("Table stocks cleared")
@@ -196,10 +196,9 @@ class TestTSEDataCollectorAdditional:
         mock_logger.warning.assert_called_once_with("RI history update from scraping not fully implemented yet")
 
     @patch('main.logger')
-    @patch('main.time')
-    def test_run_full_update(self, mock_time, mock_logger, collector):
-        # Mock time for performance measurement
-        mock_time.time.return_value = 1000.0
+    def test_run_full_update(self, mock_logger, collector, fake_time):
+        # Deterministic clock: start and end readings are 0.5s apart
+        fake_time(0.5)
 
         # Mock all collection methods
         collector.collect_stocks = MagicMock(return_value=100)
@@ -221,7 +220,7 @@ class TestTSEDataCollectorAdditional:
         assert result == expected_result
 
         mock_logger.info.assert_any_call("Starting full data update")
-        mock_logger.info.assert_any_call("Full update completed in 0.00s")
+        mock_logger.info.assert_any_call("Full update completed in 0.50s")
 
     @patch('main.logger')
     @patch('main.time')
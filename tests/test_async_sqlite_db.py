@@ -0,0 +1,125 @@
+"""
+Tests for the optional aiosqlite-backed SQLite database
+"""
+
+import asyncio
+from datetime import date
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from database import async_sqlite_db
+from database.async_sqlite_db import AsyncSQLiteDatabase, _async_url
+from database.models import PriceHistory
+
+
+class TestAsyncSQLiteDatabase:
+    """Test async history writes"""
+
+    def test_async_url(self):
+        """Test the sync SQLite URL is mapped to the aiosqlite driver"""
+        assert _async_url('sqlite:///data/tse.db') == 'sqlite+aiosqlite:///data/tse.db'
+
+    def test_requires_aiosqlite(self):
+        """Test a clear ImportError when aiosqlite is not installed"""
+        with patch.object(async_sqlite_db, 'aiosqlite', None):
+            with pytest.raises(ImportError, match='aiosqlite'):
+                AsyncSQLiteDatabase()
+
+    def test_rejects_memory_database(self):
+        """Test in-memory URLs are rejected since the async engine cannot share them"""
+        with patch.object(async_sqlite_db, 'aiosqlite', object()), \
+                patch('database.async_sqlite_db.DATABASE_URL', 'sqlite:///:memory:'):
+            with pytest.raises(ValueError):
+                AsyncSQLiteDatabase()
+
+    def test_add_price_history_async_roundtrip(self, tmp_path):
+        """Test concurrent async inserts land in the same file the sync engine reads"""
+        pytest.importorskip('aiosqlite')
+        url = f"sqlite:///{tmp_path / 'async.db'}"
+        with patch('database.base.DATABASE_URL', url), patch('database.async_sqlite_db.DATABASE_URL', url):
+            db = AsyncSQLiteDatabase()
+
+        stock = db.add_stock({'ticker': 'ASYNC', 'name': 'Async', 'web_id': 'ASYNC_WEB', 'market': 'Bourse'})
+        rows = [
+            {'stock_id': stock.id, 'j_date': f'1402-01-{day:02d}', 'date': date(2023, 3, 20 + day)}
+            for day in range(1, 4)
+        ]
+
+        async def load():
+            try:
+                return await asyncio.gather(
+                    db.add_price_history_async(rows[:2]),
+                    db.add_price_history_async(rows),
+                )
+            finally:
+                await db.close_async()
+
+        counts = asyncio.run(load())
+
+        assert sum(counts) == 3
+        assert db.get_last_price_date(stock.id) == '1402-01-03'
+
+    def test_batch_insert_async_mixed_keys_uses_executemany(self):
+        """Test small batches whose rows differ in keys skip multi-row VALUES, like the sync path"""
+        db = AsyncSQLiteDatabase.__new__(AsyncSQLiteDatabase)
+        db.batch_size = 500
+        conn = MagicMock()
+        conn.execute = AsyncMock(return_value=MagicMock(rowcount=2))
+        session = MagicMock()
+        session.connection = AsyncMock(return_value=conn)
+        session.commit = AsyncMock()
+        db.AsyncSessionLocal = MagicMock()
+        db.AsyncSessionLocal.return_value.__aenter__ = AsyncMock(return_value=session)
+        db.AsyncSessionLocal.return_value.__aexit__ = AsyncMock(return_value=False)
+
+        rows = [{'stock_id': 1, 'j_date': '1402-01-01'}, {'stock_id': 1, 'j_date': '1402-01-02', 'volume': 10}]
+        result = asyncio.run(db.batch_insert_async(PriceHistory, rows))
+
+        assert result == 2
+        stmt, params = conn.execute.call_args.args
+        assert params == rows
+        session.commit.assert_awaited_once()
+
+    def test_batch_insert_async_mixed_keys_keeps_values(self, tmp_path):
+        """Test a mixed-key batch stores every row's own columns instead of NULLs from the first row's column set"""
+        pytest.importorskip('aiosqlite')
+        url = f"sqlite:///{tmp_path / 'async.db'}"
+        with patch('database.base.DATABASE_URL', url), patch('database.async_sqlite_db.DATABASE_URL', url):
+            db = AsyncSQLiteDatabase()
+
+        stock = db.add_stock({'ticker': 'MIX', 'name': 'Mix', 'web_id': 'MIX_WEB', 'market': 'Bourse'})
+        rows = [
+            {'stock_id': stock.id, 'j_date': '1402-01-01', 'date': date(2023, 3, 21)},
+            {'stock_id': stock.id, 'j_date': '1402-01-02', 'date': date(2023, 3, 22), 'volume': 10},
+        ]
+
+        async def load():
+            try:
+                return await db.add_price_history_async(rows)
+            finally:
+                await db.close_async()
+
+        assert asyncio.run(load()) == 2
+        with db.engine.connect() as conn:
+            volumes = conn.exec_driver_sql("SELECT volume FROM price_history ORDER BY j_date").scalars().all()
+        assert volumes == [None, 10]
+
+    def test_async_engine_applies_sqlite_pragmas(self, tmp_path):
+        """Test aiosqlite connections get the same PRAGMAs as the sync engine"""
+        pytest.importorskip('aiosqlite')
+        url = f"sqlite:///{tmp_path / 'async.db'}"
+        with patch('database.base.DATABASE_URL', url), patch('database.async_sqlite_db.DATABASE_URL', url):
+            db = AsyncSQLiteDatabase()
+
+        async def pragmas():
+            try:
+                async with db.async_engine.connect() as conn:
+                    return (
+                        (await conn.exec_driver_sql("PRAGMA journal_mode")).scalar(),
+                        (await conn.exec_driver_sql("PRAGMA synchronous")).scalar(),
+                    )
+            finally:
+                await db.close_async()
+
+        assert asyncio.run(pragmas()) == ('wal', 1)
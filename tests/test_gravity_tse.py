@@ -18,64 +18,209 @@ class TestGravityTSEIntegration:
 تست‌های حرفه‌ای برای api/Gravity_tse.py با استفاده از داده‌های واقعی TSE
 """
 
+import asyncio
+import os
+
 import pytest
 import pandas as pd
-from unittest.mock import patch, MagicMock
+import requests
+import urllib3
+from types import SimpleNamespace
+from pandas.testing import assert_frame_equal
+from unittest.mock import patch, MagicMock, Mock
+import api.Gravity_tse as gravity_tse
 from api.Gravity_tse import (
-    Get_MarketWatch, Build_Market_StockList, Get_60D_PriceHistory,
+    Get_MarketWatch, Get_MarketWatch_async, Build_Market_StockList, Get_60D_PriceHistory,
     Get_ShareHoldersInfo, Store_All_Data_To_DB
 )
 
+# با GRAVITY_FAST_TESTS=1 کل این ماژول رد می‌شود تا چرخه تست توسعه‌دهندگان utils سریع بماند
+pytestmark = pytest.mark.skipif(os.getenv("GRAVITY_FAST_TESTS") == "1", reason="fast test mode")
+
+
+# پاسخ‌های ساختگی TSE به صورت ثابت‌های ماژول؛ همه تست‌ها از همین اشیاء استفاده می‌کنند
+_IDS_TEXT = "123456789,1,2,3,4,5,6,7,8;987654321,9,10,11,12,13,14,15,16"
+
+# Format: @@[market watch data]@[order book data]
+# The code splits by '@' and reads index 2 (market data) and index 3 (order book)
+_MW_TEXT = "@@123456789,12345,نماد1,نام شرکت,12:30:00,1000,1100,1050,100,100000,10000000,950,1150,1000,50,1000,0,0,01,1200,900,1000000,300;987654321,67890,نماد2,نام شرکت2,12:31:00,2000,2100,2050,200,200000,20000000,1950,2150,2000,100,2000,0,0,02,2200,1800,2000000,303@123456789,1,10,20,1100,1050,5000,4000;987654321,1,15,25,2100,2050,7000,6000"
+
+_MW_JSON = {
+    'staticData': [
+        {'code': '01', 'name': 'بورس', 'type': 'IndustrialGroup'},
+        {'code': '02', 'name': 'فرابورس', 'type': 'IndustrialGroup'}
+    ]
+}
+
+_BOURSE_HTML = '''
+            <table class="table1">
+                <a href="?a=1&i=123456789" title="شرکت1">نماد1</a>
+                <a href="?a=1&i=987654321" title="شرکت2">نماد2</a>
+            </table>
+            '''
+
+
+@pytest.fixture(scope="module")
+def tse_mock_responses():
+    """پاسخ‌های سه درخواست Get_MarketWatch"""
+    return _IDS_TEXT, _MW_TEXT, _MW_JSON
+
+
+@pytest.fixture
+def network_fail(monkeypatch):
+    """شبیه‌سازی قطع شبکه برای requests و urllib3 با استثناهای خطای اتصال"""
+    monkeypatch.setattr(requests, "get", Mock(side_effect=requests.ConnectionError("Network error")))
+    pool = Mock()
+    pool.request.side_effect = urllib3.exceptions.ProtocolError("Network error")
+    monkeypatch.setattr(urllib3, "PoolManager", Mock(return_value=pool))
+
+
+def make_resp(text=None, json_data=None, data_text=None):
+    """پاسخ HTTP سبک با SimpleNamespace؛ فقط text، json() و data.decode() که کد استفاده می‌کند"""
+    return SimpleNamespace(
+        text=text,
+        json=lambda: json_data,
+        data=SimpleNamespace(decode=lambda *args, **kwargs: data_text),
+    )
+
+
+def resp_stream(responses, n_calls=1):
+    """جریان پاسخ‌های n فراخوانی Get_MarketWatch برای side_effect؛ هر پاسخ فقط هنگام فراخوانی requests.get ساخته می‌شود"""
+    ids_text, market_watch_text, sectors_json = responses
+    for _ in range(n_calls):
+        yield make_resp(text=ids_text)
+        yield make_resp(text=market_watch_text)
+        yield make_resp(json_data=sectors_json)
+
+
+def _check_market_watch_structure(results):
+    """بررسی ساختار و نوع ستون‌های DataFrame"""
+    df, _ = results[0]
+    assert df is not None
+    assert isinstance(df, pd.DataFrame)
+    assert not df.empty
+
+    # بررسی ستون‌های ضروری (Ticker is index)
+    assert df.index.name == 'Ticker'
+    for col in ['Name', 'Time', 'Open', 'Final', 'Close']:
+        assert col in df.columns
+
+    # بررسی مقادیر عددی
+    for col in ['Open', 'High', 'Low', 'Final', 'Volume', 'Value']:
+        if col in df.columns:
+            assert pd.api.types.is_numeric_dtype(df[col])
+
+    # هر ستون عددی باید در حافظه پیوسته باشد (نه برشی گام‌دار از بلوک سطری) تا تجمیع ستونی سریع بماند
+    numeric = df.select_dtypes('number')
+    strided = [col for col in numeric.columns if not numeric[col].to_numpy(copy=False).flags.c_contiguous]
+    assert not strided, f"MarketWatch numeric columns should be contiguous: {strided}"
+
+
+def _check_market_watch_rows(results):
+    """بررسی تک تک رکوردها"""
+    df, _ = results[0]
+    assert df is not None
+    assert isinstance(df, pd.DataFrame)
+
+    required_columns = ['Trade Type', 'Time', 'Open', 'High', 'Low', 'Final', 'Name']
+    for col in required_columns:
+        assert col in df.columns
+
+    head = df.head(10)  # تست 10 رکورد اول
+    # بررسی وجود نماد (index)
+    assert head.index.notna().all()
+    assert (head.index.astype(str).str.strip().str.len() > 0).all()
+
+    # بررسی مقادیر عددی قیمت؛ مقادیر خالی نادیده گرفته می‌شوند
+    prices = head[[field for field in ['Open', 'High', 'Low', 'Final'] if field in head.columns]]
+    assert prices.dtypes.apply(pd.api.types.is_numeric_dtype).all()
+    assert ((prices > 0) | prices.isna()).all().all()
+
+
+def _check_market_watch_persistence(results):
+    """بررسی پایداری داده‌ها در فراخوانی‌های متوالی"""
+    (df1, _), (df2, _) = results
+    assert df1 is not None and df2 is not None
+    assert not df1.empty and not df2.empty
+
+    # ورودی‌های ساختگی ثابت‌اند، پس هر اختلافی خطای واقعی است؛ ستون Download زمان اجرا را نگه می‌دارد
+    assert_frame_equal(
+        df1.drop(columns='Download', errors='ignore').sort_index(),
+        df2.drop(columns='Download', errors='ignore').sort_index(),
+        check_like=True,
+    )
+
 
 class TestGravityTSEIntegration:
     """تست‌های یکپارچه برای Gravity_tse.py با داده‌های واقعی"""
 
-    @pytest.mark.slow
-    @patch('requests.get')
-    def test_get_market_watch_real_data(self, mock_get):
-        """تست دریافت داده‌های واقعی MarketWatch"""
-        # Mock responses for HTTP requests
-        mock_response1 = MagicMock()
-        mock_response1.text = "123456789,1,2,3,4,5,6,7,8;987654321,9,10,11,12,13,14,15,16"
-        
-        mock_response2 = MagicMock()
-        # Format: @@[market watch data]@[order book data]
-        mock_response2.text = "@@123456789,12345,نماد1,نام شرکت,12:30:00,1000,1100,1050,100,100000,10000000,950,1150,1000,50,1000,0,0,01,1200,900,1000000,300;987654321,67890,نماد2,نام شرکت2,12:31:00,2000,2100,2050,200,200000,20000000,1950,2150,2000,100,2000,0,0,02,2200,1800,2000000,303@123456789,1,10,20,1100,1050,5000,4000;987654321,1,15,25,2100,2050,7000,6000"
-        
-        mock_response3 = MagicMock()
-        mock_response3.json.return_value = {
-            'staticData': [
-                {'code': '01', 'name': 'بورس', 'type': 'IndustrialGroup'},
-                {'code': '02', 'name': 'فرابورس', 'type': 'IndustrialGroup'}
-            ]
+    @pytest.fixture
+    def mock_get(self, monkeypatch):
+        """requests.get ساختگی که با monkeypatch نصب و در teardown همان fixture برداشته می‌شود"""
+        mock_get = Mock()
+        monkeypatch.setattr(requests, "get", mock_get)
+        return mock_get
+
+    @pytest.mark.parametrize("check, n_calls", [
+        pytest.param(_check_market_watch_structure, 1, id="structure", marks=pytest.mark.slow),
+        pytest.param(_check_market_watch_rows, 1, id="row-validation"),
+        pytest.param(_check_market_watch_persistence, 2, id="persistence"),
+    ])
+    def test_market_watch(self, mock_get, check, n_calls, tse_mock_responses):
+        """تست MarketWatch با پاسخ‌های ساختگی؛ هر حالت فقط بررسی‌های خودش را روی نتیجه فراخوانی‌ها انجام می‌دهد"""
+        mock_get.side_effect = resp_stream(tse_mock_responses, n_calls)
+
+        results = [Get_MarketWatch(save_excel=False) for _ in range(n_calls)]
+
+        check(results)
+
+    def test_market_watch_async_concurrent(self, monkeypatch, tse_mock_responses):
+        """تست Get_MarketWatch_async؛ هر سه درخواست هم‌زمان در جریان‌اند و خروجی مثل نسخه همگام است"""
+        ids_text, market_watch_text, sectors_json = tse_mock_responses
+        bodies = {
+            gravity_tse.__MarketWatch_RI_URL__: ids_text,
+            gravity_tse.__MarketWatch_Plus_URL__: market_watch_text,
         }
-        
-        mock_get.side_effect = [mock_response1, mock_response2, mock_response3]
-        
-        # تست دریافت داده‌های واقعی از TSE
-        df, df_ob = Get_MarketWatch(save_excel=False)
+        in_flight = {'now': 0, 'max': 0}
+
+        class FakeResponse:
+            def __init__(self, url):
+                self.url = url
+
+            async def __aenter__(self):
+                in_flight['now'] += 1
+                in_flight['max'] = max(in_flight['max'], in_flight['now'])
+                await asyncio.sleep(0.01)
+                in_flight['now'] -= 1
+                return self
+
+            async def __aexit__(self, *exc):
+                return False
+
+            async def text(self):
+                return bodies[self.url]
+
+            async def json(self, content_type=None):
+                return sectors_json
+
+        class FakeSession:
+            async def __aenter__(self):
+                return self
+
+            async def __aexit__(self, *exc):
+                return False
 
-        # بررسی ساختار داده‌ها
-        assert df is not None
-        assert isinstance(df, pd.DataFrame)
-        assert not df.empty
+            def get(self, url, headers=None):
+                return FakeResponse(url)
 
-        # بررسی ستون‌های ضروری (Ticker is index)
-        assert df.index.name == 'Ticker'
-        required_columns = ['Name', 'Time', 'Open', 'Final', 'Close']
-        for col in required_columns:
-            assert col in df.columns
+        monkeypatch.setattr(gravity_tse.aiohttp, "ClientSession", FakeSession)
 
-        # بررسی مقادیر عددی
-        numeric_columns = ['Open', 'High', 'Low', 'Final', 'Volume', 'Value']
-        for col in numeric_columns:
-            if col in df.columns:
-                assert pd.api.types.is_numeric_dtype(df[col])
+        df, ob_df = asyncio.run(Get_MarketWatch_async(save_excel=False))
 
-        print(f"MarketWatch data collected: {len(df)} records")
+        assert in_flight['max'] == 3
+        _check_market_watch_rows([(df, ob_df)])
 
     @pytest.mark.slow
-    @patch('requests.get')
     @patch('urllib3.PoolManager')
     def test_build_market_stock_list_real_data(self, mock_pool, mock_get):
         """تست ساخت لیست سهام با داده‌های واقعی"""
@@ -84,13 +229,7 @@ class TestGravityTSEIntegration:
         mock_pool.return_value = mock_http
         
         # Mock response for bourse stock list
-        mock_response_bourse = MagicMock()
-        mock_response_bourse.data.decode.return_value = '''
-            <table class="table1">
-                <a href="?a=1&i=123456789" title="شرکت1">نماد1</a>
-                <a href="?a=1&i=987654321" title="شرکت2">نماد2</a>
-            </table>
-            '''
+        mock_response_bourse = make_resp(data_text=_BOURSE_HTML)
         mock_http.request.return_value = mock_response_bourse
         
         stock_list = Build_Market_StockList(
@@ -158,50 +297,61 @@ class TestGravityTSEIntegration:
             print(f"Store_All_Data_To_DB integration test warning: {e}")
             pytest.skip(f"Integration test skipped due to: {e}")
 
-    @patch('requests.get')
-    def test_market_watch_data_structure_validation(self, mock_get):
-        """تست اعتبار ساختار داده‌های MarketWatch"""
-        # Mock responses for HTTP requests
-        mock_response1 = MagicMock()
-        mock_response1.text = "123456789,1,2,3,4,5,6,7,8;987654321,9,10,11,12,13,14,15,16"
-        
-        mock_response2 = MagicMock()
-        # Format: @@[market watch data]@[order book data]
-        # Note: The code splits by '@' and accesses index 2 for market data and index 3 for order book data
-        # So we need at least 4 parts separated by '@' (empty, empty, market, orderbook)
-        mock_response2.text = "@@123456789,12345,نماد1,نام شرکت,12:30:00,1000,1100,1050,100,100000,10000000,950,1150,1000,50,1000,0,0,1,1200,900,1000000,300;987654321,67890,نماد2,نام شرکت2,12:31:00,2000,2100,2050,200,200000,20000000,1950,2150,2000,100,2000,0,0,2,2200,1800,2000000,303@123456789,1,10,20,1100,1050,5000,4000;987654321,1,15,25,2100,2050,7000,6000"
-        
-        mock_response3 = MagicMock()
-        mock_response3.json.return_value = {
-            'staticData': [
-                {'code': '01', 'name': 'بورس', 'type': 'IndustrialGroup'},
-                {'code': '02', 'name': 'فرابورس', 'type': 'IndustrialGroup'}
-            ]
-        }
-        
-        mock_get.side_effect = [mock_response1, mock_response2, mock_response3]
-        
-        df, df_ob = Get_MarketWatch(save_excel=False)
-
-        assert df is not None
-        assert isinstance(df, pd.DataFrame)
-
-        # بررسی تک تک رکوردها
-        for idx, row in df.head(10).iterrows():  # تست 10 رکورد اول
-            # بررسی وجود نماد (index)
-            assert idx and len(str(idx).strip()) > 0
-
-            # بررسی وجود ستون‌های ضروری
-            required_columns = ['Trade Type', 'Time', 'Open', 'High', 'Low', 'Final', 'Name']
-            for col in required_columns:
-                assert col in df.columns
-
-            # بررسی مقادیر عددی قیمت
-            price_fields = ['Open', 'High', 'Low', 'Final']
-            for field in price_fields:
-                if field in row and pd.notna(row[field]):
-                    assert isinstance(row[field], (int, float))
-                    assert row[field] > 0
+    def test_store_all_data_to_db_uses_bulk_mappings(self, monkeypatch, mock_session):
+        """تست اینکه سهامداران با یک bulk_insert_mappings از لیست دیکشنری‌ها ذخیره می‌شوند، نه شیء ORM برای هر سطر"""
+        import database.sqlite_db
+        import database.postgres_db
+        from database.models import Shareholder
+
+        df_sh = pd.DataFrame({
+            'Ticker': ['نماد1'] * 3,
+            'Market': ['بورس'] * 3,
+            'Name': ['سهامدار1', 'سهامدار2', 'سهامدار3'],
+            'ShareNo': [1000, 2000, 3000],
+            'SharePct': [1.5, 2.5, 3.5],
+            'Changes': [0, 10, -10],
+        })
+        monkeypatch.setattr(gravity_tse, "Get_MarketWatch", Mock(return_value=(None, None)))
+        monkeypatch.setattr(gravity_tse, "Build_Market_StockList", Mock(return_value=['نماد1']))
+        monkeypatch.setattr(gravity_tse, "Get_60D_PriceHistory", Mock())
+        monkeypatch.setattr(gravity_tse, "Get_ShareHoldersInfo", Mock(return_value=df_sh))
+        # هر دو دیتابیس همین session را می‌گیرند؛ پس هر فراخوانی دو بار (SQLite و PostgreSQL) دیده می‌شود
+        monkeypatch.setattr(database.sqlite_db, "get_sqlite_session", Mock(return_value=mock_session))
+        monkeypatch.setattr(database.postgres_db, "get_postgres_session", Mock(return_value=mock_session))
+
+        Store_All_Data_To_DB()
+
+        assert not mock_session.add.called
+        assert not mock_session.bulk_save_objects.called
+        assert mock_session.bulk_insert_mappings.call_count == 2
+        for call in mock_session.bulk_insert_mappings.call_args_list:
+            model, payload = call[0]
+            assert model is Shareholder
+            assert isinstance(payload, list) and len(payload) == len(df_sh)
+            assert payload[1]['name'] == 'سهامدار2' and payload[1]['share_no'] == 2000
+        assert mock_session.commit.call_count == 2
+        assert mock_session.close.call_count == 2
+
+    def test_store_records_reports_each_backend(self, monkeypatch):
+        """تست اینکه شکست PostgreSQL پس از commit در SQLite، rollback و لاگ می‌شود و نتیجه هر دیتابیس جدا گزارش می‌شود"""
+        import database.sqlite_db
+        import database.postgres_db
+        from database.models import Shareholder
+
+        sqlite_session, postgres_session = MagicMock(), MagicMock()
+        postgres_session.bulk_insert_mappings.side_effect = Exception("connection refused")
+        monkeypatch.setattr(database.sqlite_db, "get_sqlite_session", Mock(return_value=sqlite_session))
+        monkeypatch.setattr(database.postgres_db, "get_postgres_session", Mock(return_value=postgres_session))
+
+        with patch.object(gravity_tse, "logger") as mock_logger:
+            results = getattr(gravity_tse, "__Store_Records__")(Shareholder, [{'name': 'سهامدار1'}])
+
+        assert results == {'sqlite': True, 'postgresql': False}
+        sqlite_session.commit.assert_called_once()
+        postgres_session.commit.assert_not_called()
+        postgres_session.rollback.assert_called_once()
+        postgres_session.close.assert_called_once()
+        assert 'postgresql' in mock_logger.error.call_args[0][0]
 
     @pytest.mark.slow
     def test_price_history_data_consistency(self):
@@ -210,63 +360,25 @@ class TestGravityTSEIntegration:
         # Better tested as end-to-end with real network or dedicated integration test environment
         pytest.skip("Integration test for price history consistency skipped - requires network access or complex nested mocking")
 
-    def test_error_handling_network_issues(self):
+    @pytest.mark.parametrize("fn, kwargs, may_raise", [
+        pytest.param(Get_MarketWatch, {'save_excel': False}, False, id="market-watch"),
+        pytest.param(
+            Build_Market_StockList,
+            {'detailed_list': False, 'show_progress': False, 'save_excel': False, 'save_csv': False},
+            True,
+            id="stock-list",
+        ),
+    ])
+    def test_error_handling_network_issues(self, network_fail, fn, kwargs, may_raise):
         """تست مدیریت خطاهای شبکه"""
-        # شبیه‌سازی خطای شبکه
-        with patch('requests.get') as mock_get, patch('urllib3.PoolManager') as mock_pool:
-            mock_get.side_effect = Exception("Network error")
-            mock_pool.return_value.request.side_effect = Exception("Network error")
-
-            # تست MarketWatch
-            df, ob_df = Get_MarketWatch(save_excel=False)
-            assert df is None or df.empty
-            assert ob_df is None or ob_df.empty
-
-            # تست Stock List
-            try:
-                stock_list = Build_Market_StockList(
-                    detailed_list=False,
-                    show_progress=False,
-                    save_excel=False,
-                    save_csv=False
-                )
-                assert stock_list is None or len(stock_list) == 0
-            except Exception:
-                # If it raises exception, consider it as error handling working
-                pass
-
-    @patch('requests.get')
-    def test_data_persistence_across_calls(self, mock_get):
-        """تست پایداری داده‌ها در فراخوانی‌های متوالی"""
-        # Mock responses for HTTP requests
-        mock_response1 = MagicMock()
-        mock_response1.text = "123456789,1,2,3,4,5,6,7,8;987654321,9,10,11,12,13,14,15,16"
-        
-        mock_response2 = MagicMock()
-        mock_response2.text = "@@123456789,12345,نماد1,نام شرکت,12:30:00,1000,1100,1050,100,100000,10000000,950,1150,1000,50,1000,0,0,1,1200,900,1000000,300;987654321,67890,نماد2,نام شرکت2,12:31:00,2000,2100,2050,200,200000,20000000,1950,2150,2000,100,2000,0,0,2,2200,1800,2000000,303@123456789,1,10,20,1050,1150,1000,2000;987654321,1,30,40,2050,2150,3000,4000"
-        
-        mock_response3 = MagicMock()
-        mock_response3.json.return_value = {
-            'staticData': [
-                {'code': '01', 'name': 'بورس', 'type': 'IndustrialGroup'},
-                {'code': '02', 'name': 'فرابورس', 'type': 'IndustrialGroup'}
-            ]
-        }
-        
-        mock_get.side_effect = [mock_response1, mock_response2, mock_response3] * 2  # For two calls
-        
-        # فراخوانی اول
-        df1, ob_df1 = Get_MarketWatch(save_excel=False)
-
-        # فراخوانی دوم
-        df2, ob_df2 = Get_MarketWatch(save_excel=False)
-
-        assert df1 is not None and df2 is not None
-        assert not df1.empty and not df2.empty
-
-        # بررسی consistency تعداد رکوردها (با tolerance)
-        count_diff = abs(len(df1) - len(df2))
-        assert count_diff <= 10, f"Data count inconsistency: {len(df1)} vs {len(df2)}"
-
-        # بررسی consistency ساختار
-        assert set(df1.columns) == set(df2.columns)
+        try:
+            result = fn(**kwargs)
+        except Exception:
+            if not may_raise:
+                raise
+            # If it raises exception, consider it as error handling working
+            return
+
+        # Get_MarketWatch یک تاپل (df, ob_df) و Build_Market_StockList یک لیست/DataFrame برمی‌گرداند
+        for part in (result if isinstance(result, tuple) else (result,)):
+            assert part is None or len(part) == 0
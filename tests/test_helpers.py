@@ -1,14 +1,15 @@
 import pytest
-import tempfile
-import os
 import json
+import tracemalloc
+import types
 from datetime import datetime
+import numpy as np
 from utils.helpers import (
     clean_persian_text, normalize_ticker, parse_jalali_date, format_jalali_date,
     validate_web_id, validate_sector_code, safe_float_convert, safe_int_convert,
     calculate_percentage_change, group_data_by_date, filter_data_by_date_range,
     calculate_moving_average, detect_outliers, save_json_to_file, load_json_from_file,
-    chunk_list, merge_dicts, get_nested_value
+    chunk_list, merge_dicts, get_nested_value, jalali_to_datetime64, jalali_to_gregorian_arr
 )
 
 
@@ -93,26 +94,28 @@ class TestValidation:
 
 
 class TestTypeConversion:
-    def test_safe_float_convert_valid(self):
-        assert safe_float_convert("123.45") == 123.45
-        assert safe_float_convert("123,456.78") == 123456.78
-        assert safe_float_convert(123.45) == 123.45
-
-    def test_safe_float_convert_invalid(self):
-        assert safe_float_convert("") is None
-        assert safe_float_convert("abc") is None
-        assert safe_float_convert(None) is None
-
-    def test_safe_int_convert_valid(self):
-        assert safe_int_convert("123") == 123
-        assert safe_int_convert("123.0") == 123
-        assert safe_int_convert("123,456") == 123456
-
-    def test_safe_int_convert_invalid(self):
-        assert safe_int_convert("") is None
-        assert safe_int_convert("abc") is None
-        assert safe_int_convert("12.34") is None
-        assert safe_int_convert(None) is None
+    @pytest.mark.parametrize("value,expected", [
+        ("123.45", 123.45),
+        ("123,456.78", 123456.78),
+        (123.45, 123.45),
+        ("", None),
+        ("abc", None),
+        (None, None),
+    ])
+    def test_safe_float_convert(self, value, expected):
+        assert safe_float_convert(value) == expected
+
+    @pytest.mark.parametrize("value,expected", [
+        ("123", 123),
+        ("123.0", 123),
+        ("123,456", 123456),
+        ("", None),
+        ("abc", None),
+        ("12.34", None),
+        (None, None),
+    ])
+    def test_safe_int_convert(self, value, expected):
+        assert safe_int_convert(value) == expected
 
 
 class TestCalculations:
@@ -120,6 +123,40 @@ class TestCalculations:
         assert calculate_percentage_change(100, 120) == 20.0
         assert calculate_percentage_change(100, 80) == -20.0
 
+    @pytest.mark.parametrize("old,new,expected", [
+        (100, 120, 20.0),
+        (100, 80, -20.0),
+        (100, 100, 0.0),
+        (100, 0, -100.0),
+        (100, 200, 100.0),
+        (200, 180, -10.0),
+        (50, 60, 20.0),
+        (50, 25, -50.0),
+        (1, 3, 200.0),
+        (4, 5, 25.0),
+        (8, 6, -25.0),
+        (10.5, 21.0, 100.0),
+        (0.5, 0.75, 50.0),
+        (1000, 1001, 0.1),
+        (1000, 999, -0.1),
+        (-100, -120, 20.0),
+        (-100, -50, -50.0),
+        (12500, 13125, 5.0),
+        (12500, 11875, -5.0),
+        (3, 4, 100 / 3),
+        (7, 0.7, -90.0),
+        (2.5e6, 2.625e6, 5.0),
+    ])
+    def test_calculate_percentage_change_sweep(self, old, new, expected):
+        assert calculate_percentage_change(old, new) == pytest.approx(expected)
+
+    def test_calculate_percentage_change_vectorized(self):
+        old = np.array([100, 200, 50, 0])
+        new = np.array([120, 180, 60, 10])
+        result = calculate_percentage_change(old, new)
+        assert isinstance(result, np.ndarray)
+        np.testing.assert_allclose(result, [20.0, -10.0, 20.0, np.nan])
+
     def test_calculate_percentage_change_zero_division(self):
         assert calculate_percentage_change(0, 100) is None
 
@@ -130,18 +167,23 @@ class TestCalculations:
     def test_calculate_moving_average_normal(self):
         data = [1, 2, 3, 4, 5, 6, 7]
         result = calculate_moving_average(data, 3)
-        expected = [None, None, 2.0, 3.0, 4.0, 5.0, 6.0]
-        assert result == expected
+        expected = np.array([np.nan, np.nan, 2., 3., 4., 5., 6.])
+        np.testing.assert_array_equal(np.asarray(result, dtype=float), expected)
 
     def test_calculate_moving_average_small_data(self):
         data = [1, 2]
         result = calculate_moving_average(data, 5)
-        assert result == [None, None]
+        np.testing.assert_array_equal(np.asarray(result, dtype=float), [np.nan, np.nan])
 
     def test_detect_outliers_normal(self):
         data = [1, 2, 3, 4, 5, 100]  # 100 is an outlier
-        result = detect_outliers(data, 2.0)
-        assert result[-1] is True  # Last element should be detected as outlier
+        arr = np.asarray(detect_outliers(data, 2.0))
+        np.testing.assert_array_equal(arr, np.array([False, False, False, False, False, True]))
+
+    def test_detect_outliers_large_data(self):
+        data = list(range(10000)) + [1_000_000]
+        arr = np.asarray(detect_outliers(data, 2.0))
+        assert arr[-1] and not arr[:-1].any()
 
     def test_detect_outliers_no_variance(self):
         data = [5, 5, 5, 5]
@@ -151,7 +193,7 @@ class TestCalculations:
     def test_detect_outliers_small_data(self):
         data = [1]
         result = detect_outliers(data, 2.0)
-        assert result == [False]
+        np.testing.assert_array_equal(result, [False])
 
 
 class TestDataProcessing:
@@ -174,6 +216,27 @@ class TestDataProcessing:
         assert "2023-01-01" in result
         assert "2023-01-02" in result
 
+    def test_group_data_by_date_preserves_order(self):
+        data = [{"date": f"d{i}", "value": i} for i in range(1000)]
+        result = group_data_by_date(data)
+        assert list(result.keys()) == [f"d{i}" for i in range(1000)]
+        assert type(result) is dict
+
+    def test_group_data_by_date_single_lookup_per_item(self):
+        class CountingStr(str):
+            hash_calls = 0
+
+            def __hash__(self):
+                CountingStr.hash_calls += 1
+                return str.__hash__(self)
+
+        data = [{"date": CountingStr(f"d{i % 500}"), "value": i} for i in range(1000)]
+        result = group_data_by_date(data)
+        assert len(result) == 500
+        assert all(len(items) == 2 for items in result.values())
+        # One lookup per item plus one insert per new date; no separate membership test
+        assert CountingStr.hash_calls == len(data) + len(result)
+
     def test_filter_data_by_date_range(self):
         data = [
             {"date": "1402/01/01", "value": 1},
@@ -190,13 +253,31 @@ class TestDataProcessing:
 
     def test_chunk_list(self):
         data = [1, 2, 3, 4, 5, 6, 7]
-        result = chunk_list(data, 3)
+        result = list(chunk_list(data, 3))
         assert result == [[1, 2, 3], [4, 5, 6], [7]]
 
     def test_chunk_list_empty(self):
-        result = chunk_list([], 3)
+        result = list(chunk_list([], 3))
         assert result == []
 
+    @pytest.mark.parametrize("chunk_size", [0, -1])
+    def test_chunk_list_invalid_chunk_size(self, chunk_size):
+        with pytest.raises(ValueError):
+            chunk_list([1, 2, 3], chunk_size)
+
+    def test_chunk_list_is_lazy(self):
+        chunks = chunk_list(iter(range(10**6)), 100)
+        assert isinstance(chunks, types.GeneratorType)
+        assert next(chunks) == list(range(100))
+
+        tracemalloc.start()
+        try:
+            assert next(chunks) == list(range(100, 200))
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        assert peak < 10000
+
     def test_merge_dicts(self):
         d1 = {"a": 1, "b": 2}
         d2 = {"b": 3, "c": 4}
@@ -219,25 +300,37 @@ class TestDataProcessing:
         assert result == "default"
 
 
-class TestFileOperations:
-    def test_save_and_load_json(self):
-        test_data = {"key": "value", "number": 123, "list": [1, 2, 3]}
+class TestJalaliVectorized:
+    def test_jalali_to_datetime64(self):
+        result = jalali_to_datetime64([1402, 1403, 1375, 1403], [1, 12, 10, 7], [1, 30, 11, 1])
+        expected = np.array(['2023-03-21', '2025-03-20', '1996-12-31', '2024-09-22'], dtype='datetime64[D]')
+        assert result.dtype == np.dtype('datetime64[D]')
+        assert (result == expected).all()
 
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False) as f:
-            temp_path = f.name
+    def test_jalali_to_gregorian_arr(self):
+        gy, gm, gd = jalali_to_gregorian_arr(np.array([1402, 1399]), np.array([1, 12]), np.array([1, 30]))
+        assert gy.tolist() == [2023, 2021]
+        assert gm.tolist() == [3, 3]
+        assert gd.tolist() == [21, 20]
 
-        try:
-            # Test save
-            result = save_json_to_file(test_data, temp_path)
-            assert result is True
+    def test_jalali_to_gregorian_arr_empty(self):
+        gy, gm, gd = jalali_to_gregorian_arr([], [], [])
+        assert gy.size == gm.size == gd.size == 0
 
-            # Test load
-            loaded_data = load_json_from_file(temp_path)
-            assert loaded_data == test_data
 
-        finally:
-            if os.path.exists(temp_path):
-                os.unlink(temp_path)
+class TestFileOperations:
+    def test_save_and_load_json(self, tmp_path):
+        test_data = {"key": "value", "number": 123, "list": [1, 2, 3]}
+        temp_path = tmp_path / "test.json"
+
+        # Test save
+        result = save_json_to_file(test_data, temp_path)
+        assert result is True
+        assert temp_path.read_bytes()[0:1] == b'{'
+
+        # Test load
+        loaded_data = load_json_from_file(temp_path)
+        assert loaded_data == test_data
 
     def test_save_json_invalid_path(self):
         # Use a path with invalid characters that cannot be created
@@ -249,14 +342,9 @@ class TestFileOperations:
         result = load_json_from_file("C:\\invalid\\path\\with\\invalid<chars>:file.json")
         assert result is None
 
-    def test_load_json_invalid_json(self):
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False) as f:
-            f.write("invalid json content")
-            temp_path = f.name
+    def test_load_json_invalid_json(self, tmp_path):
+        temp_path = tmp_path / "invalid.json"
+        temp_path.write_text("invalid json content", encoding="utf-8")
 
-        try:
-            result = load_json_from_file(temp_path)
-            assert result is None
-        finally:
-            if os.path.exists(temp_path):
-                os.unlink(temp_path)
+        result = load_json_from_file(temp_path)
+        assert result is None
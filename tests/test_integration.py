@@ -9,32 +9,26 @@ from unittest.mock import patch, MagicMock
 class TestIntegration:
     """Basic integration tests"""
 
+    @pytest.mark.requires_modules("main")
     def test_import_main(self):
         """Test that main module can be imported"""
-        try:
-            import main
-            assert main is not None
-        except ImportError:
-            pytest.skip("Main module not available")
+        import main
+        assert main is not None
 
+    @pytest.mark.requires_modules("database.sqlite_db", "database.postgres_db", "database.base")
     def test_import_database(self):
         """Test that database modules can be imported"""
-        try:
-            from database import sqlite_db, postgres_db, base
-            assert sqlite_db is not None
-            assert postgres_db is not None
-            assert base is not None
-        except ImportError:
-            pytest.skip("Database modules not available")
+        from database import sqlite_db, postgres_db, base
+        assert sqlite_db is not None
+        assert postgres_db is not None
+        assert base is not None
 
+    @pytest.mark.requires_modules("api.parsers", "api.scraper", "api.utils")
     def test_import_api_modules(self):
         """Test that API modules can be imported"""
-        try:
-            import api.parsers
-            import api.scraper
-            import api.utils
-            assert api.parsers is not None
-            assert api.scraper is not None
-            assert api.utils is not None
-        except ImportError:
-            pytest.skip("API modules not available")
+        import api.parsers
+        import api.scraper
+        import api.utils
+        assert api.parsers is not None
+        assert api.scraper is not None
+        assert api.utils is not None
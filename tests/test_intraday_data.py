@@ -2,9 +2,14 @@
 تست‌های حرفه‌ای برای api/intraday_data.py با استفاده از داده‌های واقعی TSE
 """
 
+import re
+
 import pytest
+import numpy as np
 import pandas as pd
 import jdatetime
+from concurrent.futures import ThreadPoolExecutor
+from types import MappingProxyType
 from unittest.mock import patch, MagicMock
 from api.intraday_data import (
     get_intraday_trades_scraping,
@@ -13,100 +18,163 @@ from api.intraday_data import (
     get_trade_summary_scraping
 )
 
+# الگوی زمان HH:MM:SS یک بار در سطح ماژول کامپایل می‌شود
+_TIME_RE = re.compile(r'^\d{2}:\d{2}:\d{2}$')
+
+
+@pytest.fixture(scope="module")
+def symbols():
+    """نمادهای واقعی TSE برای تست؛ یک بار برای کل ماژول ساخته می‌شود"""
+    return MappingProxyType({
+        'web_id': '65883838195688438',  # نماد نمونه
+        'symbol': 'فولاد'  # نماد نمونه
+    })
+
+
+@pytest.fixture(scope="module")
+def trade_payload():
+    """پاسخ ساختگی معاملات لحظه‌ای که بین تست‌ها مشترک است"""
+    mock_response = MagicMock()
+    mock_response.text = (
+        '08:30:00,1000,10,10000,123,456;08:31:00,1010,5,5050,124,457'
+    )
+    return mock_response
+
+
+def _check_trades_columns_and_values(df, summary):
+    """بررسی ستون‌ها و مثبت بودن مقادیر معاملات"""
+    assert isinstance(df, pd.DataFrame)
+    assert not df.empty
+    expected_columns = ['time', 'price', 'volume', 'value', 'buyer_id', 'seller_id']
+    for col in expected_columns:
+        assert col in df.columns
+    assert (df['price'] > 0).all()
+    assert (df['volume'] > 0).all()
+    assert (df['value'] > 0).all()
+
+
+def _check_trade_summary_fields(df, summary):
+    """بررسی کلیدها و نوع مقادیر خلاصه معاملات"""
+    assert isinstance(summary, dict)
+    expected_keys = ['total_trades', 'total_volume', 'total_value',
+                     'avg_price', 'max_price', 'min_price']
+    for key in expected_keys:
+        assert key in summary
+        assert isinstance(summary[key], (int, float))
+        assert summary[key] >= 0
+
+
+def _check_trade_summary_calculation(df, summary):
+    """بررسی محاسبات خلاصه معاملات در برابر DataFrame معاملات"""
+    assert summary is not None
+    assert summary['total_trades'] == len(df)
+    # هر ستون یک بار به float64 تبدیل و برای همه تجمیع‌ها استفاده می‌شود
+    volume = df['volume'].to_numpy(dtype=np.float64, copy=False)
+    value = df['value'].to_numpy(dtype=np.float64, copy=False)
+    price = df['price'].to_numpy(dtype=np.float64, copy=False)
+    np.testing.assert_allclose(
+        [summary['total_volume'], summary['total_value'], summary['avg_price'],
+         summary['max_price'], summary['min_price']],
+        [volume.sum(), value.sum(), price.mean(), price.max(), price.min()],
+        rtol=0, atol=0.01,
+    )
+
+
+def _check_data_consistency_across_functions(df, summary):
+    """بررسی consistency داده‌ها بین توابع مختلف"""
+    assert summary['total_trades'] == len(df)
+    total_volume = df['volume'].astype(float).sum()
+    assert abs(summary['total_volume'] - total_volume) < 0.01
+
+
+def _check_data_types_and_ranges(df, summary):
+    """بررسی نوع داده‌ها و محدوده مقادیر"""
+    assert pd.api.types.is_object_dtype(df['time'])
+    assert pd.api.types.is_numeric_dtype(df['price'])
+    assert pd.api.types.is_numeric_dtype(df['volume'])
+    assert pd.api.types.is_numeric_dtype(df['value'])
+    assert (df['price'] > 0).all()
+    assert (df['volume'] > 0).all()
+    assert (df['value'] > 0).all()
+    assert all(_TIME_RE.match(t) for t in df['time'].to_numpy())
+
+
+@pytest.fixture(scope="module")
+def pool():
+    """ThreadPoolExecutor مشترک برای تست‌های هم‌زمانی؛ نخ‌ها یک بار برای کل ماژول ساخته می‌شوند"""
+    executor = ThreadPoolExecutor(max_workers=3)
+    yield executor
+    executor.shutdown()
+
+
+@pytest.fixture(scope="class")
+def trades_get(trade_payload):
+    """requests.get ساختگی که فقط یک بار برای کل کلاس نصب و در پایان آن برداشته می‌شود"""
+    patcher = patch('requests.get', return_value=trade_payload)
+    yield patcher.start()
+    patcher.stop()
+
+
+@pytest.mark.usefixtures("trades_get")
+class TestIntradayTradeChecks:
+    """بررسی‌های مختلف روی یک پاسخ ساختگی معاملات"""
+
+    @pytest.mark.parametrize("check", [
+        pytest.param(_check_trades_columns_and_values, marks=pytest.mark.slow, id="columns-and-values"),
+        pytest.param(_check_trade_summary_fields, marks=pytest.mark.slow, id="summary-fields"),
+        pytest.param(_check_trade_summary_calculation, id="summary-calculation"),
+        pytest.param(_check_data_consistency_across_functions, id="consistency"),
+        pytest.param(_check_data_types_and_ranges, id="types-and-ranges"),
+    ])
+    def test_trades(self, symbols, check):
+        """تست معاملات لحظه‌ای و خلاصه آن (mocked)"""
+        df = get_intraday_trades_scraping(symbols['web_id'])
+        summary = get_trade_summary_scraping(symbols['web_id'])
+        check(df, summary)
+
 
 class TestIntradayDataIntegration:
     """تست‌های یکپارچه برای Intraday Data با داده‌های واقعی"""
 
-    def setup_method(self):
-        """تنظیمات اولیه برای هر تست"""
-        # نمادهای واقعی TSE برای تست
-        self.test_symbols = {
-            'web_id': '65883838195688438',  # نماد نمونه
-            'symbol': 'فولاد'  # نماد نمونه
-        }
-
-    @pytest.mark.slow
-    @patch('requests.get')
-    def test_get_intraday_trades_real_data(self, mock_get):
-        """تست دریافت معاملات لحظه‌ای با داده‌های واقعی (mocked)"""
-        # Mock response for intraday trades
-        mock_response = MagicMock()
-        mock_response.text = (
-            '08:30:00,1000,10,10000,123,456;08:31:00,1010,5,5050,124,457'
-        )
-        mock_get.return_value = mock_response
-        df = get_intraday_trades_scraping(self.test_symbols['web_id'])
-        assert isinstance(df, pd.DataFrame)
-        assert not df.empty
-        expected_columns = ['time', 'price', 'volume', 'value', 'buyer_id', 'seller_id']
-        for col in expected_columns:
-            assert col in df.columns
-        assert (df['price'] > 0).all()
-        assert (df['volume'] > 0).all()
-        assert (df['value'] > 0).all()
-
     @pytest.mark.slow
     @patch('requests.get')
-    def test_get_intraday_trades_with_date(self, mock_get):
+    def test_get_intraday_trades_with_date(self, mock_get, symbols, trade_payload):
         """تست دریافت معاملات با تاریخ مشخص (mocked)"""
         today = jdatetime.date.today().strftime('%Y%m%d')
-        mock_response = MagicMock()
-        mock_response.text = (
-            '08:30:00,1000,10,10000,123,456;08:31:00,1010,5,5050,124,457'
-        )
-        mock_get.return_value = mock_response
-        df = get_intraday_trades_scraping(self.test_symbols['web_id'], today)
+        mock_get.return_value = trade_payload
+        df = get_intraday_trades_scraping(symbols['web_id'], today)
         assert isinstance(df, pd.DataFrame)
         assert not df.empty
         print(f"Trades for {today}: {len(df)} records")
 
     @pytest.mark.slow
     @patch('requests.get')
-    def test_get_order_book_real_data(self, mock_get):
+    def test_get_order_book_real_data(self, mock_get, symbols):
         """تست دریافت Order Book با داده‌های واقعی (mocked)"""
         mock_response = MagicMock()
         mock_response.text = (
             '65883838195688438,1,10,20,1000,1010,100,200'
         )
         mock_get.return_value = mock_response
-        order_book = get_order_book_scraping(self.test_symbols['web_id'])
+        order_book = get_order_book_scraping(symbols['web_id'])
         assert isinstance(order_book, list)
         assert len(order_book) > 0
         print(f"Order book entries: {len(order_book)}")
 
     @pytest.mark.slow
     @patch('requests.get')
-    def test_get_real_time_price_real_data(self, mock_get):
+    def test_get_real_time_price_real_data(self, mock_get, symbols):
         """تست دریافت قیمت لحظه‌ای با داده‌های واقعی (mocked)"""
         mock_response = MagicMock()
         mock_response.text = (
             '1010,1005,1015,1000,1012,1008'
         )
         mock_get.return_value = mock_response
-        price_data = get_real_time_price_scraping(self.test_symbols['web_id'])
+        price_data = get_real_time_price_scraping(symbols['web_id'])
         assert isinstance(price_data, list)
         assert len(price_data) > 0
         print(f"Real-time price data: {len(price_data)} fields")
 
-    @pytest.mark.slow
-    @patch('requests.get')
-    def test_get_trade_summary_real_data(self, mock_get):
-        """تست دریافت خلاصه معاملات با داده‌های واقعی (mocked)"""
-        mock_response = MagicMock()
-        mock_response.text = (
-            '08:30:00,1000,10,10000,123,456;08:31:00,1010,5,5050,124,457'
-        )
-        mock_get.return_value = mock_response
-        summary = get_trade_summary_scraping(self.test_symbols['web_id'])
-        assert isinstance(summary, dict)
-        expected_keys = ['total_trades', 'total_volume', 'total_value',
-                       'avg_price', 'max_price', 'min_price']
-        for key in expected_keys:
-            assert key in summary
-            assert isinstance(summary[key], (int, float))
-            assert summary[key] >= 0
-        print(f"Trade summary: {summary}")
-
     def test_invalid_symbol_handling(self):
         """تست مدیریت نماد نامعتبر"""
         # نماد غیر عددی باید None برگرداند
@@ -122,73 +190,35 @@ class TestIntradayDataIntegration:
         result = get_trade_summary_scraping("invalid_symbol")
         assert result is None
 
-    @patch('requests.get')
-    def test_trade_summary_calculation(self, mock_get):
-        """تست محاسبات خلاصه معاملات (mocked)"""
-        mock_response = MagicMock()
-        mock_response.text = (
-            '08:30:00,1000,10,10000,123,456;08:31:00,1010,5,5050,124,457'
-        )
-        mock_get.return_value = mock_response
-        df = get_intraday_trades_scraping(self.test_symbols['web_id'])
-        summary = get_trade_summary_scraping(self.test_symbols['web_id'])
-        assert summary is not None
-        expected_total_trades = len(df)
-        expected_total_volume = df['volume'].astype(float).sum()
-        expected_total_value = df['value'].astype(float).sum()
-        expected_avg_price = df['price'].astype(float).mean()
-        expected_max_price = df['price'].astype(float).max()
-        expected_min_price = df['price'].astype(float).min()
-        assert summary['total_trades'] == expected_total_trades
-        assert abs(summary['total_volume'] - expected_total_volume) < 0.01
-        assert abs(summary['total_value'] - expected_total_value) < 0.01
-        assert abs(summary['avg_price'] - expected_avg_price) < 0.01
-        assert abs(summary['max_price'] - expected_max_price) < 0.01
-        assert abs(summary['min_price'] - expected_min_price) < 0.01
-
-    @patch('requests.get')
-    def test_data_consistency_across_functions(self, mock_get):
-        """تست consistency داده‌ها بین توابع مختلف (mocked)"""
-        mock_response = MagicMock()
-        mock_response.text = (
-            '08:30:00,1000,10,10000,123,456;08:31:00,1010,5,5050,124,457'
-        )
-        mock_get.return_value = mock_response
-        trades_df = get_intraday_trades_scraping(self.test_symbols['web_id'])
-        summary = get_trade_summary_scraping(self.test_symbols['web_id'])
-        assert summary['total_trades'] == len(trades_df)
-        total_volume = trades_df['volume'].astype(float).sum()
-        assert abs(summary['total_volume'] - total_volume) < 0.01
-
-    def test_error_handling_network_timeout(self):
+    def test_error_handling_network_timeout(self, symbols):
         """تست مدیریت timeout شبکه"""
         with patch('requests.get') as mock_get:
             mock_get.side_effect = TimeoutError("Connection timeout")
 
-            result = get_intraday_trades_scraping(self.test_symbols['web_id'])
+            result = get_intraday_trades_scraping(symbols['web_id'])
             assert result is None
 
-            result = get_order_book_scraping(self.test_symbols['web_id'])
+            result = get_order_book_scraping(symbols['web_id'])
             assert result is None
 
-            result = get_real_time_price_scraping(self.test_symbols['web_id'])
+            result = get_real_time_price_scraping(symbols['web_id'])
             assert result is None
 
-    def test_error_handling_invalid_response(self):
+    def test_error_handling_invalid_response(self, symbols):
         """تست مدیریت پاسخ نامعتبر (mocked)"""
         with patch('requests.get') as mock_get:
             mock_response = MagicMock()
             mock_response.text = ""
             mock_get.return_value = mock_response
-            result = get_intraday_trades_scraping(self.test_symbols['web_id'])
+            result = get_intraday_trades_scraping(symbols['web_id'])
             assert result is None or (isinstance(result, pd.DataFrame) and result.empty)
-            result = get_order_book_scraping(self.test_symbols['web_id'])
+            result = get_order_book_scraping(symbols['web_id'])
             assert result is None or result == []
-            result = get_real_time_price_scraping(self.test_symbols['web_id'])
+            result = get_real_time_price_scraping(symbols['web_id'])
             assert result is None or result == []
 
     @patch('requests.get')
-    def test_date_format_handling(self, mock_get):
+    def test_date_format_handling(self, mock_get, symbols):
         """تست مدیریت فرمت تاریخ (mocked)"""
         mock_response = MagicMock()
         mock_response.text = (
@@ -196,9 +226,9 @@ class TestIntradayDataIntegration:
         )
         mock_get.return_value = mock_response
         date_with_dash = "1402-01-01"
-        df1 = get_intraday_trades_scraping(self.test_symbols['web_id'], date_with_dash)
+        df1 = get_intraday_trades_scraping(symbols['web_id'], date_with_dash)
         date_without_dash = "14020101"
-        df2 = get_intraday_trades_scraping(self.test_symbols['web_id'], date_without_dash)
+        df2 = get_intraday_trades_scraping(symbols['web_id'], date_without_dash)
         assert isinstance(df1, pd.DataFrame)
         assert isinstance(df2, pd.DataFrame)
         assert df1.equals(df2)
@@ -216,44 +246,10 @@ class TestIntradayDataIntegration:
         assert summary['total_value'] == 0
 
     @patch('requests.get')
-    def test_data_types_and_ranges(self, mock_get):
-        """تست نوع داده‌ها و محدوده مقادیر (mocked)"""
-        mock_response = MagicMock()
-        mock_response.text = (
-            '08:30:00,1000,10,10000,123,456;08:31:00,1010,5,5050,124,457'
-        )
-        mock_get.return_value = mock_response
-        df = get_intraday_trades_scraping(self.test_symbols['web_id'])
-        assert pd.api.types.is_object_dtype(df['time'])
-        assert pd.api.types.is_numeric_dtype(df['price'])
-        assert pd.api.types.is_numeric_dtype(df['volume'])
-        assert pd.api.types.is_numeric_dtype(df['value'])
-        assert (df['price'] > 0).all()
-        assert (df['volume'] > 0).all()
-        assert (df['value'] > 0).all()
-        time_pattern = r'^\d{2}:\d{2}:\d{2}$'
-        assert df['time'].str.match(time_pattern).all()
-
-    @patch('requests.get')
-    def test_concurrent_requests_simulation(self, mock_get):
+    def test_concurrent_requests_simulation(self, mock_get, symbols, trade_payload, pool):
         """تست شبیه‌سازی درخواست‌های همزمان (mocked)"""
-        import threading
-        mock_response = MagicMock()
-        mock_response.text = (
-            '08:30:00,1000,10,10000,123,456;08:31:00,1010,5,5050,124,457'
-        )
-        mock_get.return_value = mock_response
-        results = []
-        def fetch_data():
-            result = get_intraday_trades_scraping(self.test_symbols['web_id'])
-            results.append(result)
-        threads = []
-        for i in range(3):
-            t = threading.Thread(target=fetch_data)
-            threads.append(t)
-            t.start()
-        for t in threads:
-            t.join()
+        mock_get.return_value = trade_payload
+        results = list(pool.map(lambda _: get_intraday_trades_scraping(symbols['web_id']), range(3)))
         assert len(results) == 3
         for result in results:
             assert result is not None or isinstance(result, pd.DataFrame)
\ No newline at end of file
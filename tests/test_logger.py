@@ -21,39 +21,48 @@ class TestLogger:
             logger = setup_logger("test_logger")
             assert logger.level == logging.DEBUG
 
-    def test_log_performance_with_records(self):
-        with patch('utils.logger.logging.getLogger') as mock_get_logger:
-            mock_logger = MagicMock()
-            mock_get_logger.return_value = mock_logger
 
-            log_performance("test_func", 2.5, 100)
+# getLogger is patched once per class; each test sees a freshly reset mock
+@pytest.fixture(scope="class")
+def logging_get_logger():
+    with patch('utils.logger.logging.getLogger') as mock_get_logger:
+        mock_get_logger.return_value = MagicMock()
+        yield mock_get_logger
 
-            mock_logger.info.assert_called_once()
-            call_args = mock_logger.info.call_args[0][0]
-            assert "test_func" in call_args
-            assert "2.50s" in call_args
-            assert "100" in call_args
-            assert "40.00 rec/s" in call_args
 
-    def test_log_performance_without_records(self):
-        with patch('utils.logger.logging.getLogger') as mock_get_logger:
-            mock_logger = MagicMock()
-            mock_get_logger.return_value = mock_logger
+@pytest.fixture
+def mock_get_logger(logging_get_logger):
+    yield logging_get_logger
+    logging_get_logger.reset_mock(side_effect=True)
 
-            log_performance("test_func", 1.5)
 
-            mock_logger.info.assert_called_once()
-            call_args = mock_logger.info.call_args[0][0]
-            assert "test_func" in call_args
-            assert "1.50s" in call_args
+@pytest.fixture
+def mock_logger(mock_get_logger):
+    return mock_get_logger.return_value
 
-    def test_performance_logger_decorator(self):
-        with patch('utils.logger.logging.getLogger') as mock_get_logger, \
-             patch('utils.logger.log_performance') as mock_log_performance, \
-             patch('time.time', side_effect=[0, 1.5]):
 
-            mock_logger = MagicMock()
-            mock_get_logger.return_value = mock_logger
+class TestLoggingHelpers:
+    def test_log_performance_with_records(self, mock_logger):
+        log_performance("test_func", 2.5, 100)
+
+        mock_logger.info.assert_called_once()
+        call_args = mock_logger.info.call_args[0][0]
+        assert "test_func" in call_args
+        assert "2.50s" in call_args
+        assert "100" in call_args
+        assert "40.00 rec/s" in call_args
+
+    def test_log_performance_without_records(self, mock_logger):
+        log_performance("test_func", 1.5)
+
+        mock_logger.info.assert_called_once()
+        call_args = mock_logger.info.call_args[0][0]
+        assert "test_func" in call_args
+        assert "1.50s" in call_args
+
+    def test_performance_logger_decorator(self, mock_logger, fake_time):
+        fake_time(1.5)
+        with patch('utils.logger.log_performance') as mock_log_performance:
 
             @performance_logger
             def test_function():
@@ -66,90 +75,62 @@ class TestLogger:
             mock_logger.debug.assert_any_call("Completed test_function")
             mock_log_performance.assert_called_once_with("test_function", 1.5)
 
-    def test_performance_logger_decorator_with_exception(self):
-        with patch('utils.logger.logging.getLogger') as mock_get_logger, \
-             patch('time.time', side_effect=[0, 1.0]):
-
-            mock_logger = MagicMock()
-            mock_get_logger.return_value = mock_logger
-
-            @performance_logger
-            def failing_function():
-                raise ValueError("Test error")
-
-            with pytest.raises(ValueError, match="Test error"):
-                failing_function()
-
-            mock_logger.error.assert_called_once()
-            call_args = mock_logger.error.call_args[0][0]
-            assert "Error in failing_function" in call_args
-            assert "1.00s" in call_args
-
-    def test_log_api_call_success(self):
-        with patch('utils.logger.logging.getLogger') as mock_get_logger:
-            mock_logger = MagicMock()
-            mock_get_logger.return_value = mock_logger
-
-            log_api_call("test/endpoint", success=True, duration=1.2)
-
-            mock_logger.debug.assert_called_once_with("API call successful: test/endpoint (1.20s)")
+    def test_performance_logger_decorator_with_exception(self, mock_logger, fake_time):
+        fake_time(1.0)
 
-    def test_log_api_call_success_no_duration(self):
-        with patch('utils.logger.logging.getLogger') as mock_get_logger:
-            mock_logger = MagicMock()
-            mock_get_logger.return_value = mock_logger
+        @performance_logger
+        def failing_function():
+            raise ValueError("Test error")
 
-            log_api_call("test/endpoint", success=True)
+        with pytest.raises(ValueError, match="Test error"):
+            failing_function()
 
-            mock_logger.debug.assert_called_once_with("API call successful: test/endpoint")
+        mock_logger.error.assert_called_once()
+        call_args = mock_logger.error.call_args[0][0]
+        assert "Error in failing_function" in call_args
+        assert "1.00s" in call_args
 
-    def test_log_api_call_failure(self):
-        with patch('utils.logger.logging.getLogger') as mock_get_logger:
-            mock_logger = MagicMock()
-            mock_get_logger.return_value = mock_logger
+    def test_log_api_call_success(self, mock_logger):
+        log_api_call("test/endpoint", success=True, duration=1.2)
 
-            log_api_call("test/endpoint", success=False, params={"key": "value"})
+        mock_logger.debug.assert_called_once_with("API call successful: test/endpoint (1.20s)")
 
-            mock_logger.warning.assert_called_once_with("API call failed: test/endpoint")
-            mock_logger.debug.assert_called_once_with("Parameters: {'key': 'value'}")
+    def test_log_api_call_success_no_duration(self, mock_logger):
+        log_api_call("test/endpoint", success=True)
 
-    def test_log_database_operation_success(self):
-        with patch('utils.logger.logging.getLogger') as mock_get_logger:
-            mock_logger = MagicMock()
-            mock_get_logger.return_value = mock_logger
+        mock_logger.debug.assert_called_once_with("API call successful: test/endpoint")
 
-            log_database_operation("INSERT", "stocks", records=10, success=True)
+    def test_log_api_call_failure(self, mock_logger):
+        log_api_call("test/endpoint", success=False, params={"key": "value"})
 
-            mock_logger.debug.assert_called_once_with("DB operation successful: INSERT on stocks (10 records)")
+        mock_logger.warning.assert_called_once_with("API call failed: test/endpoint")
+        mock_logger.debug.assert_called_once_with("Parameters: {'key': 'value'}")
 
-    def test_log_database_operation_success_no_records(self):
-        with patch('utils.logger.logging.getLogger') as mock_get_logger:
-            mock_logger = MagicMock()
-            mock_get_logger.return_value = mock_logger
+    def test_log_database_operation_success(self, mock_logger):
+        log_database_operation("INSERT", "stocks", records=10, success=True)
 
-            log_database_operation("SELECT", "stocks", success=True)
+        mock_logger.debug.assert_called_once_with("DB operation successful: INSERT on stocks (10 records)")
 
-            mock_logger.debug.assert_called_once_with("DB operation successful: SELECT on stocks")
+    def test_log_database_operation_success_no_records(self, mock_logger):
+        log_database_operation("SELECT", "stocks", success=True)
 
-    def test_log_database_operation_failure(self):
-        with patch('utils.logger.logging.getLogger') as mock_get_logger:
-            mock_logger = MagicMock()
-            mock_get_logger.return_value = mock_logger
+        mock_logger.debug.assert_called_once_with("DB operation successful: SELECT on stocks")
 
-            log_database_operation("INSERT", "stocks", success=False)
+    def test_log_database_operation_failure(self, mock_logger):
+        log_database_operation("INSERT", "stocks", success=False)
 
-            mock_logger.error.assert_called_once_with("DB operation failed: INSERT on stocks")
+        mock_logger.error.assert_called_once_with("DB operation failed: INSERT on stocks")
 
-    def test_setup_request_logging(self):
-        with patch('utils.logger.logging.getLogger') as mock_get_logger:
-            mock_urllib_logger = MagicMock()
-            mock_requests_logger = MagicMock()
-            mock_get_logger.side_effect = lambda name: {
-                'urllib3': mock_urllib_logger,
-                'requests': mock_requests_logger
-            }.get(name, MagicMock())
+    def test_setup_request_logging(self, mock_get_logger):
+        mock_urllib_logger = MagicMock()
+        mock_requests_logger = MagicMock()
+        # pytest's logging plugin also calls getLogger() with no name while the patch is active
+        mock_get_logger.side_effect = lambda name=None: {
+            'urllib3': mock_urllib_logger,
+            'requests': mock_requests_logger
+        }.get(name, MagicMock())
 
-            setup_request_logging()
+        setup_request_logging()
 
-            mock_urllib_logger.setLevel.assert_called_once_with(logging.WARNING)
-            mock_requests_logger.setLevel.assert_called_once_with(logging.WARNING)
+        mock_urllib_logger.setLevel.assert_called_once_with(logging.WARNING)
+        mock_requests_logger.setLevel.assert_called_once_with(logging.WARNING)
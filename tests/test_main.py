@@ -9,19 +9,11 @@ from unittest.mock import patch, MagicMock
 class TestMain:
     """Basic tests for main module"""
 
-    def test_import_main(self):
+    def test_import_main(self, main_mod):
         """Test that main module can be imported"""
-        try:
-            import main
-            assert main is not None
-        except ImportError:
-            pytest.skip("Main module not available")
+        assert main_mod is not None
 
-    def test_create_parser(self):
+    def test_create_parser(self, main_mod):
         """Test parser creation"""
-        try:
-            from main import create_parser
-            parser = create_parser()
-            assert parser is not None
-        except ImportError:
-            pytest.skip("Main module not available")
+        parser = main_mod.create_parser()
+        assert parser is not None
@@ -2,36 +2,55 @@
 تست‌های حرفه‌ای برای api/market_watch.py با استفاده از داده‌های واقعی TSE
 """
 
+import numpy as np
 import pytest
 import pandas as pd
 from unittest.mock import patch, MagicMock
 from api.market_watch import MarketWatch
 
 
+# Each row: symbol, Ticker-Code, Name, Sector, Open, High, Low, Final, last_price, No, Volume, Value, Y-Final, EPS, Base-Vol, Unknown1, Unknown2, Day_UL, Day_LL, Share-No, Mkt-ID, Extra
+MOCK_MW_TEXT_3 = (
+    "H1@H2@"
+    "SYM1,TC1,Name1,Sec1,1000,1100,900,1050,1500,100,10000,10500000,1000,50,5000,0,0,1200,800,1000000,1,extra1;"
+    "SYM2,TC2,Name2,Sec2,2000,2200,1800,2100,2500,200,20000,42000000,2000,100,10000,0,0,2400,1600,2000000,1,extra2;"
+    "SYM3,TC3,Name3,Sec3,3000,3300,2700,3150,3500,300,30000,94500000,3000,150,15000,0,0,3600,2400,3000000,2,extra3"
+    "@order_book"
+)
+# 10 rows with positive last_price, built once at import
+MOCK_MW_TEXT_10 = "H1@H2@" + "".join(
+    f"SYM{i},TC{i},Name{i},Sec{i},{1000+i*100},{1100+i*100},{900+i*100},{1050+i*100},{1500+i*100},{100+i*10},{10000+i*1000},{10500000+i*1000000},{1000+i*100},{50+i*5},{5000+i*500},0,0,{1200+i*100},{800+i*100},{1000000+i*100000},1,extra{i};"
+    for i in range(1, 11)
+) + "@order_book"
+
+
+@pytest.fixture(scope="class")
+def mw():
+    """یک نمونه MarketWatch برای کل کلاس؛ کش غیرفعال است تا پاسخ ساختگی یک تست به تست دیگر نرسد"""
+    return MarketWatch(cache_ttl=0)
+
+
+class StreamingResponse(MagicMock):
+    """پاسخ ساختگی که متن خود را مانند requests با stream=True تکه‌تکه برمی‌گرداند"""
+
+    def iter_content(self, chunk_size=1):
+        data = self.text.encode('utf-8')
+        return (data[i:i + chunk_size] for i in range(0, len(data), chunk_size))
+
+
 class TestMarketWatchIntegration:
     """تست‌های یکپارچه برای MarketWatch با داده‌های واقعی"""
 
-    def setup_method(self):
-        """تنظیمات اولیه برای هر تست"""
-        self.mw = MarketWatch()
-
     @pytest.mark.slow
-    def test_get_market_watch_real_data(self):
+    def test_get_market_watch_real_data(self, mw):
         """تست دریافت داده‌های واقعی MarketWatch"""
         # Mock the request to simulate TSE data with correct columns
         # expected_cols = ['symbol','Ticker-Code','Name','Sector','Open','High','Low','Final','last_price','No','Volume','Value','Y-Final','EPS','Base-Vol','Unknown1','Unknown2','Day_UL','Day_LL','Share-No','Mkt-ID','Extra']
-        mock_response = MagicMock()
-        # Ensure data is in segment index 2 when splitting by '@'
-        mock_data = "H1@H2@"
-        # Each row: symbol, Ticker-Code, Name, Sector, Open, High, Low, Final, last_price, No, Volume, Value, Y-Final, EPS, Base-Vol, Unknown1, Unknown2, Day_UL, Day_LL, Share-No, Mkt-ID, Extra
-        mock_data += "SYM1,TC1,Name1,Sec1,1000,1100,900,1050,1500,100,10000,10500000,1000,50,5000,0,0,1200,800,1000000,1,extra1;"
-        mock_data += "SYM2,TC2,Name2,Sec2,2000,2200,1800,2100,2500,200,20000,42000000,2000,100,10000,0,0,2400,1600,2000000,1,extra2;"
-        mock_data += "SYM3,TC3,Name3,Sec3,3000,3300,2700,3150,3500,300,30000,94500000,3000,150,15000,0,0,3600,2400,3000000,2,extra3"
-        mock_data += "@order_book"
-        mock_response.text = mock_data
-
-        with patch.object(self.mw, 'make_request', return_value=mock_response):
-            df = self.mw.get_market_watch()
+        mock_response = StreamingResponse()
+        mock_response.text = MOCK_MW_TEXT_3
+
+        with patch.object(mw, 'make_request', return_value=mock_response):
+            df = mw.get_market_watch()
 
             assert df is not None
             assert isinstance(df, pd.DataFrame)
@@ -52,21 +71,21 @@ class TestMarketWatchIntegration:
             print(f"MarketWatch data: {len(df)} records, {len(df_filtered)} with positive prices")
 
     @pytest.mark.slow
-    def test_get_market_watch_by_market(self):
+    def test_get_market_watch_by_market(self, mw):
         """تست فیلتر کردن بر اساس بازار"""
         # تست بازار بورس (market=1)
-        df_bourse = self.mw.get_market_watch(market=1)
+        df_bourse = mw.get_market_watch(market=1)
         if df_bourse is not None and not df_bourse.empty:
             print(f"Bourse market data: {len(df_bourse)} records")
 
         # تست بازار فرابورس (market=2)
-        df_faraborse = self.mw.get_market_watch(market=2)
+        df_faraborse = mw.get_market_watch(market=2)
         if df_faraborse is not None and not df_faraborse.empty:
             print(f"Faraborse market data: {len(df_faraborse)} records")
 
-    def test_get_top_gainers_real_data(self):
+    def test_get_top_gainers_real_data(self, mw):
         """تست دریافت برترین رشدکنندگان"""
-        df_gainers = self.mw.get_top_gainers(count=5)
+        df_gainers = mw.get_top_gainers(count=5)
 
         if df_gainers is not None:
             assert isinstance(df_gainers, pd.DataFrame)
@@ -81,9 +100,9 @@ class TestMarketWatchIntegration:
 
             print(f"Top gainers: {len(df_gainers)} stocks")
 
-    def test_get_top_losers_real_data(self):
+    def test_get_top_losers_real_data(self, mw):
         """تست دریافت برترین کاهش‌یافتگان"""
-        df_losers = self.mw.get_top_losers(count=5)
+        df_losers = mw.get_top_losers(count=5)
 
         if df_losers is not None:
             assert isinstance(df_losers, pd.DataFrame)
@@ -98,36 +117,102 @@ class TestMarketWatchIntegration:
 
             print(f"Top losers: {len(df_losers)} stocks")
 
-    def test_market_watch_data_validation(self):
+    @pytest.mark.parametrize("mock_text", [MOCK_MW_TEXT_3, MOCK_MW_TEXT_10])
+    def test_market_watch_data_validation(self, mw, mock_text):
         """تست اعتبار داده‌های MarketWatch"""
-        mock_response = MagicMock()
-        mock_data = "H1@H2@"
-        # Add 10 rows with positive last_price
-        for i in range(1, 11):
-            mock_data += f"SYM{i},TC{i},Name{i},Sec{i},{1000+i*100},{1100+i*100},{900+i*100},{1050+i*100},{1500+i*100},{100+i*10},{10000+i*1000},{10500000+i*1000000},{1000+i*100},{50+i*5},{5000+i*500},0,0,{1200+i*100},{800+i*100},{1000000+i*100000},1,extra{i};"
-        mock_data += "@order_book"
-        mock_response.text = mock_data
-        with patch.object(self.mw, 'make_request', return_value=mock_response):
-            df = self.mw.get_market_watch()
+        mock_response = StreamingResponse()
+        mock_response.text = mock_text
+        with patch.object(mw, 'make_request', return_value=mock_response):
+            df = mw.get_market_watch()
 
             assert df is not None
             assert not df.empty
 
-            # بررسی تک تک رکوردها برای 10 رکورد اول
-            for idx, row in df.head(10).iterrows():
-                # نماد باید وجود داشته باشد و خالی نباشد
-                assert 'symbol' in row
-                assert row['symbol'] and len(str(row['symbol']).strip()) > 0
-
-                # قیمت باید عددی مثبت باشد
-                assert 'last_price' in row
-                assert pd.notna(row['last_price'])
-                assert isinstance(row['last_price'], (int, float))
-                assert row['last_price'] > 0
+            # ستون‌ها باید وجود داشته باشند
+            assert 'symbol' in df.columns
+            assert 'last_price' in df.columns
 
-    def test_market_watch_columns_completeness(self):
+            # بررسی برداری 10 رکورد اول به جای حلقه روی سطرها
+            head = df.head(10)
+            # نماد باید وجود داشته باشد و خالی نباشد
+            assert head['symbol'].notna().all()
+            assert head['symbol'].str.strip().str.len().gt(0).all()
+
+            # قیمت باید عددی مثبت باشد
+            assert pd.api.types.is_numeric_dtype(head['last_price'])
+            prices = head['last_price'].to_numpy()
+            assert not np.isnan(prices.astype(np.float64)).any()
+            assert (prices > 0).all()
+
+    def test_repeated_calls_within_ttl_reuse_response(self):
+        """تست استفاده مجدد از پاسخ کش‌شده در فراخوانی‌های پشت سر هم"""
+        mock_response = StreamingResponse()
+        mock_response.text = ("H1@H2@SYM1,TC1,Name1,Sec1,1000,1100,900,1050,1500,100,10000,10500000,1000,50,5000,0,0,1200,800,1000000,1,extra1;"
+                              "SYM2,TC2,Name2,Sec2,2000,2200,1800,2100,2500,200,20000,42000000,2000,100,10000,0,0,2400,1600,2000000,2,extra2@ob")
+        mw = MarketWatch(cache_ttl=60)
+        with patch.object(mw, 'make_request', return_value=mock_response) as mock_request:
+            assert len(mw.get_market_watch()) == 2
+            assert len(mw.get_market_watch(market=2)) == 1
+            assert mw.get_top_gainers().iloc[0]['symbol'] == 'SYM2'
+            assert mw.get_top_losers().iloc[0]['symbol'] == 'SYM1'
+
+        assert mock_request.call_count == 1
+
+    @pytest.mark.parametrize("count", [0, 1, 3, 7, 20])
+    def test_top_movers_match_full_sort(self, mw, count):
+        """تست برابری انتخاب برترین‌ها با مرتب‌سازی کامل، شامل قیمت‌های نامعتبر"""
+        prices = [1500, 900, 'x', 2500, 1200, 700, 3100, 1100, 'y', 1800]
+        rows = [f"SYM{i},TC{i},N{i},S{i},1,1,1,1,{p},1,1,1,1,1,1,0,0,1,1,1,1,e" for i, p in enumerate(prices)]
+        mock_response = StreamingResponse()
+        mock_response.text = "H1@H2@" + ";".join(rows) + "@ob"
+        with patch.object(mw, 'make_request', return_value=mock_response):
+            df = mw.get_market_watch()
+            gainers = mw.get_top_gainers(count=count)
+            losers = mw.get_top_losers(count=count)
+
+        expected_gainers = df.sort_values('last_price', ascending=False, kind='stable').head(count)
+        expected_losers = df.sort_values('last_price', ascending=True, kind='stable').head(count)
+        assert gainers['symbol'].tolist() == expected_gainers['symbol'].tolist()
+        assert losers['symbol'].tolist() == expected_losers['symbol'].tolist()
+
+    def test_get_multi_fetches_once(self):
+        """تست دریافت چند بازار با یک درخواست شبکه"""
+        mock_response = StreamingResponse()
+        mock_response.text = ("H1@H2@SYM1,TC1,Name1,Sec1,1000,1100,900,1050,1500,100,10000,10500000,1000,50,5000,0,0,1200,800,1000000,1,extra1;"
+                              "SYM2,TC2,Name2,Sec2,2000,2200,1800,2100,2500,200,20000,42000000,2000,100,10000,0,0,2400,1600,2000000,2,extra2@ob")
+        mw = MarketWatch(cache_ttl=0)
+        with patch.object(mw, 'make_request', return_value=mock_response) as mock_request:
+            result = mw.get_multi()
+
+        assert mock_request.call_count == 1
+        assert result[1]['symbol'].tolist() == ['SYM1']
+        assert result[2]['symbol'].tolist() == ['SYM2']
+        assert len(result[None]) == 2
+
+    def test_make_request_uses_compressed_keep_alive_session(self, mw):
+        """تست استفاده از session ماندگار با فشرده‌سازی gzip"""
+        with patch.object(mw.session, 'get') as mock_get:
+            mw.make_request()
+            mw.make_request()
+
+        assert mock_get.call_count == 2
+        assert 'gzip' in mw.session.headers['Accept-Encoding']
+        assert mw.session.get_adapter('http://old.tsetmc.com')._pool_maxsize == 8
+
+    def test_zero_ttl_disables_cache(self):
+        """تست غیرفعال شدن کش با cache_ttl=0"""
+        mock_response = StreamingResponse()
+        mock_response.text = "H1@H2@SYM1,TC1,Name1,Sec1,1000,1100,900,1050,1500,100,10000,10500000,1000,50,5000,0,0,1200,800,1000000,1,extra1@ob"
+        mw = MarketWatch(cache_ttl=0)
+        with patch.object(mw, 'make_request', return_value=mock_response) as mock_request:
+            mw.get_market_watch()
+            mw.get_market_watch()
+
+        assert mock_request.call_count == 2
+
+    def test_market_watch_columns_completeness(self, mw):
         """تست کامل بودن ستون‌های MarketWatch"""
-        df = self.mw.get_market_watch(market=None)  # همه بازارها
+        df = mw.get_market_watch(market=None)  # همه بازارها
 
         assert df is not None
         assert not df.empty
@@ -141,35 +226,35 @@ class TestMarketWatchIntegration:
         assert not df['symbol'].isna().any(), "NaN values in symbol column"
         assert not df['last_price'].isna().any(), "NaN values in last_price column"
 
-    def test_error_handling_network_timeout(self):
+    def test_error_handling_network_timeout(self, mw):
         """تست مدیریت timeout شبکه"""
-        with patch('requests.get') as mock_get:
+        with patch.object(mw.session, 'get') as mock_get:
             mock_get.side_effect = TimeoutError("Connection timeout")
 
-            df = self.mw.get_market_watch()
+            df = mw.get_market_watch()
             assert df is None
 
-            gainers = self.mw.get_top_gainers()
+            gainers = mw.get_top_gainers()
             assert gainers is None
 
-            losers = self.mw.get_top_losers()
+            losers = mw.get_top_losers()
             assert losers is None
 
-    def test_error_handling_invalid_response(self):
+    def test_error_handling_invalid_response(self, mw):
         """تست مدیریت پاسخ نامعتبر"""
-        with patch('requests.get') as mock_get:
-            mock_response = MagicMock()
+        with patch.object(mw.session, 'get') as mock_get:
+            mock_response = StreamingResponse()
             mock_response.text = "Invalid response"
             mock_get.return_value = mock_response
 
-            df = self.mw.get_market_watch()
+            df = mw.get_market_watch()
             # بسته به implementation ممکن است None یا DataFrame خالی برگردد
             assert df is None or (isinstance(df, pd.DataFrame) and df.empty)
 
-    def test_data_consistency_across_calls(self):
+    def test_data_consistency_across_calls(self, mw):
         """تست consistency داده‌ها در فراخوانی‌های متوالی"""
-        df1 = self.mw.get_market_watch()
-        df2 = self.mw.get_market_watch()
+        df1 = mw.get_market_watch()
+        df2 = mw.get_market_watch()
 
         assert df1 is not None and df2 is not None
         assert not df1.empty and not df2.empty
@@ -181,39 +266,35 @@ class TestMarketWatchIntegration:
         count_diff = abs(len(df1) - len(df2))
         assert count_diff <= 20, f"Data count inconsistency: {len(df1)} vs {len(df2)}"
 
-    def test_market_filtering_functionality(self):
+    def test_market_filtering_functionality(self, mw):
         """تست عملکرد فیلتر بازار"""
         # دریافت همه داده‌ها
-        df_all = self.mw.get_market_watch()
+        df_all = mw.get_market_watch()
 
         if df_all is not None and not df_all.empty:
             # اگر ستون Mkt-ID وجود دارد، تست فیلتر را انجام بده
             if 'Mkt-ID' in df_all.columns:
                 # تست بازار بورس
-                df_bourse = self.mw.get_market_watch(market=1)
+                df_bourse = mw.get_market_watch(market=1)
                 if df_bourse is not None:
                     # همه رکوردهای فیلتر شده باید Mkt-ID = 1 داشته باشند
                     if not df_bourse.empty and 'Mkt-ID' in df_bourse.columns:
                         assert (df_bourse['Mkt-ID'] == '1').all()
 
                 # تست بازار فرابورس
-                df_faraborse = self.mw.get_market_watch(market=2)
+                df_faraborse = mw.get_market_watch(market=2)
                 if df_faraborse is not None:
                     # همه رکوردهای فیلتر شده باید Mkt-ID = 2 داشته باشند
                     if not df_faraborse.empty and 'Mkt-ID' in df_faraborse.columns:
                         assert (df_faraborse['Mkt-ID'] == '2').all()
 
-    def test_numeric_data_types(self):
+    @pytest.mark.parametrize("mock_text", [MOCK_MW_TEXT_3, MOCK_MW_TEXT_10])
+    def test_numeric_data_types(self, mw, mock_text):
         """تست نوع داده‌های عددی"""
-        mock_response = MagicMock()
-        mock_data = "H1@H2@"
-        mock_data += "SYM1,TC1,Name1,Sec1,1000,1100,900,1050,1500,100,10000,10500000,1000,50,5000,0,0,1200,800,1000000,1,extra1;"
-        mock_data += "SYM2,TC2,Name2,Sec2,2000,2200,1800,2100,2500,200,20000,42000000,2000,100,10000,0,0,2400,1600,2000000,1,extra2;"
-        mock_data += "SYM3,TC3,Name3,Sec3,3000,3300,2700,3150,3500,300,30000,94500000,3000,150,15000,0,0,3600,2400,3000000,2,extra3"
-        mock_data += "@order_book"
-        mock_response.text = mock_data
-        with patch.object(self.mw, 'make_request', return_value=mock_response):
-            df = self.mw.get_market_watch()
+        mock_response = StreamingResponse()
+        mock_response.text = mock_text
+        with patch.object(mw, 'make_request', return_value=mock_response):
+            df = mw.get_market_watch()
 
             assert df is not None
             assert not df.empty
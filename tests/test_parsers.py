@@ -8,7 +8,9 @@ from api.parsers import (
     parse_market_watch_scraped,
     parse_client_type_scraped,
     parse_order_book_scraped,
-    parse_price_history_scraped
+    parse_price_history_scraped,
+    read_stream_segment,
+    _segment
 )
 
 
@@ -26,7 +28,7 @@ class TestParseMarketWatchScraped:
         assert isinstance(result, pd.DataFrame)
         assert len(result) == 1
         assert list(result.columns) == ['WEB-ID','Ticker-Code','Ticker','Name','Time','Open','Final','Close','No','Volume','Value',
-                                        'Low','High','Y-Final','EPS','Base-Vol','Unknown1','Unknown2','Sector','Day_UL','Day_LL','Share-No','Mkt-ID']
+                                        'Low','High','Y-Final','EPS','Base-Vol','Sector','Day_UL','Day_LL','Share-No','Mkt-ID']
         assert result.iloc[0]['WEB-ID'] == '1'
         assert result.iloc[0]['Ticker'] == 'TICK1'
 
@@ -41,6 +43,29 @@ class TestParseMarketWatchScraped:
         assert len(result) == 2
         assert result.iloc[1]['WEB-ID'] == '2'
 
+    def test_parse_market_watch_scraped_extra_fields_and_trailing_separator(self):
+        """Test that extra fields are dropped and a trailing ';' adds no row"""
+        sample_data1 = "1,1001,TICK1,Name1,10:00,1000,1010,1005,100,10000,10000000,995,1015,1000,10,1000,0,0,Sector1,1020,980,1000000,1,extra"
+        sample_data2 = "2,1002,TICK2,Name2,10:01,1010,1020,1015,200,20000,20000000,1005,1025,1010,20,2000,0,0,Sector2,1030,990,2000000,2"
+        main_text = f"header1@header2@{sample_data1};{sample_data2};@footer"
+
+        result = parse_market_watch_scraped(main_text)
+
+        assert len(result) == 2
+        assert result['Mkt-ID'].tolist() == ['1', '2']
+        assert result.iloc[1]['Ticker'] == 'TICK2'
+
+    def test_parse_market_watch_scraped_bytes_matches_str(self):
+        """Test that raw response bytes parse to the same frame as the decoded text"""
+        sample_data1 = "1,1001,نماد1,نام شرکت,10:00,1000,1010,1005,100,10000,10000000,995,1015,1000,10,1000,0,0,Sector1,1020,980,1000000,1"
+        sample_data2 = "2,1002,TICK2,Name2,10:01,1010,1020,1015,200,20000,20000000,1005,1025,1010,20,2000,0,0,Sector2,1030,990,2000000,2"
+        main_text = f"header1@header2@{sample_data1};{sample_data2}@footer@more"
+
+        from_bytes = parse_market_watch_scraped(main_text.encode('utf-8'))
+
+        pd.testing.assert_frame_equal(from_bytes, parse_market_watch_scraped(main_text))
+        assert from_bytes.iloc[0]['Ticker'] == 'نماد1'
+
     def test_parse_market_watch_scraped_empty_data(self):
         """Test parsing with empty data"""
         main_text = "header1@header2@@footer"
@@ -49,7 +74,56 @@ class TestParseMarketWatchScraped:
 
         assert len(result) == 0
         assert list(result.columns) == ['WEB-ID','Ticker-Code','Ticker','Name','Time','Open','Final','Close','No','Volume','Value',
-                                        'Low','High','Y-Final','EPS','Base-Vol','Unknown1','Unknown2','Sector','Day_UL','Day_LL','Share-No','Mkt-ID']
+                                        'Low','High','Y-Final','EPS','Base-Vol','Sector','Day_UL','Day_LL','Share-No','Mkt-ID']
+
+
+    def test_parse_market_watch_scraped_keep_unused(self):
+        """Test that keep_unused=True returns the full 23-column schema"""
+        row = "1,1001,TICK1,Name1,10:00,1000,1010,1005,100,10000,10000000,995,1015,1000,10,1000,u1,u2,Sector1,1020,980,1000000,1,extra"
+        main_text = f"header1@header2@{row}@footer"
+
+        full = parse_market_watch_scraped(main_text, keep_unused=True)
+        trimmed = parse_market_watch_scraped(main_text)
+
+        assert len(full.columns) == 23
+        assert full.iloc[0]['Unknown1'] == 'u1'
+        assert 'Unknown1' not in trimmed.columns and 'Unknown2' not in trimmed.columns
+        pd.testing.assert_frame_equal(full.drop(columns=['Unknown1', 'Unknown2']), trimmed)
+
+    def test_parse_market_watch_scraped_numeric(self):
+        """Test that numeric=True converts price/volume columns in bulk and downcasts integers"""
+        row1 = "1,1001,TICK1,Name1,10:00,1000,1010,1005,100,10000,10000000,995,1015,1000,10,1000,0,0,Sector1,1020,980,1000000,1"
+        row2 = "2,1002,TICK2,Name2,10:01,1010,1020,1015,200,20000,20000000,1005,1025,1010,-,2000,0,0,Sector2,1030,990,2000000,2"
+        main_text = f"header1@header2@{row1};{row2}@footer"
+
+        result = parse_market_watch_scraped(main_text, numeric=True)
+
+        assert result['Open'].dtype == 'int16'
+        assert result['Value'].dtype == 'int32'
+        assert result['Final'].tolist() == [1010, 1020]
+        # Unparseable values become NaN instead of raising
+        assert pd.isna(result.loc[1, 'EPS'])
+        # Identifier columns stay as text
+        assert result.loc[0, 'WEB-ID'] == '1'
+        assert result.loc[0, 'Mkt-ID'] == '1'
+
+    def test_parse_market_watch_scraped_arrow_strings(self):
+        """Test that text columns are Arrow-backed when pyarrow is installed"""
+        pytest.importorskip("pyarrow")
+        main_text = "h1@h2@1,1001,TICK1,Name1,10:00,1000,1010,1005,100,10000,10000000,995,1015,1000,10,1000,0,0,Sector1,1020,980,1000000,1@f"
+
+        result = parse_market_watch_scraped(main_text, numeric=True)
+
+        assert result['Ticker'].dtype == pd.StringDtype('pyarrow')
+        assert result['Open'].dtype == 'int16'
+
+    @pytest.mark.parametrize("main_text", ["header1@header2@ \n\t @footer", b"header1@header2@ \r\n @footer"])
+    def test_parse_market_watch_scraped_blank_segment(self, main_text):
+        """Test that a whitespace-only segment, str or bytes, yields an empty frame"""
+        result = parse_market_watch_scraped(main_text)
+
+        assert len(result) == 0
+        assert len(result.columns) == 21
 
 
 class TestParseClientTypeScraped:
@@ -78,6 +152,27 @@ class TestParseClientTypeScraped:
         assert len(result) == 1
         assert result.iloc[0]['Vol_Buy_R'] == '10000'
 
+    def test_parse_client_type_scraped_bytes(self):
+        """Test parsing raw response bytes"""
+        text = b"1,100,50,10000,5000,80,40,8000,4000;2,200,100,20000,10000,160,80,16000,8000"
+
+        result = parse_client_type_scraped(text)
+
+        assert len(result) == 2
+        assert result.iloc[0]['Vol_Buy_R'] == '10000'
+
+
+    def test_parse_client_type_scraped_numeric(self):
+        """Test that numeric=True parses every column but WEB-ID as integers"""
+        text = "IR1,100,50,10000,5000,80,40,8000,4000;IR2,200,100,3000000000,10000,160,80,16000,8000"
+
+        result = parse_client_type_scraped(text, numeric=True)
+
+        assert result['WEB-ID'].tolist() == ['IR1', 'IR2']
+        assert result['No_Buy_R'].dtype == 'int16'
+        assert result['Vol_Buy_R'].dtype == 'int64'
+        assert result['Vol_Buy_R'].tolist() == [10000, 3000000000]
+
 
 class TestParseOrderBookScraped:
     """Tests for parse_order_book_scraped"""
@@ -130,4 +225,74 @@ class TestParsePriceHistoryScraped:
         result = parse_price_history_scraped(text)
 
         assert len(result) == 1
-        assert result.iloc[0]['Volume'] == '10000'
\ No newline at end of file
+        assert result.iloc[0]['Volume'] == '10000'
+
+
+    def test_parse_price_history_scraped_numeric(self):
+        """Test that numeric=True returns an all-integer frame"""
+        text = "1,1000,1010,100,10000,10000000,995,1015,1000,1005;2,1010,1020,200,20000,20000000,1005,1025,1010,1015"
+
+        result = parse_price_history_scraped(text, numeric=True)
+
+        assert all(pd.api.types.is_integer_dtype(dtype) for dtype in result.dtypes)
+        assert result['Value'].tolist() == [10000000, 20000000]
+
+    def test_parse_price_history_scraped_numeric_empty(self):
+        """Test that an empty numeric parse still has numeric columns"""
+        result = parse_price_history_scraped("", numeric=True)
+
+        assert len(result) == 0
+        assert all(pd.api.types.is_numeric_dtype(dtype) for dtype in result.dtypes)
+
+
+class TestSegment:
+    """Tests for _segment"""
+
+    @pytest.mark.parametrize("text", ["h1@h2@rows;more@ob@tail", "h1@h2@rows;more", "@@rows;more@", "h1@h2@@"])
+    @pytest.mark.parametrize("as_bytes", [False, True])
+    @pytest.mark.parametrize("index", [0, 1, 2])
+    def test_matches_split(self, text, as_bytes, index):
+        """Test that find-based slicing returns the same segment as split"""
+        data = text.encode('utf-8') if as_bytes else text
+        sep = b'@' if as_bytes else '@'
+
+        assert _segment(data, index) == data.split(sep)[index]
+
+    def test_missing_segment_raises(self):
+        """Test that too few segments raise IndexError like split indexing"""
+        with pytest.raises(IndexError):
+            _segment("h1@h2", 2)
+
+
+class TestReadStreamSegment:
+    """Tests for read_stream_segment"""
+
+    @pytest.mark.parametrize("chunk_size", [1, 2, 5, 1024])
+    def test_segment_across_chunk_boundaries(self, chunk_size):
+        """Test that the segment is reassembled regardless of where chunks split"""
+        body = "h1@h2@1,a;2,نماد@ob1;ob2@tail".encode('utf-8')
+        chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)]
+
+        assert read_stream_segment(chunks, 2) == "1,a;2,نماد".encode('utf-8')
+        assert read_stream_segment(chunks, 0) == b"h1"
+
+    def test_stops_reading_after_segment(self):
+        """Test that chunks after the requested segment are not consumed"""
+        consumed = []
+
+        def chunks():
+            for chunk in (b"h1@h2@rows", b";more@order", b"book", b"@tail"):
+                consumed.append(chunk)
+                yield chunk
+
+        assert read_stream_segment(chunks(), 2) == b"rows;more"
+        assert consumed == [b"h1@h2@rows", b";more@order"]
+
+    def test_last_segment_without_trailing_separator(self):
+        """Test reading a final segment that ends with the stream"""
+        assert read_stream_segment([b"h1@h2@rows"], 2) == b"rows"
+
+    def test_missing_segment_raises(self):
+        """Test that a response with too few segments raises IndexError like str.split"""
+        with pytest.raises(IndexError):
+            read_stream_segment([b"Invalid response"], 2)
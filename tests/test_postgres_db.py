@@ -8,23 +8,53 @@ from database.postgres_db import PostgreSQLDatabase
 from database.models import Stock, PriceHistory, RIHistory, Index, IndexHistory, Sector, SectorIndexHistory, Shareholder, MajorShareholderHistory, IntradayTrade, USDHistory
 
 
+class SessionStub:
+    """Only the Session methods PostgreSQLDatabase calls, as plain Mocks (no lazy children or magic methods)"""
+
+    METHODS = ('query', 'execute', 'connection', 'add', 'commit', 'rollback', 'close', 'refresh', 'expunge')
+
+    def __init__(self):
+        for name in self.METHODS:
+            setattr(self, name, Mock())
+
+    def assert_unused(self):
+        """Assert no session method was called"""
+        for name in self.METHODS:
+            getattr(self, name).assert_not_called()
+
+
+@pytest.fixture
+def pg_session_stub(monkeypatch):
+    """SessionStub returned by every DatabaseBase.get_session call (distinct from conftest's autospec mock_session)"""
+    session = SessionStub()
+    monkeypatch.setattr('database.postgres_db.DatabaseBase.get_session', lambda self: session)
+    return session
+
+
 class TestPostgreSQLDatabase:
     """Test PostgreSQL database operations"""
 
-    def setup_method(self, method):
-        """Setup test instance"""
-        with patch('database.postgres_db.DatabaseBase.__init__') as mock_init:
-            mock_init.return_value = None
-            self.db = PostgreSQLDatabase()
-
-    @patch('database.postgres_db.DatabaseBase.get_session')
-    def test_add_stock_success(self, mock_get_session):
+    @classmethod
+    def setup_class(cls):
+        """Build one instance for the class; every test patches its own session"""
+        with patch('database.postgres_db.DatabaseBase.__init__', return_value=None):
+            cls.db = PostgreSQLDatabase()
+        # Non-psycopg2 driver by default so large batches take the INSERT path
+        cls.db.engine = MagicMock()
+        cls.db.engine.dialect.driver = 'psycopg'
+
+    @pytest.fixture(autouse=True)
+    def fresh_lookup_cache(self):
+        """The lookup cache is the shared instance's only state; empty it so test order (or xdist split) never matters"""
+        self.db._lookup_cache.clear()
+        yield
+        self.db._lookup_cache.clear()
+
+    def test_add_stock_success(self, pg_session_stub):
         """Test adding new stock successfully"""
-        mock_session = MagicMock()
-        mock_get_session.return_value = mock_session
-
-        # Mock no existing stock
-        mock_session.query.return_value.filter.return_value.first.return_value = None
+        # INSERT ... RETURNING yields the new row
+        new_stock = MagicMock()
+        pg_session_stub.execute.return_value.scalar_one_or_none.return_value = new_stock
 
         stock_data = {
             'ticker': 'TEST',
@@ -34,22 +64,19 @@ class TestPostgreSQLDatabase:
 
         result = self.db.add_stock(stock_data)
 
-        assert result is not None
-        mock_session.add.assert_called_once()
-        mock_session.commit.assert_called_once()
-        mock_session.refresh.assert_called_once()
-        mock_session.expunge.assert_called_once()
-        mock_session.close.assert_called_once()
+        assert result is new_stock
+        pg_session_stub.execute.assert_called_once()
+        pg_session_stub.query.assert_not_called()
+        pg_session_stub.add.assert_not_called()
+        pg_session_stub.refresh.assert_not_called()
+        pg_session_stub.commit.assert_called_once()
+        pg_session_stub.expunge.assert_called_once_with(new_stock)
+        pg_session_stub.close.assert_called_once()
 
-    @patch('database.postgres_db.DatabaseBase.get_session')
-    def test_add_stock_existing(self, mock_get_session):
+    def test_add_stock_existing(self, pg_session_stub):
         """Test adding existing stock returns None"""
-        mock_session = MagicMock()
-        mock_get_session.return_value = mock_session
-
-        # Mock existing stock
-        existing_stock = MagicMock()
-        mock_session.query.return_value.filter.return_value.first.return_value = existing_stock
+        # ON CONFLICT DO NOTHING returns no row
+        pg_session_stub.execute.return_value.scalar_one_or_none.return_value = None
 
         stock_data = {
             'ticker': 'TEST',
@@ -59,95 +86,214 @@ class TestPostgreSQLDatabase:
         result = self.db.add_stock(stock_data)
 
         assert result is None
-        mock_session.add.assert_not_called()
-        mock_session.commit.assert_not_called()
-        mock_session.close.assert_called_once()
-
-    @patch('database.postgres_db.DatabaseBase.get_session')
-    def test_add_stock_exception(self, mock_get_session):
+        pg_session_stub.execute.assert_called_once()
+        pg_session_stub.commit.assert_not_called()
+        pg_session_stub.close.assert_called_once()
+
+    @pytest.mark.parametrize('method,data,table,conflict', [
+        ('add_stock', {'ticker': 'TEST', 'name': 'Test Stock', 'web_id': '12345'}, 'stocks', 'ticker'),
+        ('add_index', {'name': 'Test Index', 'web_id': 'TEST'}, 'indices', 'name'),
+        ('add_shareholder', {'shareholder_id': '123', 'name': 'Test Shareholder'}, 'shareholders', 'shareholder_id'),
+    ])
+    def test_add_single_insert_returning(self, pg_session_stub, method, data, table, conflict):
+        """Test add_* sends one INSERT ... ON CONFLICT DO NOTHING RETURNING every column, with no refresh SELECT"""
+        from sqlalchemy.dialects import postgresql
+
+        new_row = MagicMock()
+        pg_session_stub.execute.return_value.scalar_one_or_none.return_value = new_row
+
+        result = getattr(self.db, method)(data)
+
+        assert result is new_row
+        stmt = pg_session_stub.execute.call_args.args[0]
+        sql = str(stmt.compile(dialect=postgresql.dialect()))
+        assert sql.startswith(f'INSERT INTO {table}')
+        assert f'ON CONFLICT ({conflict}) DO NOTHING' in sql
+        returned = sql.split('RETURNING', 1)[1]
+        assert all(f'{table}.{column.name}' in returned for column in stmt.table.columns)
+        pg_session_stub.execute.assert_called_once()
+        pg_session_stub.refresh.assert_not_called()
+
+    def test_add_stock_exception(self, pg_session_stub):
         """Test handling exception during stock addition"""
-        mock_session = MagicMock()
-        mock_get_session.return_value = mock_session
-
-        mock_session.query.return_value.filter.return_value.first.side_effect = Exception("DB error")
+        pg_session_stub.execute.side_effect = Exception("DB error")
 
         stock_data = {'ticker': 'TEST'}
 
-        result = self.db.add_stock(stock_data)
+        with patch('database.base.logger') as mock_logger:
+            result = self.db.add_stock(stock_data)
 
         assert result is None
-        mock_session.rollback.assert_called_once()
-        mock_session.close.assert_called_once()
-
-    @patch('database.postgres_db.DatabaseBase.get_session')
-    def test_get_stock_by_ticker(self, mock_get_session):
+        pg_session_stub.rollback.assert_called_once()
+        pg_session_stub.close.assert_called_once()
+        # The failing call's arguments identify the row in the log
+        message = mock_logger.error.call_args.args[0]
+        assert message.startswith('Error in add_stock(')
+        assert "'ticker': 'TEST'" in message
+
+    def test_get_stock_by_ticker(self, pg_session_stub):
         """Test getting stock by ticker"""
-        mock_session = MagicMock()
         mock_stock = MagicMock()
-        mock_get_session.return_value = mock_session
-        mock_session.query.return_value.filter.return_value.first.return_value = mock_stock
+        pg_session_stub.execute.return_value.scalar_one_or_none.return_value = mock_stock
 
         result = self.db.get_stock_by_ticker('TEST')
 
         assert result == mock_stock
-        mock_session.close.assert_called_once()
+        pg_session_stub.close.assert_called_once()
+
+    def test_get_stock_by_ticker_cached(self, pg_session_stub):
+        """Test repeated ticker lookups hit the database once and hand out separate detached copies"""
+        stock = Stock(id=1, ticker='TEST', name='Test Stock', web_id='12345', market='Bourse')
+        pg_session_stub.execute.return_value.scalar_one_or_none.return_value = stock
+
+        first = self.db.get_stock_by_ticker('TEST')
+        second = self.db.get_stock_by_ticker('TEST')
+
+        assert first is stock
+        assert second is not stock
+        assert (second.id, second.ticker, second.web_id) == (1, 'TEST', '12345')
+        pg_session_stub.execute.assert_called_once()
+        pg_session_stub.close.assert_called_once()
+
+    def test_lookup_cache_is_bounded(self, pg_session_stub):
+        """Test the least recently used entry is evicted once LOOKUP_CACHE_MAXSIZE is reached"""
+        from database import postgres_db
+
+        with patch.object(postgres_db, 'LOOKUP_CACHE_MAXSIZE', 2):
+            for i, ticker in enumerate(('AAA', 'BBB', 'CCC'), 1):
+                self.db._remember(Stock.ticker, Stock(id=i, ticker=ticker, web_id=str(i)))
+
+        assert len(self.db._lookup_cache) == 2
+        assert self.db._cached(Stock, Stock.ticker, 'AAA') is None
+        assert self.db._cached(Stock, Stock.ticker, 'CCC').id == 3
+
+    def test_invalidate_drops_cached_row(self, pg_session_stub):
+        """Test invalidate forces the next lookup back to the database"""
+        stock = Stock(id=1, ticker='TEST', web_id='12345')
+        self.db._remember(Stock.ticker, stock)
+        pg_session_stub.execute.return_value.scalar_one_or_none.return_value = stock
+
+        self.db.invalidate(Stock, Stock.ticker, 'TEST')
+
+        assert self.db.get_stock_by_ticker('TEST') is stock
+        pg_session_stub.execute.assert_called_once()
+
+    def test_add_stock_conflict_invalidates_cached_row(self, pg_session_stub):
+        """Test a conflicting add_stock drops the cached copy of that ticker"""
+        self.db._remember(Stock.ticker, Stock(id=1, ticker='TEST', web_id='12345'))
+        pg_session_stub.execute.return_value.scalar_one_or_none.return_value = None
+
+        assert self.db.add_stock({'ticker': 'TEST', 'name': 'Test Stock'}) is None
+        assert self.db._cached(Stock, Stock.ticker, 'TEST') is None
+
+    def test_batch_insert_into_cached_table_clears_cache(self, pg_session_stub):
+        """Test writing stocks through batch_insert empties the lookup cache"""
+        self.db._remember(Stock.ticker, Stock(id=1, ticker='TEST', web_id='12345'))
 
-    @patch('database.postgres_db.DatabaseBase.get_session')
-    def test_get_stock_by_web_id(self, mock_get_session):
+        self.db.batch_insert(Stock, [{'ticker': 'NEW', 'name': 'New', 'web_id': '1', 'market': 'Bourse'}])
+
+        assert not self.db._lookup_cache
+
+    def test_get_stock_by_ticker_miss_not_cached(self, pg_session_stub):
+        """Test a missing ticker is looked up again once it exists"""
+        mock_stock = MagicMock()
+        pg_session_stub.execute.return_value.scalar_one_or_none.side_effect = [None, mock_stock]
+
+        assert self.db.get_stock_by_ticker('TEST') is None
+        assert self.db.get_stock_by_ticker('TEST') is mock_stock
+        assert pg_session_stub.execute.call_count == 2
+
+    def test_add_stock_populates_lookup_cache(self, pg_session_stub):
+        """Test a newly added stock is served from the cache by ticker and web_id"""
+        new_stock = Stock(id=1, ticker='TEST', name='Test Stock', web_id='12345', market='Bourse')
+        pg_session_stub.execute.return_value.scalar_one_or_none.return_value = new_stock
+
+        self.db.add_stock({'ticker': 'TEST', 'name': 'Test Stock', 'web_id': '12345'})
+
+        assert self.db.get_stock_by_ticker('TEST').id == 1
+        assert self.db.get_stock_by_web_id('12345').ticker == 'TEST'
+        pg_session_stub.execute.assert_called_once()
+
+    def test_get_stocks_by_tickers(self, pg_session_stub):
+        """Test resolving several tickers with one IN query"""
+        stocks = [Stock(id=1, ticker='AAA', web_id='1'), Stock(id=2, ticker='BBB', web_id='2')]
+        pg_session_stub.execute.return_value.scalars.return_value = stocks
+
+        result = self.db.get_stocks_by_tickers(['AAA', 'BBB', 'CCC', 'AAA'])
+
+        assert result == {'AAA': stocks[0], 'BBB': stocks[1]}
+        pg_session_stub.execute.assert_called_once()
+        pg_session_stub.close.assert_called_once()
+        # Found stocks are cached for single lookups
+        assert self.db.get_stock_by_ticker('BBB').id == 2
+        pg_session_stub.execute.assert_called_once()
+
+    def test_get_stocks_by_tickers_chunks_in_clause(self, pg_session_stub):
+        """Test large ticker lists are split into IN_CLAUSE_MAX_ITEMS chunks in one session"""
+        from database.postgres_db import IN_CLAUSE_MAX_ITEMS
+
+        pg_session_stub.execute.return_value.scalars.return_value = []
+
+        result = self.db.get_stocks_by_tickers([f'T{i}' for i in range(IN_CLAUSE_MAX_ITEMS + 1)])
+
+        assert result == {}
+        assert pg_session_stub.execute.call_count == 2
+        pg_session_stub.close.assert_called_once()
+
+    def test_get_stocks_by_tickers_all_cached(self, pg_session_stub):
+        """Test cached tickers skip the database entirely"""
+        self.db._remember(Stock.ticker, Stock(id=1, ticker='AAA', web_id='1'))
+
+        result = self.db.get_stocks_by_tickers(['AAA'])
+
+        assert list(result) == ['AAA']
+        assert result['AAA'].id == 1
+        pg_session_stub.assert_unused()
+
+    def test_get_stock_by_web_id(self, pg_session_stub):
         """Test getting stock by web_id"""
-        mock_session = MagicMock()
         mock_stock = MagicMock()
-        mock_get_session.return_value = mock_session
-        mock_session.query.return_value.filter.return_value.first.return_value = mock_stock
+        pg_session_stub.execute.return_value.scalar_one_or_none.return_value = mock_stock
 
         result = self.db.get_stock_by_web_id('12345')
 
         assert result == mock_stock
-        mock_session.close.assert_called_once()
+        pg_session_stub.close.assert_called_once()
 
-    @patch('database.postgres_db.DatabaseBase.get_session')
-    def test_get_sector_by_code(self, mock_get_session):
+    def test_get_sector_by_code(self, pg_session_stub):
         """Test getting sector by code"""
-        mock_session = MagicMock()
         mock_sector = MagicMock()
-        mock_get_session.return_value = mock_session
-        mock_session.query.return_value.filter.return_value.first.return_value = mock_sector
+        pg_session_stub.execute.return_value.scalar_one_or_none.return_value = mock_sector
 
         result = self.db.get_sector_by_code(1.0)
 
         assert result == mock_sector
-        mock_session.close.assert_called_once()
-
-    @patch('database.postgres_db.DatabaseBase.batch_insert')
-    def test_add_price_history(self, mock_batch_insert):
-        """Test adding price history"""
-        mock_batch_insert.return_value = 5
-
-        history_data = [{'date': '2023-01-01', 'price': 100}]
-        result = self.db.add_price_history(history_data)
+        pg_session_stub.close.assert_called_once()
+
+    @pytest.mark.parametrize('method,model', [
+        ('add_price_history', PriceHistory),
+        ('add_ri_history', RIHistory),
+        ('add_index_history', IndexHistory),
+        ('add_sector_index_history', SectorIndexHistory),
+        ('add_major_shareholder_history', MajorShareholderHistory),
+        ('add_intraday_trades', IntradayTrade),
+        ('add_usd_history', USDHistory),
+    ])
+    @patch('database.postgres_db.PostgreSQLDatabase.batch_insert', return_value=5)
+    def test_add_history_delegates_to_batch_insert(self, mock_batch_insert, method, model):
+        """Test every add_*_history method hands its rows to batch_insert with its model"""
+        history_data = [{'stock_id': 1, 'j_date': '1402-01-01'}]
+
+        result = getattr(self.db, method)(history_data)
 
         assert result == 5
-        mock_batch_insert.assert_called_once_with(PriceHistory, history_data)
-
-    @patch('database.postgres_db.DatabaseBase.batch_insert')
-    def test_add_ri_history(self, mock_batch_insert):
-        """Test adding RI history"""
-        mock_batch_insert.return_value = 3
-
-        history_data = [{'date': '2023-01-01', 'ri_value': 50}]
-        result = self.db.add_ri_history(history_data)
+        mock_batch_insert.assert_called_once_with(model, history_data)
 
-        assert result == 3
-        mock_batch_insert.assert_called_once_with(RIHistory, history_data)
-
-    @patch('database.postgres_db.DatabaseBase.get_session')
-    def test_add_index_success(self, mock_get_session):
+    def test_add_index_success(self, pg_session_stub):
         """Test adding new index successfully"""
-        mock_session = MagicMock()
-        mock_get_session.return_value = mock_session
-
-        # Mock no existing index
-        mock_session.query.return_value.filter.return_value.first.return_value = None
+        # INSERT ... RETURNING yields the new row
+        new_index = MagicMock()
+        pg_session_stub.execute.return_value.scalar_one_or_none.return_value = new_index
 
         index_data = {
             'name': 'Test Index',
@@ -156,62 +302,37 @@ class TestPostgreSQLDatabase:
 
         result = self.db.add_index(index_data)
 
-        assert result is not None
-        mock_session.add.assert_called_once()
-        mock_session.commit.assert_called_once()
-        mock_session.refresh.assert_called_once()
-        mock_session.expunge.assert_called_once()
-        mock_session.close.assert_called_once()
+        assert result is new_index
+        pg_session_stub.execute.assert_called_once()
+        pg_session_stub.query.assert_not_called()
+        pg_session_stub.add.assert_not_called()
+        pg_session_stub.refresh.assert_not_called()
+        pg_session_stub.commit.assert_called_once()
+        pg_session_stub.expunge.assert_called_once_with(new_index)
+        pg_session_stub.close.assert_called_once()
 
-    @patch('database.postgres_db.DatabaseBase.get_session')
-    def test_add_index_existing(self, mock_get_session):
+    def test_add_index_existing(self, pg_session_stub):
         """Test adding existing index returns existing"""
-        mock_session = MagicMock()
-        mock_get_session.return_value = mock_session
-
-        # Mock existing index
+        # ON CONFLICT DO NOTHING returns no row, then one SELECT loads the existing index
         existing_index = MagicMock()
-        mock_session.query.return_value.filter.return_value.first.return_value = existing_index
+        pg_session_stub.execute.return_value.scalar_one_or_none.side_effect = [None, existing_index]
 
         index_data = {'name': 'Test Index'}
 
         result = self.db.add_index(index_data)
 
         assert result == existing_index
-        mock_session.add.assert_not_called()
-        mock_session.commit.assert_not_called()
-        mock_session.close.assert_called_once()
+        assert pg_session_stub.execute.call_count == 2
+        pg_session_stub.expunge.assert_called_once_with(existing_index)
+        # with_session commits whenever a row is returned, new or existing
+        pg_session_stub.commit.assert_called_once()
+        pg_session_stub.close.assert_called_once()
 
-    @patch('database.postgres_db.DatabaseBase.batch_insert')
-    def test_add_index_history(self, mock_batch_insert):
-        """Test adding index history"""
-        mock_batch_insert.return_value = 10
-
-        history_data = [{'date': '2023-01-01', 'value': 1000}]
-        result = self.db.add_index_history(history_data)
-
-        assert result == 10
-        mock_batch_insert.assert_called_once_with(IndexHistory, history_data)
-
-    @patch('database.postgres_db.DatabaseBase.batch_insert')
-    def test_add_sector_index_history(self, mock_batch_insert):
-        """Test adding sector index history"""
-        mock_batch_insert.return_value = 7
-
-        history_data = [{'date': '2023-01-01', 'sector_value': 500}]
-        result = self.db.add_sector_index_history(history_data)
-
-        assert result == 7
-        mock_batch_insert.assert_called_once_with(SectorIndexHistory, history_data)
-
-    @patch('database.postgres_db.DatabaseBase.get_session')
-    def test_add_shareholder_success(self, mock_get_session):
+    def test_add_shareholder_success(self, pg_session_stub):
         """Test adding new shareholder successfully"""
-        mock_session = MagicMock()
-        mock_get_session.return_value = mock_session
-
-        # Mock no existing shareholder
-        mock_session.query.return_value.filter.return_value.first.return_value = None
+        # INSERT ... RETURNING yields the new row
+        new_shareholder = MagicMock()
+        pg_session_stub.execute.return_value.scalar_one_or_none.return_value = new_shareholder
 
         shareholder_data = {
             'shareholder_id': '123',
@@ -220,185 +341,203 @@ class TestPostgreSQLDatabase:
 
         result = self.db.add_shareholder(shareholder_data)
 
-        assert result is not None
-        mock_session.add.assert_called_once()
-        mock_session.commit.assert_called_once()
-        mock_session.refresh.assert_called_once()
-        mock_session.expunge.assert_called_once()
-        mock_session.close.assert_called_once()
+        assert result is new_shareholder
+        pg_session_stub.execute.assert_called_once()
+        pg_session_stub.query.assert_not_called()
+        pg_session_stub.add.assert_not_called()
+        pg_session_stub.refresh.assert_not_called()
+        pg_session_stub.commit.assert_called_once()
+        pg_session_stub.expunge.assert_called_once_with(new_shareholder)
+        pg_session_stub.close.assert_called_once()
 
-    @patch('database.postgres_db.DatabaseBase.get_session')
-    def test_add_shareholder_existing(self, mock_get_session):
+    def test_add_shareholder_existing(self, pg_session_stub):
         """Test adding existing shareholder returns existing"""
-        mock_session = MagicMock()
-        mock_get_session.return_value = mock_session
-
-        # Mock existing shareholder
+        # ON CONFLICT DO NOTHING returns no row, then one SELECT loads the existing shareholder
         existing_shareholder = MagicMock()
-        mock_session.query.return_value.filter.return_value.first.return_value = existing_shareholder
+        pg_session_stub.execute.return_value.scalar_one_or_none.side_effect = [None, existing_shareholder]
 
         shareholder_data = {'shareholder_id': '123'}
 
         result = self.db.add_shareholder(shareholder_data)
 
         assert result == existing_shareholder
-        mock_session.add.assert_not_called()
-        mock_session.commit.assert_not_called()
-        mock_session.close.assert_called_once()
+        assert pg_session_stub.execute.call_count == 2
+        pg_session_stub.expunge.assert_called_once_with(existing_shareholder)
+        # with_session commits whenever a row is returned, new or existing
+        pg_session_stub.commit.assert_called_once()
+        pg_session_stub.close.assert_called_once()
 
-    @patch('database.postgres_db.DatabaseBase.get_session')
-    def test_get_shareholder_by_id(self, mock_get_session):
+    def test_get_shareholder_by_id(self, pg_session_stub):
         """Test getting shareholder by id"""
-        mock_session = MagicMock()
         mock_shareholder = MagicMock()
-        mock_get_session.return_value = mock_session
-        mock_session.query.return_value.filter.return_value.first.return_value = mock_shareholder
+        pg_session_stub.execute.return_value.scalar_one_or_none.return_value = mock_shareholder
 
         result = self.db.get_shareholder_by_id('123')
 
         assert result == mock_shareholder
-        mock_session.close.assert_called_once()
-
-    @patch('database.postgres_db.DatabaseBase.batch_insert')
-    def test_add_major_shareholder_history(self, mock_batch_insert):
-        """Test adding major shareholder history"""
-        mock_batch_insert.return_value = 4
-
-        history_data = [{'date': '2023-01-01', 'shares': 1000}]
-        result = self.db.add_major_shareholder_history(history_data)
-
-        assert result == 4
-        mock_batch_insert.assert_called_once_with(MajorShareholderHistory, history_data)
-
-    @patch('database.postgres_db.DatabaseBase.batch_insert')
-    def test_add_intraday_trades(self, mock_batch_insert):
-        """Test adding intraday trades"""
-        mock_batch_insert.return_value = 20
-
-        trades_data = [{'time': '09:00', 'price': 100}]
-        result = self.db.add_intraday_trades(trades_data)
-
-        assert result == 20
-        mock_batch_insert.assert_called_once_with(IntradayTrade, trades_data)
-
-    @patch('database.postgres_db.DatabaseBase.batch_insert')
-    def test_add_usd_history(self, mock_batch_insert):
-        """Test adding USD history"""
-        mock_batch_insert.return_value = 30
-
-        history_data = [{'date': '2023-01-01', 'rate': 50000}]
-        result = self.db.add_usd_history(history_data)
-
-        assert result == 30
-        mock_batch_insert.assert_called_once_with(USDHistory, history_data)
-
-    @patch('database.postgres_db.DatabaseBase.get_session')
-    def test_get_last_price_date(self, mock_get_session):
-        """Test getting last price date"""
-        mock_session = MagicMock()
-        mock_get_session.return_value = mock_session
-
-        # Mock query result
-        mock_result = ('1402-01-01',)
-        mock_session.query.return_value.filter.return_value.order_by.return_value.first.return_value = mock_result
-
-        result = self.db.get_last_price_date(1)
-
+        pg_session_stub.close.assert_called_once()
+
+    @pytest.mark.parametrize('method,args,value', [
+        ('get_last_price_date', (1,), '1402-01-01'),
+        ('get_last_price_date', (1,), None),
+        ('get_last_ri_date', (1,), '1402-01-01'),
+        ('get_last_index_date', (1,), '1402-01-01'),
+        ('get_last_sector_index_date', (1,), '1402-01-01'),
+        ('get_last_shareholder_date', (1,), '1402-01-01'),
+        ('get_last_usd_date', (), '1402-01-01'),
+        ('get_last_usd_date', (), None),
+    ])
+    def test_get_last_date(self, pg_session_stub, method, args, value):
+        """Test last-date lookups return the MAX(j_date) scalar, or None when the table is empty"""
+        pg_session_stub.execute.return_value.scalar.return_value = value
+
+        result = getattr(self.db, method)(*args)
+
+        assert result == value
+        # Keyed lookups bind the id; the USD lookup has no parameters
+        assert pg_session_stub.execute.call_args.args[1:] == (({'key': args[0]},) if args else ())
+        pg_session_stub.close.assert_called_once()
+
+    def test_get_last_price_date_uses_max_aggregate(self, pg_session_stub):
+        """Test the last-date lookup is one MAX(j_date) aggregate without ORDER BY/LIMIT"""
+        from sqlalchemy.dialects import postgresql
+
+        pg_session_stub.execute.return_value.scalar.return_value = '1402-01-01'
+
+        result = self.db.get_last_price_date(7)
+
+        stmt, params = pg_session_stub.execute.call_args.args
+        sql = str(stmt.compile(dialect=postgresql.dialect()))
         assert result == '1402-01-01'
-        mock_session.close.assert_called_once()
-
-    @patch('database.postgres_db.DatabaseBase.get_session')
-    def test_get_last_price_date_none(self, mock_get_session):
-        """Test getting last price date when none exists"""
-        mock_session = MagicMock()
-        mock_get_session.return_value = mock_session
-
-        mock_session.query.return_value.filter.return_value.order_by.return_value.first.return_value = None
+        assert params == {'key': 7}
+        assert 'max(price_history.j_date)' in sql
+        assert 'ORDER BY' not in sql
+        assert 'LIMIT' not in sql
+        pg_session_stub.query.assert_not_called()
+
+    def test_session_scope_closes_on_success(self, pg_session_stub):
+        """Test session_scope returns the session to the pool without committing"""
+        with self.db.session_scope() as session:
+            assert session is pg_session_stub
 
-        result = self.db.get_last_price_date(1)
+        pg_session_stub.rollback.assert_not_called()
+        pg_session_stub.commit.assert_not_called()
+        pg_session_stub.close.assert_called_once()
 
-        assert result is None
-        mock_session.close.assert_called_once()
-
-    @patch('database.postgres_db.DatabaseBase.get_session')
-    def test_get_last_ri_date(self, mock_get_session):
-        """Test getting last RI date"""
-        mock_session = MagicMock()
-        mock_get_session.return_value = mock_session
+    def test_session_scope_rolls_back_on_error(self, pg_session_stub):
+        """Test session_scope rolls back, closes and re-raises on error"""
+        with pytest.raises(RuntimeError):
+            with self.db.session_scope():
+                raise RuntimeError("boom")
 
-        mock_result = ('1402-01-01',)
-        mock_session.query.return_value.filter.return_value.order_by.return_value.first.return_value = mock_result
+        pg_session_stub.rollback.assert_called_once()
+        pg_session_stub.close.assert_called_once()
+
+
+    def test_batch_insert_large_core_executemany(self, pg_session_stub):
+        """Test large batches go through Core executemany in INSERT_CHUNK_SIZE chunks with one commit"""
+        from database.base import INSERT_CHUNK_SIZE
+
+        execute = pg_session_stub.connection.return_value.execute
+
+        rows = [{'stock_id': 1, 'j_date': f'{i:08d}'} for i in range(2 * INSERT_CHUNK_SIZE + 1)]
+        result = self.db.add_price_history(rows)
+
+        assert result == len(rows)
+        assert [len(call.args[1]) for call in execute.call_args_list] == [INSERT_CHUNK_SIZE, INSERT_CHUNK_SIZE, 1]
+        assert execute.call_args_list[0].args[0].table is PriceHistory.__table__
+        pg_session_stub.commit.assert_called_once()
+        pg_session_stub.close.assert_called_once()
+
+    def test_batch_insert_large_uses_copy(self, pg_session_stub):
+        """Test batches of COPY_MIN_ROWS rows or more are streamed with COPY FROM STDIN on psycopg2"""
+        from database.postgres_db import COPY_MIN_ROWS
+
+        cursor = pg_session_stub.connection.return_value.connection.cursor.return_value
+
+        rows = [{'stock_id': 1, 'j_date': '1402-01-01', 'time': f'{i:08d}', 'price': 100, 'volume': None}
+                for i in range(COPY_MIN_ROWS)]
+        rows[0]['time'] = 'a\tb'
+        with patch.object(self.db.engine.dialect, 'driver', 'psycopg2'):
+            result = self.db.add_intraday_trades(rows)
+
+        assert result == COPY_MIN_ROWS
+        sql, buf = cursor.copy_expert.call_args.args
+        assert sql == 'COPY intraday_trades (stock_id, j_date, time, price, volume) FROM STDIN'
+        lines = buf.getvalue().splitlines()
+        assert len(lines) == COPY_MIN_ROWS
+        assert lines[0] == '1\t1402-01-01\ta\\tb\t100\t\\N'
+        pg_session_stub.connection.return_value.execute.assert_not_called()
+        cursor.close.assert_called_once()
+        pg_session_stub.commit.assert_called_once()
+        pg_session_stub.close.assert_called_once()
+
+    def test_batch_insert_large_mixed_keys_skips_copy(self, pg_session_stub):
+        """Test rows with differing key sets take the INSERT path instead of COPY dropping or nulling keys"""
+        from database.postgres_db import COPY_MIN_ROWS
+
+        cursor = pg_session_stub.connection.return_value.connection.cursor.return_value
+
+        rows = [{'stock_id': 1, 'j_date': f'{i:08d}'} for i in range(COPY_MIN_ROWS)]
+        rows[-1]['volume'] = 10
+        with patch.object(self.db.engine.dialect, 'driver', 'psycopg2'):
+            result = self.db.add_intraday_trades(rows)
+
+        assert result == COPY_MIN_ROWS
+        cursor.copy_expert.assert_not_called()
+        pg_session_stub.connection.return_value.execute.assert_called_once()
+
+    def test_batch_insert_large_other_driver_uses_insert(self, pg_session_stub):
+        """Test drivers without copy_expert keep the Core INSERT path"""
+        from database.postgres_db import COPY_MIN_ROWS
+
+        result = self.db.add_price_history([{'stock_id': 1, 'j_date': f'{i:08d}'} for i in range(COPY_MIN_ROWS)])
+
+        assert result == COPY_MIN_ROWS
+        pg_session_stub.connection.return_value.execute.assert_called_once()
+        pg_session_stub.connection.return_value.connection.cursor.assert_not_called()
+
+    def test_batch_insert_copy_error_rolls_back(self, pg_session_stub):
+        """Test a failing COPY rolls back and reports zero rows"""
+        from database.postgres_db import COPY_MIN_ROWS
+
+        cursor = pg_session_stub.connection.return_value.connection.cursor.return_value
+        cursor.copy_expert.side_effect = Exception("duplicate key")
+
+        with patch.object(self.db.engine.dialect, 'driver', 'psycopg2'):
+            result = self.db.add_price_history([{'stock_id': 1, 'j_date': f'{i:08d}'} for i in range(COPY_MIN_ROWS)])
+
+        assert result == 0
+        pg_session_stub.rollback.assert_called_once()
+        pg_session_stub.commit.assert_not_called()
+        pg_session_stub.close.assert_called_once()
+
+    def test_batch_insert_error_rolls_back(self, pg_session_stub):
+        """Test a failing chunk rolls back the whole batch and reports zero rows"""
+        pg_session_stub.connection.return_value.execute.side_effect = Exception("DB error")
+
+        result = self.db.add_price_history([{'stock_id': 1, 'j_date': '1402-01-01'}])
+
+        assert result == 0
+        pg_session_stub.rollback.assert_called_once()
+        pg_session_stub.commit.assert_not_called()
+        pg_session_stub.close.assert_called_once()
 
-        result = self.db.get_last_ri_date(1)
+class TestGetPostgresSession:
+    """Test the module-level session helper"""
+
+    def test_reuses_one_database_instance(self):
+        """Test get_postgres_session builds the engine once and reuses it"""
+        from database import postgres_db
 
-        assert result == '1402-01-01'
-        mock_session.close.assert_called_once()
-
-    @patch('database.postgres_db.DatabaseBase.get_session')
-    def test_get_last_index_date(self, mock_get_session):
-        """Test getting last index date"""
-        mock_session = MagicMock()
-        mock_get_session.return_value = mock_session
-
-        mock_result = ('1402-01-01',)
-        mock_session.query.return_value.filter.return_value.order_by.return_value.first.return_value = mock_result
-
-        result = self.db.get_last_index_date(1)
-
-        assert result == '1402-01-01'
-        mock_session.close.assert_called_once()
-
-    @patch('database.postgres_db.DatabaseBase.get_session')
-    def test_get_last_sector_index_date(self, mock_get_session):
-        """Test getting last sector index date"""
-        mock_session = MagicMock()
-        mock_get_session.return_value = mock_session
-
-        mock_result = ('1402-01-01',)
-        mock_session.query.return_value.filter.return_value.order_by.return_value.first.return_value = mock_result
-
-        result = self.db.get_last_sector_index_date(1)
-
-        assert result == '1402-01-01'
-        mock_session.close.assert_called_once()
-
-    @patch('database.postgres_db.DatabaseBase.get_session')
-    def test_get_last_shareholder_date(self, mock_get_session):
-        """Test getting last shareholder date"""
-        mock_session = MagicMock()
-        mock_get_session.return_value = mock_session
-
-        mock_result = ('1402-01-01',)
-        mock_session.query.return_value.filter.return_value.order_by.return_value.first.return_value = mock_result
-
-        result = self.db.get_last_shareholder_date(1)
-
-        assert result == '1402-01-01'
-        mock_session.close.assert_called_once()
-
-    @patch('database.postgres_db.DatabaseBase.get_session')
-    def test_get_last_usd_date(self, mock_get_session):
-        """Test getting last USD date"""
-        mock_session = MagicMock()
-        mock_get_session.return_value = mock_session
-
-        mock_result = ('1402-01-01',)
-        mock_session.query.return_value.order_by.return_value.first.return_value = mock_result
-
-        result = self.db.get_last_usd_date()
-
-        assert result == '1402-01-01'
-        mock_session.close.assert_called_once()
-
-    @patch('database.postgres_db.DatabaseBase.get_session')
-    def test_get_last_usd_date_none(self, mock_get_session):
-        """Test getting last USD date when none exists"""
-        mock_session = MagicMock()
-        mock_get_session.return_value = mock_session
-
-        mock_session.query.return_value.order_by.return_value.first.return_value = None
-
-        result = self.db.get_last_usd_date()
-
-        assert result is None
-        mock_session.close.assert_called_once()
\ No newline at end of file
+        postgres_db._shared_postgres_db.cache_clear()
+        try:
+            with patch('database.postgres_db.PostgreSQLDatabase') as mock_db_cls:
+                first = postgres_db.get_postgres_session()
+                second = postgres_db.get_postgres_session()
+
+            mock_db_cls.assert_called_once()
+            assert mock_db_cls.return_value.get_session.call_count == 2
+            assert first is second
+        finally:
+            postgres_db._shared_postgres_db.cache_clear()
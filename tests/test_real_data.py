@@ -4,7 +4,7 @@ import os
 import time
 from datetime import date, datetime, timedelta
 from unittest.mock import patch, MagicMock
-from main import TSEDataCollector
+from sqlalchemy.orm import scoped_session, sessionmaker
 from database.sqlite_db import SQLiteDatabase
 from database.postgres_db import PostgreSQLDatabase
  # حذف وابستگی به TSEAPIClient
@@ -33,7 +33,24 @@ class TestRealDataIntegration:
             pass
 
     @pytest.fixture
-    def temp_db(self, temp_db_path):
+    def temp_db(self, sqlite_memory_db):
+        # Run each test inside a transaction on the shared in-memory database
+        db = sqlite_memory_db
+        connection = db.engine.connect()
+        trans = connection.begin()
+        original_session = db.SessionLocal
+        db.SessionLocal = scoped_session(sessionmaker(
+            bind=connection, autoflush=False, join_transaction_mode="create_savepoint"
+        ))
+        db._id_cache.clear()
+        yield db
+        db.SessionLocal.remove()
+        db.SessionLocal = original_session
+        trans.rollback()
+        connection.close()
+
+    @pytest.fixture
+    def file_db(self, temp_db_path):
         with patch('database.base.DATABASE_URL', f'sqlite:///{temp_db_path}'):
             db = SQLiteDatabase()
             yield db
@@ -44,10 +61,17 @@ class TestRealDataIntegration:
                 pass
 
     @pytest.fixture
-    def collector(self, temp_db):
-        # Use real TSE API client (not mocked)
-        collector = TSEDataCollector()
-        collector.db = temp_db
+    def collector(self, temp_db, collector_cls):
+        # Use real TSE API client (not mocked); reuse the session-wide engine instead of building another
+        with patch('main.SQLiteDatabase', return_value=temp_db):
+            collector = collector_cls()
+        yield collector
+
+    @pytest.fixture
+    def file_collector(self, file_db, collector_cls):
+        # Backed by a real database file for tests that copy it on disk
+        collector = collector_cls()
+        collector.db = file_db
         yield collector
 
     def test_real_stock_list_fetch(self, collector):
@@ -783,7 +807,7 @@ class TestRealDataIntegration:
         print(f"Database connection pooling test: {sum(results)} total records retrieved")
 
     @pytest.mark.parametrize("database_type", ["sqlite", "postgres"])
-    def test_real_cross_database_compatibility(self, temp_db_path, database_type):
+    def test_real_cross_database_compatibility(self, temp_db_path, database_type, collector_cls):
         """Test compatibility across different database backends"""
         if database_type == "sqlite":
             with patch('database.base.DATABASE_URL', f'sqlite:///{temp_db_path}'):
@@ -792,7 +816,7 @@ class TestRealDataIntegration:
             # Skip postgres test if not configured
             pytest.skip("PostgreSQL not configured for testing")
 
-        collector = TSEDataCollector()
+        collector = collector_cls()
         collector.db = db
 
         try:
@@ -873,8 +897,9 @@ class TestRealDataIntegration:
         assert memory_mb < 1000  # Less than 1GB
         assert cpu_percent < 50   # Less than 50% CPU usage
 
-    def test_real_backup_and_recovery(self, collector, temp_db_path):
+    def test_real_backup_and_recovery(self, file_collector, temp_db_path, collector_cls):
         """Test backup and recovery functionality"""
+        collector = file_collector
         # Populate database
         collector.run_full_update()
 
@@ -891,7 +916,7 @@ class TestRealDataIntegration:
             # Simulate recovery by creating new collector with backup
             with patch('database.base.DATABASE_URL', f'sqlite:///{backup_file}'):
                 backup_db = SQLiteDatabase()
-                backup_collector = TSEDataCollector()
+                backup_collector = collector_cls()
                 backup_collector.db = backup_db
 
                 try:
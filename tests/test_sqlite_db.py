@@ -3,8 +3,9 @@ Tests for SQLite database implementation
 """
 
 import pytest
+from datetime import date
 from unittest.mock import MagicMock, patch, Mock
-from database.sqlite_db import SQLiteDatabase
+from database.sqlite_db import SQLiteDatabase, CORE_INSERT_CHUNK_SIZE, MULTI_VALUES_MAX_ROWS, _chunked, _column_values
 from database.models import Stock, PriceHistory, RIHistory, Index, IndexHistory, Sector, SectorIndexHistory, Shareholder, MajorShareholderHistory, IntradayTrade, USDHistory
 
 
@@ -19,12 +20,12 @@ class TestSQLiteDatabase:
 
     @patch('database.sqlite_db.DatabaseBase.get_session')
     def test_add_stock_success(self, mock_get_session):
-        """Test adding new stock successfully"""
+        """Test adding new stock successfully with a single UPSERT"""
         mock_session = MagicMock()
         mock_get_session.return_value = mock_session
 
-        # Mock no existing stock
-        mock_session.query.return_value.filter.return_value.first.return_value = None
+        new_stock = MagicMock()
+        mock_session.execute.return_value.scalar_one_or_none.return_value = new_stock
 
         stock_data = {
             'ticker': 'TEST',
@@ -34,11 +35,12 @@ class TestSQLiteDatabase:
 
         result = self.db.add_stock(stock_data)
 
-        assert result is not None
-        mock_session.add.assert_called_once()
+        assert result is new_stock
+        mock_session.query.assert_not_called()
+        mock_session.execute.assert_called_once()
+        assert 'ON CONFLICT' in str(mock_session.execute.call_args.args[0])
+        mock_session.expunge.assert_called_once_with(new_stock)
         mock_session.commit.assert_called_once()
-        mock_session.refresh.assert_called_once()
-        mock_session.expunge.assert_called_once()
         mock_session.close.assert_called_once()
 
     @patch('database.sqlite_db.DatabaseBase.get_session')
@@ -47,9 +49,8 @@ class TestSQLiteDatabase:
         mock_session = MagicMock()
         mock_get_session.return_value = mock_session
 
-        # Mock existing stock
-        existing_stock = MagicMock()
-        mock_session.query.return_value.filter.return_value.first.return_value = existing_stock
+        # ON CONFLICT DO NOTHING returns no row for an existing stock
+        mock_session.execute.return_value.scalar_one_or_none.return_value = None
 
         stock_data = {
             'ticker': 'TEST',
@@ -59,25 +60,24 @@ class TestSQLiteDatabase:
         result = self.db.add_stock(stock_data)
 
         assert result is None
-        mock_session.add.assert_not_called()
         mock_session.commit.assert_not_called()
         mock_session.close.assert_called_once()
 
-    @patch('database.sqlite_db.DatabaseBase.get_session')
-    def test_add_stock_exception(self, mock_get_session):
-        """Test handling exception during stock addition"""
-        mock_session = MagicMock()
-        mock_get_session.return_value = mock_session
-
-        mock_session.query.return_value.filter.return_value.first.side_effect = Exception("DB error")
-
-        stock_data = {'ticker': 'TEST'}
-
-        result = self.db.add_stock(stock_data)
-
-        assert result is None
-        mock_session.rollback.assert_called_once()
-        mock_session.close.assert_called_once()
+    def test_add_stock_exception(self, tmp_path):
+        """Test a failing insert is rolled back for real and leaves the session usable"""
+        db, stock_id = self._file_db(tmp_path)
+        try:
+            # web_id collides with the existing stock; the ticker conflict target does not cover it
+            duplicate = {'ticker': 'OTHER', 'name': 'Other', 'web_id': 'TX_WEB', 'market': 'Bourse'}
+            assert db.add_stock(duplicate) is None
+            assert db.add_stock({'ticker': 'NO_MARKET', 'name': 'x', 'web_id': 'NM'}) is None
+
+            added = db.add_stock({'ticker': 'NEXT', 'name': 'Next', 'web_id': 'NEXT_WEB', 'market': 'Bourse'})
+            assert added is not None
+            assert [s.ticker for s in db.get_all_stocks()] == ['TX', 'NEXT']
+            assert ('stocks', 'ticker', 'OTHER') not in db._id_cache
+        finally:
+            db.close()
 
     @patch('database.sqlite_db.DatabaseBase.get_session')
     def test_get_stock_by_ticker(self, mock_get_session):
@@ -105,6 +105,136 @@ class TestSQLiteDatabase:
         assert result == mock_stock
         mock_session.close.assert_called_once()
 
+    @patch('database.sqlite_db.DatabaseBase.get_session')
+    def test_get_stock_by_ticker_uses_id_cache(self, mock_get_session):
+        """Test repeated ticker lookups go through the cached primary key"""
+        mock_session = MagicMock()
+        mock_stock = MagicMock(id=7, ticker='TEST')
+        mock_get_session.return_value = mock_session
+        mock_session.query.return_value.filter.return_value.first.return_value = mock_stock
+        mock_session.get.return_value = mock_stock
+
+        first = self.db.get_stock_by_ticker('TEST')
+        second = self.db.get_stock_by_ticker('TEST')
+
+        assert first is second is mock_stock
+        mock_session.query.assert_called_once_with(Stock)
+        mock_session.get.assert_called_once_with(Stock, 7)
+
+    @patch('database.sqlite_db.DatabaseBase.get_session')
+    def test_get_stock_by_ticker_stale_cache(self, mock_get_session):
+        """Test a cached id whose row is gone falls back to the query"""
+        mock_session = MagicMock()
+        mock_stock = MagicMock(id=8)
+        mock_get_session.return_value = mock_session
+        mock_session.get.return_value = None
+        mock_session.query.return_value.filter.return_value.first.return_value = mock_stock
+        self.db._remember_id(Stock.ticker, 'TEST', 7)
+
+        result = self.db.get_stock_by_ticker('TEST')
+
+        assert result is mock_stock
+        mock_session.query.assert_called_once_with(Stock)
+        assert self.db._id_cache[('stocks', 'ticker', 'TEST')] == 8
+
+    def test_get_stock_by_ticker_reused_id(self, tmp_path):
+        """Test a cached id that SQLite reused for another row after a delete is not returned for the old ticker"""
+        from sqlalchemy import delete
+
+        db, stock_id = self._file_db(tmp_path)
+        try:
+            assert db.get_stock_by_ticker('TX').id == stock_id
+            with db.engine.begin() as conn:
+                conn.execute(delete(Stock.__table__))
+            other = db.add_stock({'ticker': 'OTHER', 'name': 'Other', 'web_id': 'OTHER_WEB', 'market': 'Bourse'})
+            assert other.id == stock_id
+
+            assert db.get_stock_by_ticker('TX') is None
+            assert ('stocks', 'ticker', 'TX') not in db._id_cache
+        finally:
+            db.close()
+
+    def test_get_stock_id_by_ticker_after_delete(self, tmp_path):
+        """Test a deleted ticker no longer resolves to its id once SQLite reuses it"""
+        from sqlalchemy import delete
+
+        db, stock_id = self._file_db(tmp_path)
+        try:
+            assert db.get_stock_id_by_ticker('TX') == stock_id
+            with db.engine.begin() as conn:
+                conn.execute(delete(Stock.__table__))
+            db.add_stock({'ticker': 'OTHER', 'name': 'Other', 'web_id': 'OTHER_WEB', 'market': 'Bourse'})
+
+            assert db.get_stock_id_by_ticker('TX') is None
+            assert db.get_stock_id_by_ticker('OTHER') == stock_id
+        finally:
+            db.close()
+
+    def test_invalidate_and_clear_lookup_cache(self):
+        """Test invalidate drops one cached id and clear_lookup_cache drops them all"""
+        self.db._remember_id(Stock.ticker, 'AAA', 1)
+        self.db._remember_id(Stock.ticker, 'BBB', 2)
+
+        self.db.invalidate(Stock, Stock.ticker, 'AAA')
+        assert self.db._id_cache == {('stocks', 'ticker', 'BBB'): 2}
+
+        self.db.clear_lookup_cache()
+        assert self.db._id_cache == {}
+
+    @patch('database.sqlite_db.DatabaseBase.get_session')
+    def test_add_stock_populates_id_cache(self, mock_get_session):
+        """Test a newly added stock is cached by ticker and web_id"""
+        mock_session = MagicMock()
+        mock_get_session.return_value = mock_session
+        new_stock = MagicMock(spec=Stock, id=3, ticker='TEST', web_id='12345')
+        mock_session.execute.return_value.scalar_one_or_none.return_value = new_stock
+
+        self.db.add_stock({'ticker': 'TEST', 'name': 'Test Stock', 'web_id': '12345'})
+
+        assert self.db._id_cache[('stocks', 'ticker', 'TEST')] == 3
+        assert self.db._id_cache[('stocks', 'web_id', '12345')] == 3
+
+    @patch('database.sqlite_db.DatabaseBase.get_session')
+    def test_get_stock_id_by_ticker(self, mock_get_session):
+        """Test id lookup selects only the id column on every call"""
+        mock_session = MagicMock()
+        mock_get_session.return_value = mock_session
+        mock_session.execute.return_value.scalar.return_value = 5
+
+        assert self.db.get_stock_id_by_ticker('TEST') == 5
+        assert self.db.get_stock_id_by_ticker('TEST') == 5
+
+        assert mock_session.execute.call_count == 2
+        stmt = mock_session.execute.call_args.args[0]
+        assert [c.name for c in stmt.selected_columns] == ['id']
+        mock_session.query.assert_not_called()
+        assert self.db._id_cache == {}
+
+    @patch('database.sqlite_db.DatabaseBase.get_session')
+    def test_get_stock_id_by_ticker_missing(self, mock_get_session):
+        """Test id lookup returns None and does not cache misses"""
+        mock_session = MagicMock()
+        mock_get_session.return_value = mock_session
+        mock_session.execute.return_value.scalar.return_value = None
+
+        assert self.db.get_stock_id_by_ticker('NOPE') is None
+        assert self.db._id_cache == {}
+
+    @patch('database.sqlite_db.DatabaseBase.get_session')
+    def test_get_stock_row_by_ticker(self, mock_get_session):
+        """Test row lookup returns a lightweight Row instead of an ORM object"""
+        mock_session = MagicMock()
+        mock_row = MagicMock()
+        mock_get_session.return_value = mock_session
+        mock_session.execute.return_value.one_or_none.return_value = mock_row
+
+        result = self.db.get_stock_row_by_ticker('TEST')
+
+        assert result is mock_row
+        stmt = mock_session.execute.call_args.args[0]
+        assert [c.name for c in stmt.selected_columns] == ['id', 'ticker', 'name', 'web_id', 'market', 'sector_id']
+        mock_session.close.assert_called_once()
+
     @patch('database.sqlite_db.DatabaseBase.get_session')
     def test_get_sector_by_code(self, mock_get_session):
         """Test getting sector by code"""
@@ -118,7 +248,7 @@ class TestSQLiteDatabase:
         assert result == mock_sector
         mock_session.close.assert_called_once()
 
-    @patch('database.sqlite_db.DatabaseBase.batch_insert')
+    @patch('database.sqlite_db.SQLiteDatabase.batch_insert')
     def test_add_price_history(self, mock_batch_insert):
         """Test adding price history"""
         mock_batch_insert.return_value = 5
@@ -129,7 +259,7 @@ class TestSQLiteDatabase:
         assert result == 5
         mock_batch_insert.assert_called_once_with(PriceHistory, history_data)
 
-    @patch('database.sqlite_db.DatabaseBase.batch_insert')
+    @patch('database.sqlite_db.SQLiteDatabase.batch_insert')
     def test_add_ri_history(self, mock_batch_insert):
         """Test adding RI history"""
         mock_batch_insert.return_value = 3
@@ -142,12 +272,12 @@ class TestSQLiteDatabase:
 
     @patch('database.sqlite_db.DatabaseBase.get_session')
     def test_add_index_success(self, mock_get_session):
-        """Test adding new index successfully"""
+        """Test adding new index successfully with a single UPSERT"""
         mock_session = MagicMock()
         mock_get_session.return_value = mock_session
 
-        # Mock no existing index
-        mock_session.query.return_value.filter.return_value.first.return_value = None
+        new_index = MagicMock()
+        mock_session.execute.return_value.scalar_one_or_none.return_value = new_index
 
         index_data = {
             'name': 'Test Index',
@@ -156,11 +286,11 @@ class TestSQLiteDatabase:
 
         result = self.db.add_index(index_data)
 
-        assert result is not None
-        mock_session.add.assert_called_once()
+        assert result is new_index
+        mock_session.query.assert_not_called()
+        mock_session.execute.assert_called_once()
+        mock_session.expunge.assert_called_once_with(new_index)
         mock_session.commit.assert_called_once()
-        mock_session.refresh.assert_called_once()
-        mock_session.expunge.assert_called_once()
         mock_session.close.assert_called_once()
 
     @patch('database.sqlite_db.DatabaseBase.get_session')
@@ -169,20 +299,18 @@ class TestSQLiteDatabase:
         mock_session = MagicMock()
         mock_get_session.return_value = mock_session
 
-        # Mock existing index
-        existing_index = MagicMock()
-        mock_session.query.return_value.filter.return_value.first.return_value = existing_index
+        # ON CONFLICT DO NOTHING returns no row for an existing index
+        mock_session.execute.return_value.scalar_one_or_none.return_value = None
 
         index_data = {'name': 'Test Index'}
 
         result = self.db.add_index(index_data)
 
         assert result is None
-        mock_session.add.assert_not_called()
         mock_session.commit.assert_not_called()
         mock_session.close.assert_called_once()
 
-    @patch('database.sqlite_db.DatabaseBase.batch_insert')
+    @patch('database.sqlite_db.SQLiteDatabase.batch_insert')
     def test_add_index_history(self, mock_batch_insert):
         """Test adding index history"""
         mock_batch_insert.return_value = 10
@@ -193,7 +321,7 @@ class TestSQLiteDatabase:
         assert result == 10
         mock_batch_insert.assert_called_once_with(IndexHistory, history_data)
 
-    @patch('database.sqlite_db.DatabaseBase.batch_insert')
+    @patch('database.sqlite_db.SQLiteDatabase.batch_insert')
     def test_add_sector_index_history(self, mock_batch_insert):
         """Test adding sector index history"""
         mock_batch_insert.return_value = 7
@@ -206,12 +334,12 @@ class TestSQLiteDatabase:
 
     @patch('database.sqlite_db.DatabaseBase.get_session')
     def test_add_shareholder_success(self, mock_get_session):
-        """Test adding new shareholder successfully"""
+        """Test adding new shareholder successfully with a single UPSERT"""
         mock_session = MagicMock()
         mock_get_session.return_value = mock_session
 
-        # Mock no existing shareholder
-        mock_session.query.return_value.filter.return_value.first.return_value = None
+        new_shareholder = MagicMock()
+        mock_session.execute.return_value.scalar_one.return_value = new_shareholder
 
         shareholder_data = {
             'shareholder_id': '123',
@@ -220,11 +348,12 @@ class TestSQLiteDatabase:
 
         result = self.db.add_shareholder(shareholder_data)
 
-        assert result is not None
-        mock_session.add.assert_called_once()
+        assert result is new_shareholder
+        mock_session.query.assert_not_called()
+        mock_session.execute.assert_called_once()
+        assert 'ON CONFLICT' in str(mock_session.execute.call_args.args[0])
+        mock_session.expunge.assert_called_once_with(new_shareholder)
         mock_session.commit.assert_called_once()
-        mock_session.refresh.assert_called_once()
-        mock_session.expunge.assert_called_once()
         mock_session.close.assert_called_once()
 
     @patch('database.sqlite_db.DatabaseBase.get_session')
@@ -233,9 +362,9 @@ class TestSQLiteDatabase:
         mock_session = MagicMock()
         mock_get_session.return_value = mock_session
 
-        # Mock existing shareholder
+        # ON CONFLICT DO UPDATE ... RETURNING yields the existing row
         existing_shareholder = MagicMock()
-        mock_session.query.return_value.filter.return_value.first.return_value = existing_shareholder
+        mock_session.execute.return_value.scalar_one.return_value = existing_shareholder
 
         shareholder_data = {'shareholder_id': '123'}
 
@@ -243,7 +372,7 @@ class TestSQLiteDatabase:
 
         assert result == existing_shareholder
         mock_session.add.assert_not_called()
-        mock_session.commit.assert_not_called()
+        mock_session.query.assert_not_called()
         mock_session.close.assert_called_once()
 
     @patch('database.sqlite_db.DatabaseBase.get_session')
@@ -259,7 +388,7 @@ class TestSQLiteDatabase:
         assert result == mock_shareholder
         mock_session.close.assert_called_once()
 
-    @patch('database.sqlite_db.DatabaseBase.batch_insert')
+    @patch('database.sqlite_db.SQLiteDatabase.batch_insert')
     def test_add_major_shareholder_history(self, mock_batch_insert):
         """Test adding major shareholder history"""
         mock_batch_insert.return_value = 4
@@ -270,7 +399,7 @@ class TestSQLiteDatabase:
         assert result == 4
         mock_batch_insert.assert_called_once_with(MajorShareholderHistory, history_data)
 
-    @patch('database.sqlite_db.DatabaseBase.batch_insert')
+    @patch('database.sqlite_db.SQLiteDatabase.batch_insert')
     def test_add_intraday_trades(self, mock_batch_insert):
         """Test adding intraday trades"""
         mock_batch_insert.return_value = 20
@@ -281,7 +410,7 @@ class TestSQLiteDatabase:
         assert result == 20
         mock_batch_insert.assert_called_once_with(IntradayTrade, trades_data)
 
-    @patch('database.sqlite_db.DatabaseBase.batch_insert')
+    @patch('database.sqlite_db.SQLiteDatabase.batch_insert')
     def test_add_usd_history(self, mock_batch_insert):
         """Test adding USD history"""
         mock_batch_insert.return_value = 30
@@ -298,22 +427,30 @@ class TestSQLiteDatabase:
         mock_session = MagicMock()
         mock_get_session.return_value = mock_session
 
-        # Mock query result
-        mock_result = ('1402-01-01',)
-        mock_session.query.return_value.filter.return_value.order_by.return_value.first.return_value = mock_result
+        # Mock MAX(j_date) scalar result
+        mock_session.execute.return_value.scalar.return_value = '1402-01-01'
 
         result = self.db.get_last_price_date(1)
 
         assert result == '1402-01-01'
+        stmt, params = mock_session.execute.call_args.args
+        assert 'max(price_history.j_date)' in str(stmt)
+        assert params == {'key': 1}
+        mock_session.query.assert_not_called()
+
         mock_session.close.assert_called_once()
 
+        # The same prebuilt statement is reused on every call
+        self.db.get_last_price_date(2)
+        assert mock_session.execute.call_args.args[0] is stmt
+
     @patch('database.sqlite_db.DatabaseBase.get_session')
     def test_get_last_price_date_none(self, mock_get_session):
         """Test getting last price date when none exists"""
         mock_session = MagicMock()
         mock_get_session.return_value = mock_session
 
-        mock_session.query.return_value.filter.return_value.order_by.return_value.first.return_value = None
+        mock_session.execute.return_value.scalar.return_value = None
 
         result = self.db.get_last_price_date(1)
 
@@ -326,8 +463,7 @@ class TestSQLiteDatabase:
         mock_session = MagicMock()
         mock_get_session.return_value = mock_session
 
-        mock_result = ('1402-01-01',)
-        mock_session.query.return_value.filter.return_value.order_by.return_value.first.return_value = mock_result
+        mock_session.execute.return_value.scalar.return_value = '1402-01-01'
 
         result = self.db.get_last_ri_date(1)
 
@@ -340,8 +476,7 @@ class TestSQLiteDatabase:
         mock_session = MagicMock()
         mock_get_session.return_value = mock_session
 
-        mock_result = ('1402-01-01',)
-        mock_session.query.return_value.filter.return_value.order_by.return_value.first.return_value = mock_result
+        mock_session.execute.return_value.scalar.return_value = '1402-01-01'
 
         result = self.db.get_last_index_date(1)
 
@@ -354,8 +489,7 @@ class TestSQLiteDatabase:
         mock_session = MagicMock()
         mock_get_session.return_value = mock_session
 
-        mock_result = ('1402-01-01',)
-        mock_session.query.return_value.filter.return_value.order_by.return_value.first.return_value = mock_result
+        mock_session.execute.return_value.scalar.return_value = '1402-01-01'
 
         result = self.db.get_last_sector_index_date(1)
 
@@ -368,8 +502,7 @@ class TestSQLiteDatabase:
         mock_session = MagicMock()
         mock_get_session.return_value = mock_session
 
-        mock_result = ('1402-01-01',)
-        mock_session.query.return_value.filter.return_value.order_by.return_value.first.return_value = mock_result
+        mock_session.execute.return_value.scalar.return_value = '1402-01-01'
 
         result = self.db.get_last_shareholder_date(1)
 
@@ -382,8 +515,7 @@ class TestSQLiteDatabase:
         mock_session = MagicMock()
         mock_get_session.return_value = mock_session
 
-        mock_result = ('1402-01-01',)
-        mock_session.query.return_value.order_by.return_value.first.return_value = mock_result
+        mock_session.execute.return_value.scalar.return_value = '1402-01-01'
 
         result = self.db.get_last_usd_date()
 
@@ -396,7 +528,7 @@ class TestSQLiteDatabase:
         mock_session = MagicMock()
         mock_get_session.return_value = mock_session
 
-        mock_session.query.return_value.order_by.return_value.first.return_value = None
+        mock_session.execute.return_value.scalar.return_value = None
 
         result = self.db.get_last_usd_date()
 
@@ -421,8 +553,8 @@ class TestSQLiteDatabase:
 
         assert result is not None
         mock_session.add.assert_called_once()
+        mock_session.flush.assert_called_once()
         mock_session.commit.assert_called_once()
-        mock_session.refresh.assert_called_once()
         mock_session.expunge.assert_called_once()
         mock_session.close.assert_called_once()
 
@@ -472,4 +604,272 @@ class TestSQLiteDatabase:
         result = self.db.get_all_sectors()
 
         assert result == mock_sectors
-        mock_session.close.assert_called_once()
\ No newline at end of file
+        mock_session.close.assert_called_once()
+    @patch('database.sqlite_db.DatabaseBase.get_session')
+    def test_batch_insert_empty(self, mock_get_session):
+        """Test batch insert with no rows skips the database"""
+        result = self.db.batch_insert(PriceHistory, [])
+
+        assert result == 0
+        mock_get_session.assert_not_called()
+
+    @patch('database.sqlite_db.DatabaseBase.get_session')
+    def test_batch_insert_core_executemany(self, mock_get_session):
+        """Test batch insert uses Core executemany in chunks with one commit"""
+        mock_session = MagicMock()
+        mock_get_session.return_value = mock_session
+        mock_session.connection.return_value.execute.side_effect = [
+            MagicMock(rowcount=CORE_INSERT_CHUNK_SIZE), MagicMock(rowcount=1)
+        ]
+
+        rows = [{'stock_id': 1, 'j_date': f'1402-01-{i:03d}'} for i in range(CORE_INSERT_CHUNK_SIZE + 1)]
+        result = self.db.batch_insert(PriceHistory, rows)
+
+        assert result == CORE_INSERT_CHUNK_SIZE + 1
+        assert mock_session.connection.return_value.execute.call_count == 2
+        first_stmt, first_chunk = mock_session.connection.return_value.execute.call_args_list[0].args
+        assert first_stmt.table is PriceHistory.__table__
+        assert len(first_chunk) == CORE_INSERT_CHUNK_SIZE
+        first_call = mock_session.connection.return_value.execute.call_args_list[0]
+        assert first_call.kwargs == {'execution_options': {'compiled_cache': self.db._compiled_cache}}
+        mock_session.add.assert_not_called()
+        mock_session.execute.assert_not_called()
+        mock_session.commit.assert_called_once()
+        mock_session.close.assert_called_once()
+
+    @patch('database.sqlite_db.DatabaseBase.get_session')
+    def test_batch_insert_small_batch_single_statement(self, mock_get_session):
+        """Test small batches are sent as one multi-row VALUES insert"""
+        mock_session = MagicMock()
+        mock_get_session.return_value = mock_session
+        mock_session.connection.return_value.execute.return_value.rowcount = MULTI_VALUES_MAX_ROWS
+
+        rows = [{'stock_id': 1, 'j_date': f'1402-01-{i:02d}'} for i in range(MULTI_VALUES_MAX_ROWS)]
+        result = self.db.batch_insert(PriceHistory, rows)
+
+        assert result == MULTI_VALUES_MAX_ROWS
+        mock_session.connection.return_value.execute.assert_called_once()
+        (stmt,) = mock_session.connection.return_value.execute.call_args.args
+        assert stmt.table is PriceHistory.__table__
+        mock_session.commit.assert_called_once()
+
+    @patch('database.sqlite_db.DatabaseBase.get_session')
+    def test_batch_insert_small_mixed_keys_uses_executemany(self, mock_get_session):
+        """Test small batches whose rows differ in keys skip multi-row VALUES, which compiles columns from the first row"""
+        mock_session = MagicMock()
+        mock_get_session.return_value = mock_session
+        mock_session.connection.return_value.execute.return_value.rowcount = 2
+
+        rows = [{'stock_id': 1, 'j_date': '1402-01-01'}, {'stock_id': 1, 'j_date': '1402-01-02', 'volume': 10}]
+        result = self.db.batch_insert(PriceHistory, rows)
+
+        assert result == 2
+        stmt, params = mock_session.connection.return_value.execute.call_args.args
+        assert params == rows
+        mock_session.commit.assert_called_once()
+
+    @patch('database.sqlite_db.DatabaseBase.get_session')
+    def test_batch_insert_ignores_duplicates(self, mock_get_session):
+        """Test re-ingested rows are skipped by INSERT OR IGNORE and not counted"""
+        mock_session = MagicMock()
+        mock_get_session.return_value = mock_session
+        mock_session.connection.return_value.execute.return_value.rowcount = 1
+
+        rows = [{'stock_id': 1, 'j_date': '1402-01-01'}, {'stock_id': 1, 'j_date': '1402-01-02'}]
+        result = self.db.batch_insert(PriceHistory, rows)
+
+        assert result == 1
+        (stmt,) = mock_session.connection.return_value.execute.call_args.args
+        assert 'INSERT OR IGNORE INTO price_history' in str(stmt)
+        mock_session.rollback.assert_not_called()
+
+    @patch('database.sqlite_db.DatabaseBase.get_session')
+    def test_batch_insert_custom_batch_size(self, mock_get_session):
+        """Test the batch_size knob controls the executemany chunk size"""
+        with patch('database.sqlite_db.DatabaseBase.__init__', return_value=None):
+            db = SQLiteDatabase(batch_size=20)
+        mock_session = MagicMock()
+        mock_get_session.return_value = mock_session
+        mock_session.connection.return_value.execute.return_value.rowcount = 20
+
+        rows = [{'stock_id': 1, 'j_date': f'1402-01-{i:02d}'} for i in range(60)]
+        result = db.batch_insert(PriceHistory, rows)
+
+        assert result == 60
+        assert mock_session.connection.return_value.execute.call_count == 3
+
+    def test_chunked(self):
+        """Test _chunked splits into fixed-size lists with a short tail"""
+        assert list(_chunked(range(5), 2)) == [[0, 1], [2, 3], [4]]
+        assert list(_chunked([], 2)) == []
+
+    @patch('database.sqlite_db.DatabaseBase.get_session')
+    def test_batch_insert_integrity_error(self, mock_get_session):
+        """Test batch insert rolls back the whole call on integrity error"""
+        from sqlalchemy.exc import IntegrityError
+
+        mock_session = MagicMock()
+        mock_get_session.return_value = mock_session
+        mock_session.connection.return_value.execute.side_effect = IntegrityError(None, None, None)
+
+        result = self.db.batch_insert(PriceHistory, [{'stock_id': 1, 'j_date': '1402-01-01'}])
+
+        assert result == 0
+        mock_session.rollback.assert_called_once()
+        mock_session.commit.assert_not_called()
+        mock_session.close.assert_called_once()
+
+    @patch('database.sqlite_db.DatabaseBase.get_session')
+    def test_batch_insert_columnar_numpy(self, mock_get_session):
+        """Test dict-of-columns input is zipped into positional tuples without per-row dicts"""
+        import numpy as np
+        from sqlalchemy.dialects import sqlite
+
+        mock_session = MagicMock()
+        mock_get_session.return_value = mock_session
+        conn = mock_session.connection.return_value
+        conn.dialect = sqlite.dialect()
+        conn.exec_driver_sql.return_value.rowcount = 3
+
+        columns = {
+            'stock_id': np.array([1, 1, 1]),
+            'j_date': ['1402-01-01', '1402-01-02', '1402-01-03'],
+            'close_price': np.array([100, 101, 102], dtype=np.int64),
+        }
+        result = self.db.add_price_history(columns)
+
+        assert result == 3
+        sql, params = conn.exec_driver_sql.call_args.args
+        assert sql.startswith('INSERT OR IGNORE INTO price_history')
+        assert params == [(1, '1402-01-01', 100), (1, '1402-01-02', 101), (1, '1402-01-03', 102)]
+        assert all(type(value) in (int, str) for row in params for value in row)
+        conn.execute.assert_not_called()
+        mock_session.commit.assert_called_once()
+        mock_session.close.assert_called_once()
+
+    def test_column_values_datetime64_to_iso_strings(self):
+        """Test datetime64 columns are serialized to YYYY-MM-DD once per batch"""
+        import numpy as np
+        import pandas as pd
+
+        expected = ['2023-03-21', '2023-03-22']
+        days = np.array(['2023-03-21', '2023-03-22'], dtype='datetime64[D]')
+        stamps = pd.Series(pd.to_datetime(['2023-03-21 00:00', '2023-03-22 15:30']))
+
+        assert _column_values(days) == expected
+        assert _column_values(stamps) == expected
+        assert _column_values(np.array([1, 2])) == [1, 2]
+        assert _column_values(('a', 'b')) == ['a', 'b']
+
+    @patch('database.sqlite_db.DatabaseBase.get_session')
+    def test_batch_insert_columnar_empty(self, mock_get_session):
+        """Test empty columns short-circuit without opening a session"""
+        import numpy as np
+
+        assert self.db.batch_insert(PriceHistory, {'stock_id': np.array([]), 'j_date': []}) == 0
+        mock_get_session.assert_not_called()
+
+    def test_batch_insert_columnar_roundtrip(self, sqlite_memory_db):
+        """Test columnar rows land in SQLite with dates stored like ORM inserts"""
+        from datetime import date
+        from sqlalchemy import delete
+
+        db = sqlite_memory_db
+        stock = db.add_stock({'ticker': 'SOA_TEST', 'name': 'SoA', 'web_id': 'SOA_WEB', 'market': 'Bourse'})
+        try:
+            inserted = db.add_price_history({
+                'stock_id': [stock.id, stock.id],
+                'j_date': ['1402-01-01', '1402-01-02'],
+                'date': [date(2023, 3, 21), date(2023, 3, 22)],
+            })
+            assert inserted == 2
+            assert db.get_last_price_date(stock.id) == '1402-01-02'
+            with db.engine.connect() as conn:
+                stored = conn.exec_driver_sql(
+                    "SELECT date FROM price_history WHERE stock_id = ? ORDER BY j_date", (stock.id,)
+                ).scalars().all()
+            assert stored == ['2023-03-21', '2023-03-22']
+        finally:
+            with db.engine.begin() as conn:
+                conn.execute(delete(PriceHistory.__table__).where(PriceHistory.stock_id == stock.id))
+                conn.execute(delete(Stock.__table__).where(Stock.id == stock.id))
+            db._id_cache.clear()
+
+    def test_bulk_load_mode_sets_and_restores_pragmas(self, tmp_path):
+        """Test bulk_load_mode relaxes durability on a held connection and restores it on exit"""
+        with patch('database.base.DATABASE_URL', f"sqlite:///{tmp_path / 'bulk.db'}"):
+            db = SQLiteDatabase()
+        try:
+            stock = db.add_stock({'ticker': 'BULK', 'name': 'Bulk', 'web_id': 'BULK_WEB', 'market': 'Bourse'})
+            with db.bulk_load_mode():
+                conn = db._bulk_conn
+                assert conn.exec_driver_sql("PRAGMA synchronous").scalar() == 0
+                assert conn.exec_driver_sql("PRAGMA journal_mode").scalar() == 'memory'
+                conn.commit()
+                inserted = db.add_price_history([
+                    {'stock_id': stock.id, 'j_date': '1402-01-01', 'date': date(2023, 3, 21)},
+                    {'stock_id': stock.id, 'j_date': '1402-01-02', 'date': date(2023, 3, 22)},
+                ])
+                assert inserted == 2
+
+            assert db._bulk_conn is None
+            with db.engine.connect() as conn:
+                assert conn.exec_driver_sql("PRAGMA synchronous").scalar() == 1
+                assert conn.exec_driver_sql("PRAGMA journal_mode").scalar() == 'wal'
+            assert db.get_last_price_date(stock.id) == '1402-01-02'
+        finally:
+            db.close()
+
+    def _file_db(self, tmp_path):
+        """Build a file-backed SQLiteDatabase with one stock"""
+        with patch('database.base.DATABASE_URL', f"sqlite:///{tmp_path / 'tx.db'}"):
+            db = SQLiteDatabase()
+        stock = db.add_stock({'ticker': 'TX', 'name': 'Tx', 'web_id': 'TX_WEB', 'market': 'Bourse'})
+        return db, stock.id
+
+    @staticmethod
+    def _price_rows(stock_id, *days):
+        return [{'stock_id': stock_id, 'j_date': f'1402-01-{d:02d}', 'date': date(2023, 3, 20 + d)} for d in days]
+
+    @staticmethod
+    def _count_prices(db):
+        with db.engine.connect() as conn:
+            return conn.exec_driver_sql("SELECT COUNT(*) FROM price_history").scalar()
+
+    def test_transaction_defers_commit(self, tmp_path):
+        """Test history inserts inside transaction() are committed once at the end"""
+        db, stock_id = self._file_db(tmp_path)
+        try:
+            with db.transaction():
+                assert db.add_price_history(self._price_rows(stock_id, 1)) == 1
+                assert db.add_ri_history(self._price_rows(stock_id, 1)) == 1
+                assert db.add_price_history(self._price_rows(stock_id, 2)) == 1
+                assert self._count_prices(db) == 0
+            assert db._tx_session is None
+            assert self._count_prices(db) == 2
+        finally:
+            db.close()
+
+    def test_transaction_rolls_back_on_error(self, tmp_path):
+        """Test an exception in the block discards every insert made inside it"""
+        db, stock_id = self._file_db(tmp_path)
+        try:
+            with pytest.raises(RuntimeError):
+                with db.transaction():
+                    db.add_price_history(self._price_rows(stock_id, 1, 2))
+                    raise RuntimeError("loader failed")
+            assert self._count_prices(db) == 0
+        finally:
+            db.close()
+
+    def test_transaction_failed_insert_keeps_others(self, tmp_path):
+        """Test a failing insert only rolls back its own savepoint"""
+        db, stock_id = self._file_db(tmp_path)
+        try:
+            with db.transaction():
+                assert db.add_price_history(self._price_rows(stock_id, 1)) == 1
+                assert db.add_price_history([{'stock_id': stock_id, 'j_date': '1402-01-02'}]) == 0
+                assert db.add_price_history(self._price_rows(stock_id, 3)) == 1
+            assert self._count_prices(db) == 2
+        finally:
+            db.close()
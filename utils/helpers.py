@@ -1,8 +1,23 @@
 import re
 import json
-from typing import Dict, List, Any, Optional, Tuple
+from typing import Dict, Iterable, Iterator, List, Any, Optional, Tuple, Union
 from datetime import datetime, timedelta
 import logging
+from collections import defaultdict
+from itertools import islice
+from pathlib import Path
+
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:  # numba اختیاری است؛ بدون آن نسخه برداری NumPy اجرا می‌شود
+    njit = None
+
+try:
+    import orjson
+except ImportError:  # orjson اختیاری است؛ بدون آن از json استاندارد استفاده می‌شود
+    orjson = None
 
 logger = logging.getLogger(__name__)
 
@@ -62,6 +77,33 @@ def format_jalali_date(date: datetime) -> str:
 
     return f"{jy:04d}/{gm:02d}/{gd:02d}"
 
+def _jalali_day_numbers(jy, jm, jd):
+    """شماره روز از 0000-01-01 میلادی برای آرایه‌های سال/ماه/روز شمسی (الگوریتم دقیق چرخه ۳۳ ساله)"""
+    jy = jy + 1595
+    days = -355668 + 365 * jy + (jy // 33) * 8 + ((jy % 33) + 3) // 4 + jd
+    return days + np.where(jm < 7, (jm - 1) * 31, (jm - 7) * 30 + 186)
+
+
+if njit is not None:
+    # کامپایل یک‌باره با cache=True؛ فراخوانی‌های بعدی از کد ماشین کش‌شده استفاده می‌کنند
+    _jalali_day_numbers = njit(cache=True)(_jalali_day_numbers)
+
+
+def jalali_to_datetime64(jy, jm, jd) -> np.ndarray:
+    """تبدیل برداری تاریخ‌های شمسی (آرایه‌های سال، ماه، روز) به آرایه datetime64[D] میلادی در یک فراخوانی برای کل دسته"""
+    jy, jm, jd = (np.asarray(a, dtype=np.int64) for a in (jy, jm, jd))
+    return np.datetime64('0000-01-01', 'D') + _jalali_day_numbers(jy, jm, jd)
+
+
+def jalali_to_gregorian_arr(jy, jm, jd) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """تبدیل برداری شمسی به میلادی؛ آرایه‌های (سال، ماه، روز) میلادی برمی‌گرداند"""
+    dates = jalali_to_datetime64(jy, jm, jd)
+    months = dates.astype('datetime64[M]')
+    gy = dates.astype('datetime64[Y]').astype(np.int64) + 1970
+    gm = months.astype(np.int64) % 12 + 1
+    gd = (dates - months).astype(np.int64) + 1
+    return gy, gm, gd
+
 def validate_web_id(web_id: str) -> bool:
     """اعتبارسنجی web_id"""
     if not web_id:
@@ -113,8 +155,15 @@ def safe_int_convert(value: Any) -> Optional[int]:
     except (ValueError, TypeError):
         return None
 
-def calculate_percentage_change(old_value: float, new_value: float) -> Optional[float]:
-    """محاسبه درصد تغییر"""
+def calculate_percentage_change(old_value: Union[float, np.ndarray],
+                                new_value: Union[float, np.ndarray]) -> Optional[Union[float, np.ndarray]]:
+    """محاسبه درصد تغییر؛ برای آرایه‌ها به صورت برداری و با NaN به جای تقسیم بر صفر"""
+    if isinstance(old_value, np.ndarray) or isinstance(new_value, np.ndarray):
+        old = np.asarray(old_value, dtype=float)
+        new = np.asarray(new_value, dtype=float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(old != 0, (new - old) / old * 100, np.nan)
+
     if old_value == 0:
         return None
     
@@ -125,16 +174,15 @@ def calculate_percentage_change(old_value: float, new_value: float) -> Optional[
 
 def group_data_by_date(data: List[Dict[str, Any]], date_field: str = 'date') -> Dict[str, List[Dict[str, Any]]]:
     """گروه‌بندی داده‌ها بر اساس تاریخ"""
-    grouped = {}
-    
+    grouped = defaultdict(list)
+
     for item in data:
         date = item.get(date_field)
         if date:
-            if date not in grouped:
-                grouped[date] = []
             grouped[date].append(item)
-    
-    return grouped
+
+    # dict ساده برمی‌گردد تا دسترسی به تاریخ ناموجود مثل قبل KeyError بدهد
+    return dict(grouped)
 
 def filter_data_by_date_range(data: List[Dict[str, Any]], 
                              from_date: str, 
@@ -158,46 +206,36 @@ def filter_data_by_date_range(data: List[Dict[str, Any]],
     
     return filtered
 
-def calculate_moving_average(data: List[float], window: int = 5) -> List[Optional[float]]:
-    """محاسبه میانگین متحرک"""
-    if len(data) < window:
-        return [None] * len(data)
-    
-    result = []
-    for i in range(len(data)):
-        if i < window - 1:
-            result.append(None)
-        else:
-            window_data = data[i-window+1:i+1]
-            avg = sum(window_data) / len(window_data)
-            result.append(avg)
-    
+def calculate_moving_average(data: List[float], window: int = 5) -> np.ndarray:
+    """محاسبه میانگین متحرک؛ آرایه float که window-1 مقدار اول آن NaN است"""
+    values = np.asarray(data, dtype=float)
+    result = np.full(values.shape, np.nan)
+    if len(values) >= window:
+        # میانگین همه پنجره‌ها در یک فراخوانی برداری
+        result[window - 1:] = np.lib.stride_tricks.sliding_window_view(values, window).mean(axis=1)
     return result
 
-def detect_outliers(data: List[float], threshold: float = 2.0) -> List[bool]:
-    """تشخیص داده‌های پرت با استفاده از Z-score"""
-    if len(data) < 2:
-        return [False] * len(data)
-    
-    mean = sum(data) / len(data)
-    variance = sum((x - mean) ** 2 for x in data) / len(data)
-    std_dev = variance ** 0.5
-    
+def detect_outliers(data: List[float], threshold: float = 2.0) -> np.ndarray:
+    """تشخیص داده‌های پرت با استفاده از Z-score؛ آرایه بولی هم‌طول داده"""
+    values = np.asarray(data, dtype=float)
+    if len(values) < 2:
+        return np.zeros(values.shape, dtype=bool)
+
+    std_dev = values.std()
     if std_dev == 0:
-        return [False] * len(data)
-    
-    outliers = []
-    for value in data:
-        z_score = abs(value - mean) / std_dev
-        outliers.append(z_score > threshold)
-    
-    return outliers
+        return np.zeros(values.shape, dtype=bool)
+
+    return np.abs(values - values.mean()) > threshold * std_dev
 
 def save_json_to_file(data: Any, file_path: str) -> bool:
     """ذخیره داده‌ها در فایل JSON"""
     try:
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        if orjson is not None:
+            # orjson مستقیماً بایت UTF-8 تولید می‌کند و لایه رمزگذاری متنی حذف می‌شود
+            Path(file_path).write_bytes(orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+        else:
+            with open(file_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
         return True
     except Exception as e:
         logger.error(f"Error saving JSON to {file_path}: {e}")
@@ -206,15 +244,24 @@ def save_json_to_file(data: Any, file_path: str) -> bool:
 def load_json_from_file(file_path: str) -> Optional[Any]:
     """بارگذاری داده‌ها از فایل JSON"""
     try:
+        if orjson is not None:
+            return orjson.loads(Path(file_path).read_bytes())
         with open(file_path, 'r', encoding='utf-8') as f:
             return json.load(f)
     except Exception as e:
         logger.error(f"Error loading JSON from {file_path}: {e}")
         return None
 
-def chunk_list(data: List[Any], chunk_size: int) -> List[List[Any]]:
-    """تقسیم لیست به چانک‌های کوچک‌تر"""
-    return [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+def _iter_chunks(iterator: Iterator[Any], chunk_size: int) -> Iterator[List[Any]]:
+    while batch := list(islice(iterator, chunk_size)):
+        yield batch
+
+def chunk_list(data: Iterable[Any], chunk_size: int) -> Iterator[List[Any]]:
+    """تقسیم داده به چانک‌های کوچک‌تر به صورت تنبل؛ در هر لحظه فقط یک چانک در حافظه است"""
+    # بررسی پیش از ساخت generator تا اندازه نامعتبر همان لحظه خطا بدهد، نه اینکه بی‌صدا هیچ چانکی تولید نشود
+    if chunk_size <= 0:
+        raise ValueError(f"chunk_size must be positive, got {chunk_size}")
+    return _iter_chunks(iter(data), chunk_size)
 
 def merge_dicts(*dicts: Dict[str, Any]) -> Dict[str, Any]:
     """ادغام دیکشنری‌ها"""